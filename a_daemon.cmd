@@ -0,0 +1,3 @@
+@echo off
+python ./daemon.py
+pause
@@ -1,4 +1,9 @@
+import argparse
+
 from batch_get_user_dynamics import *
 
 if __name__ == '__main__':
-    save_log(batch_dynamics, mode='download')
+    parser = argparse.ArgumentParser(description='爬取并下载 user_list.txt 中全部用户的动态')
+    parser.add_argument('--full', action='store_true', help='重新翻完全部历史动态，补全早期未保存的类型')
+    args = parser.parse_args()
+    save_log(batch_dynamics, mode='download', full=args.full)
@@ -0,0 +1,4 @@
+@echo off
+cd ./opus
+python ./run_server.py
+pause
\ No newline at end of file
@@ -0,0 +1,249 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+
+from info_store import INFO_DB_NAME, INFO_JSON_NAME, open_info_store, post_pub_ts
+
+# 把所有用户的动态元数据汇总到一个紧凑的 SQLite 文件 ./opus/__archive.db，便于跨用户分析：
+#   python ./archive_export.py update              # 增量追加各用户的新动态（每次批量运行后自动执行）
+#   python ./archive_export.py update --full       # 重新导出全部用户
+#   python ./archive_export.py parquet archive.parquet   # 另存为 Parquet（需要安装 pyarrow）
+#   python ./archive_export.py stats
+# posts 表每条动态一行：dynamic_id 与 pub_ts 为整数（pub_ts 为 Unix 时间戳），
+# pictures 为 JSON 数组，可用 json_each 展开，例如统计每个用户的图片数：
+#   SELECT folder, SUM(picture_count) FROM posts GROUP BY folder
+#   SELECT folder, strftime('%Y-%m', pub_ts, 'unixepoch') AS month, COUNT(*) FROM posts GROUP BY 1, 2
+
+ARCHIVE_DB_NAME = '__archive.db'
+
+# 每批写入与 Parquet 每个行组的行数
+EXPORT_BATCH_SIZE = 5000
+
+def post_row(folder: str, post: dict) -> tuple:
+    item = post.get('item', {})
+    pictures = item.get('pictures') or []
+    orig = item.get('orig')
+    return (
+        folder,
+        int(post['dynamic_id']),
+        post_pub_ts(post),
+        post.get('type'),
+        item.get('title'),
+        item.get('description'),
+        len(pictures),
+        json.dumps(pictures, separators=(',', ':'), ensure_ascii=False),
+        int(orig['dynamic_id']) if orig else None,
+    )
+
+class ArchiveExport:
+    """
+    所有用户动态的汇总表，以 (folder, dynamic_id) 为主键。
+    users 表记录每个用户已导出的最大动态ID与导出时间，增量导出时只追加尚未导出的动态。
+    """
+    def __init__(self, db_path: str):
+        self.path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                folder TEXT PRIMARY KEY,
+                exported_id INTEGER NOT NULL DEFAULT 0,
+                updated INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS posts (
+                folder TEXT NOT NULL,
+                dynamic_id INTEGER NOT NULL,
+                pub_ts INTEGER,
+                type TEXT,
+                title TEXT,
+                description TEXT,
+                picture_count INTEGER NOT NULL,
+                pictures TEXT NOT NULL,
+                orig_id INTEGER,
+                PRIMARY KEY (folder, dynamic_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS posts_pub_ts ON posts (pub_ts);
+        """)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def export_folder(self, save_dir: str, folder: str, full: bool = False) -> int:
+        """
+        导出一个用户文件夹中尚未导出的动态，在一个事务中提交。
+        按动态ID集合比较而不是只看最大ID：中断后继续爬取时补上的更早的动态同样会被导出。
+
+        :param full: 删除该用户已导出的记录后全部重新导出，用于解析逻辑修改后（page_cache.py reparse）
+        :return: 写入的条数
+        """
+        save_path = os.path.join(save_dir, folder)
+        count = 0
+        with open_info_store(save_path) as store, self.conn:
+            if full:
+                self.conn.execute("DELETE FROM posts WHERE folder = ?", (folder,))
+            exported = {row[0] for row in self.conn.execute(
+                "SELECT dynamic_id FROM posts WHERE folder = ?", (folder,)
+            )}
+            # __info.db 中的动态只增不减，数量相同即已全部导出
+            if len(exported) == len(store) and not full:
+                return 0
+            batch = []
+            for post in store.iter_posts():
+                if int(post['dynamic_id']) in exported:
+                    continue
+                batch.append(post_row(folder, post))
+                if len(batch) >= EXPORT_BATCH_SIZE:
+                    count += self.write(batch)
+                    batch = []
+            count += self.write(batch)
+            self.conn.execute(
+                "INSERT INTO users (folder, exported_id, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT (folder) DO UPDATE SET exported_id = excluded.exported_id, updated = excluded.updated",
+                (folder, store.latest_id(), int(time.time()))
+            )
+        return count
+
+    def write(self, rows: list) -> int:
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO posts (folder, dynamic_id, pub_ts, type, title, description, "
+            "picture_count, pictures, orig_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+        )
+        return len(rows)
+
+    def remove_missing(self, folders: list) -> int:
+        """删除已不存在的用户文件夹的记录"""
+        existing = {row[0] for row in self.conn.execute("SELECT folder FROM users")}
+        missing = existing - set(folders)
+        with self.conn:
+            for folder in missing:
+                self.conn.execute("DELETE FROM posts WHERE folder = ?", (folder,))
+                self.conn.execute("DELETE FROM users WHERE folder = ?", (folder,))
+        return len(missing)
+
+    def iter_rows(self):
+        """按用户、动态ID遍历全部记录，pictures 解析为列表"""
+        cur = self.conn.execute(
+            "SELECT folder, dynamic_id, pub_ts, type, title, description, picture_count, pictures, orig_id "
+            "FROM posts ORDER BY folder, dynamic_id"
+        )
+        for row in cur:
+            yield row[:7] + (json.loads(row[7]),) + row[8:]
+
+    def stats(self) -> dict:
+        users, posts, pictures = self.conn.execute(
+            "SELECT COUNT(DISTINCT folder), COUNT(*), COALESCE(SUM(picture_count), 0) FROM posts"
+        ).fetchone()
+        return {"users": users, "posts": posts, "pictures": pictures, "bytes": os.path.getsize(self.path)}
+
+def open_archive_export(save_dir: str) -> ArchiveExport:
+    """打开 save_dir 下的 __archive.db"""
+    return ArchiveExport(os.path.join(save_dir, ARCHIVE_DB_NAME))
+
+def list_folders(save_dir: str) -> list:
+    return [
+        name for name in os.listdir(save_dir)
+        if os.path.isfile(os.path.join(save_dir, name, INFO_DB_NAME))
+        or os.path.isfile(os.path.join(save_dir, name, INFO_JSON_NAME))
+    ]
+
+def update_archive(save_dir: str = './opus', folders: list|None = None, full: bool = False) -> int:
+    """
+    增量导出指定用户（为 None 时为 save_dir 下的全部用户）
+
+    :return: 写入的条数
+    """
+    all_folders = folders is None
+    existing = list_folders(save_dir)
+    # 跳过还没有爬取过的用户
+    folders = existing if all_folders else [folder for folder in folders if folder in set(existing)]
+    count = 0
+    with open_archive_export(save_dir) as archive:
+        for folder in folders:
+            try:
+                count += archive.export_folder(save_dir, folder, full)
+            except (sqlite3.Error, OSError) as e:
+                print(f"[WARN] 导出 {folder} 失败：{e}")
+        if all_folders:
+            archive.remove_missing(folders)
+    return count
+
+def export_parquet(save_dir: str, parquet_path: str) -> int:
+    """
+    把 __archive.db 流式写成 Parquet，每 EXPORT_BATCH_SIZE 行一个行组
+
+    :return: 写入的行数
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("导出 Parquet 需要安装 pyarrow")
+
+    schema = pa.schema([
+        ("folder", pa.string()),
+        ("dynamic_id", pa.int64()),
+        ("pub_ts", pa.int64()),
+        ("type", pa.string()),
+        ("title", pa.string()),
+        ("description", pa.string()),
+        ("picture_count", pa.int32()),
+        ("pictures", pa.list_(pa.string())),
+        ("orig_id", pa.int64()),
+    ])
+
+    def to_batch(rows: list):
+        columns = list(zip(*rows))
+        return pa.RecordBatch.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+        )
+
+    count = 0
+    tmp_path = parquet_path + '.tmp'
+    with open_archive_export(save_dir) as archive, pq.ParquetWriter(tmp_path, schema, compression='zstd') as writer:
+        rows = []
+        for row in archive.iter_rows():
+            rows.append(row)
+            if len(rows) >= EXPORT_BATCH_SIZE:
+                writer.write_batch(to_batch(rows))
+                count += len(rows)
+                rows = []
+        if rows:
+            writer.write_batch(to_batch(rows))
+            count += len(rows)
+    os.replace(tmp_path, parquet_path)
+    return count
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='把所有用户的动态元数据导出到一个文件')
+    parser.add_argument('--save-dir', default='./opus')
+    sub = parser.add_subparsers(dest='command', required=True)
+    update_parser = sub.add_parser('update', help='增量导出到 __archive.db')
+    update_parser.add_argument('--full', action='store_true', help='重新导出全部动态')
+    parquet_parser = sub.add_parser('parquet', help='先增量导出，再另存为 Parquet')
+    parquet_parser.add_argument('path')
+    sub.add_parser('stats', help='汇总统计')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'update':
+        count = update_archive(args.save_dir, full=args.full)
+        print(f"导出 {count} 条动态，用时 {time.perf_counter() - start:.1f} 秒")
+    elif args.command == 'parquet':
+        update_archive(args.save_dir)
+        try:
+            count = export_parquet(args.save_dir, args.path)
+            print(f"写入 {count} 行到 {args.path}，用时 {time.perf_counter() - start:.1f} 秒")
+        except RuntimeError as e:
+            print(f"[ERR] {e}")
+    else:
+        with open_archive_export(args.save_dir) as archive:
+            print(archive.stats())
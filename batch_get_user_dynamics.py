@@ -1,9 +1,20 @@
+import asyncio
 import os
 import sys
 import datetime
+import time
 
 from dynamic import *
 from re_download import *
+from archive_export import update_archive
+from blob_store import open_blob_store
+from downloader import new_session
+from metrics import append_report, metrics, serve_metrics
+from page_cache import open_page_cache
+from rate_limit import AdaptiveRateLimiter, RateLimiter, interval_to_rate
+from retry import RetryEngine
+from search_index import open_search_index
+from sync_state import due_users, load_sync_state, record_check, save_sync_state
 
 class DualOutput:
     """
@@ -50,23 +61,140 @@ def save_log(func, *args, **kwargs):
     print(f"日志已保存到 {output_file}")
     return output_file
 
-def batch_dynamics(mode='download', sleep_time:float=1.0):
-    with open('./user_list.txt', "r", encoding="utf-8") as file:
+def read_user_list(list_path: str = './user_list.txt') -> list:
+    """
+    读取用户列表，每行格式为 用户名:uid
+
+    :return: [(uname, uid), ...]
+    """
+    users = []
+    with open(list_path, "r", encoding="utf-8") as file:
         for line in file:
-            time.sleep(sleep_time)
             line = line.strip() # 去掉行末的换行符并确保非空行
             if line:
                 uname, uid = line.split(":")
-                uid = int(uid)
+                users.append((uname, int(uid)))
+    return users
+
+async def crawl_users(users: list, mode: str = 'download', workers: int = 4,
+                      limiter: RateLimiter|None = None, force: bool = False,
+                      report_path: str|None = None, full: bool = False):
+    """
+    在同一个事件循环中同时处理 workers 个用户，所有用户共享 limiter 的请求速率
+
+    :param users: [(uname, uid), ...]
+    :param mode: 'download' 爬取并下载，'re_download' 重试失败的下载
+    :param workers: 同时处理的用户数
+    :param limiter: 全局速率限制，为 None 时使用默认的自适应速率限制
+    :param force: download 模式下忽略检查计划，检查所有用户
+    :param report_path: JSON-lines 报告路径，每处理完一个用户追加一行耗时记录
+    :param full: download 模式下重新翻完每个用户的全部历史动态（同时忽略检查计划），见 get_opus_async
+    """
+    limiter = limiter or AdaptiveRateLimiter()
+    state = load_sync_state("./opus") if mode == 'download' else {}
+    if mode == 'download' and not (force or full):
+        # 按各用户的发帖频率跳过还没到检查时间的用户
+        due = due_users(users, state)
+        print(f"共 {len(users)} 个用户，本次检查 {len(due)} 个，跳过 {len(users) - len(due)} 个")
+        users = due
+
+    queue = asyncio.Queue()
+    for item in users:
+        queue.put_nowait(item)
+
+    async def worker(session, blobs, search):
+        while True:
+            try:
+                uname, uid = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
 
-                print(f'{uname} ({uid})')
+            print(f'{uname} ({uid})')
+            start = time.perf_counter()
+            result = None
+            error = None
+            try:
                 if mode == 'download':
-                    get_opus(user_name = uname, user_id = uid, save_dir = "./opus")
+                    result = await get_opus_async(user_name = uname, user_id = uid, save_dir = "./opus",
+                                                  limiter = limiter, session = session, blobs = blobs,
+                                                  search = search, retry = retry, full = full)
+                    record_check(state, uid, uname, result["latest_id"], result["new_pub_ts"],
+                                 known_pub_ts = result["known_pub_ts"])
+                    save_sync_state("./opus", state)
                 elif mode == 're_download':
-                    save_dir = os.path.join(os.getcwd(), f"./opus/{uname}")
-                    failed_json = os.path.join(save_dir, '__failed_download.json')
-                    retry_failed_download(failed_json, save_dir)
-                print('')
+                    await retry_failed_download_async("./opus", uname, session = session, blobs = blobs,
+                                                      retry = retry)
+            except Exception as e:
+                error = str(e)
+                print(f"[ERR] {uname} ({uid}) 处理失败：{e}")
+            seconds = time.perf_counter() - start
+            metrics.observe('user_seconds', seconds)
+            if report_path:
+                append_report(report_path, {
+                    "event": "user", "mode": mode, "uname": uname, "uid": uid,
+                    "seconds": round(seconds, 3), "new": (result or {}).get("new"), "error": error,
+                })
+            print('')
+
+    # 所有用户共享同一个重试引擎，某个主机熔断后对所有用户生效
+    retry = RetryEngine()
+    blobs = open_blob_store("./opus")
+    search = open_search_index("./opus")
+    try:
+        async with new_session() as session:
+            await asyncio.gather(*(worker(session, blobs, search) for _ in range(max(1, workers))))
+    finally:
+        blobs.close()
+        search.close()
+    stats = retry.stats()
+    if stats["retries"] or stats["gave_up"]:
+        print(f"下载重试 {stats['retries']} 次，放弃 {stats['gave_up']} 项，熔断中的主机：{stats['breakers'] or '无'}")
+
+def batch_dynamics(mode='download', sleep_time:float=1.0, workers:int=4, force:bool=False,
+                   report_path:str|None='./log/metrics.jsonl', metrics_port:int|None=None,
+                   full:bool=False):
+    """
+    :param mode: 'download' 爬取并下载，'re_download' 重试失败的下载
+    :param sleep_time: 所有用户共享的初始 API 请求间隔，之后根据风控情况自动调整；为 0 时按 MAX_RATE 请求
+    :param workers: 同时处理的用户数
+    :param force: 忽略检查计划，检查所有用户
+    :param report_path: JSON-lines 运行报告，每个用户一行，结束时追加整次运行的汇总指标；为 None 时不写
+    :param metrics_port: 运行期间在该端口提供 Prometheus 格式的 /metrics，为 None 时不启动
+    :param full: 重新翻完全部历史动态，补全早于已保存最大动态ID、以前未保存的类型
+    """
+    users = read_user_list('./user_list.txt')
+    limiter = AdaptiveRateLimiter(rate=interval_to_rate(sleep_time))
+    metrics.reset()
+    server = serve_metrics(metrics_port) if metrics_port else None
+    try:
+        sync(crawl_users(users, mode, workers, limiter, force, report_path, full))
+    finally:
+        if server:
+            server.shutdown()
+
+    # 把新动态追加到汇总表 __archive.db
+    if mode == 'download':
+        update_archive('./opus', [uname for uname, _ in users])
+
+    # 按保留时间与大小上限清理原始动态页缓存
+    evicted = open_page_cache('./opus').evict()
+    if evicted["removed"]:
+        print(f"清理动态页缓存 {evicted['removed']} 页，剩余 {evicted['bytes'] / 1024 / 1024:.1f} MiB")
+
+    stats = limiter.stats()
+    print(f"最终请求速率 {stats['rate']:.3f} 次/秒，触发风控 {stats['backoff_count']} 次")
+
+    snapshot = metrics.snapshot()
+    counters = snapshot["counters"]
+    api = snapshot["histograms"].get("api_request_seconds", {})
+    print(f"API 请求 {counters.get('api_requests', 0)} 次（p50 {api.get('p50', 0)}s，p90 {api.get('p90', 0)}s），"
+          f"下载 {counters.get('downloads_ok', 0)} 张 / {counters.get('download_bytes', 0) / 1024 / 1024:.1f} MiB，"
+          f"平均 {snapshot['throughput']['download_bytes_per_sec'] / 1024:.1f} KiB/s")
+    if report_path:
+        append_report(report_path, {
+            "event": "run", "mode": mode, "users": len(users), "workers": workers,
+            "limiter": stats, **snapshot,
+        })
 
     print("运行完成")
 
@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import importlib
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import types
+
+import dynamic
+from batch_get_user_dynamics import crawl_users
+from downloader import DEFAULT_CONCURRENCY
+from failed_ledger import open_failed_ledger
+from info_store import INFO_JSON_NAME, open_info_store
+from metrics import Histogram, append_report, metrics
+from mock_bili import ID_BASE, MockConfig, MockUser, serve
+from rate_limit import AdaptiveRateLimiter
+from re_download import retry_failed_download_async
+from search_index import open_search_index
+
+# 离线压测：在本地模拟服务上测量爬取、失败重试与预览应用的性能，不访问网络。
+#   python ./benchmark.py --scenario all --users 20 --posts 120
+#   python ./benchmark.py --scenario preview --users 1000 --posts 1000   # 100 万条动态
+# 结果打印到终端，并追加到 ./log/bench.jsonl。
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def start_mock(port: int, config: MockConfig) -> multiprocessing.Process:
+    """在子进程中启动模拟服务，避免与被测代码争用事件循环"""
+    process = multiprocessing.Process(target=serve, args=(port, config), daemon=True)
+    process.start()
+    # 等待端口可用
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return process
+
+def user_list(count: int) -> list:
+    return [(f"user{uid}", uid) for uid in range(1, count + 1)]
+
+async def bench_crawl(users: list, workers: int, rate: float) -> dict:
+    """
+    在当前目录下爬取全部用户两次：第一次为全量爬取，第二次没有新动态，衡量增量检查的开销
+    """
+    limiter = AdaptiveRateLimiter(rate=rate, max_rate=rate)
+    result = {}
+    try:
+        for name in ('full', 'incremental'):
+            metrics.reset()
+            start = time.perf_counter()
+            await crawl_users(users, 'download', workers, limiter, force=True)
+            elapsed = time.perf_counter() - start
+            snapshot = metrics.snapshot()
+            counters = snapshot["counters"]
+            result[name] = {
+                "seconds": round(elapsed, 3),
+                "api_requests": counters.get("api_requests", 0),
+                "posts_per_sec": round(counters.get("posts_seen", 0) / elapsed, 1),
+                "images_per_sec": round(counters.get("downloads_ok", 0) / elapsed, 1),
+                "mib_per_sec": round(counters.get("download_bytes", 0) / elapsed / 1024 / 1024, 2),
+                "metrics": snapshot,
+            }
+    finally:
+        await MockUser.close_session()
+    return result
+
+async def bench_retry(base_url: str, count: int, concurrency: int) -> dict:
+    """向失败记录写入 count 条指向模拟 CDN 的新图片（uid 0，不与爬取场景重名），测量一次重试的耗时"""
+    with open_failed_ledger("./opus") as ledger:
+        ledger.record("retry_bench", [
+            {"url": f"{base_url}/bfs/new_dyn/0_{k}_0.jpg", "time_stamp": 1700000000, "error": "bench"}
+            for k in range(count)
+        ])
+    metrics.reset()
+    start = time.perf_counter()
+    await retry_failed_download_async("./opus", "retry_bench", concurrency=concurrency)
+    elapsed = time.perf_counter() - start
+    counters = metrics.snapshot()["counters"]
+    return {
+        "seconds": round(elapsed, 3),
+        "claimed": counters.get("retry_claimed", 0),
+        "succeeded": counters.get("retry_succeeded", 0),
+        "per_sec": round(counters.get("retry_claimed", 0) / elapsed, 1),
+    }
+
+def generate_archive(save_dir: str, users: int, posts: int, images: int) -> float:
+    """不经过网络，直接生成 users 个用户、每人 posts 条动态的元数据与全文索引，返回耗时"""
+    start = time.perf_counter()
+    now = int(time.time())
+    words = ["插画", "摄影", "日常", "风景", "同人", "原创", "cos", "手办", "旅行", "美食"]
+    with open_search_index(save_dir) as search:
+        for uid in range(1, users + 1):
+            folder = f"user{uid}"
+            save_path = os.path.join(save_dir, folder)
+            os.makedirs(save_path, exist_ok=True)
+            rng = random.Random(uid)
+            batch = []
+            for k in range(posts):
+                pub_ts = now - k * 3600
+                batch.append({
+                    "dynamic_id": ID_BASE + uid * 10 ** 7 + posts - k,
+                    "time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(pub_ts)),
+                    "pub_ts": pub_ts,
+                    "type": "DYNAMIC_TYPE_DRAW",
+                    "item": {
+                        "title": f"{rng.choice(words)} {k}",
+                        "description": " ".join(rng.choice(words) for _ in range(8)),
+                        "pictures": [f"http://i0.hdslb.com/bfs/new_dyn/{uid}_{k}_{j}.jpg" for j in range(images)],
+                    },
+                })
+            with open_info_store(save_path) as store:
+                store.add(batch)
+                store.export_json(os.path.join(save_path, INFO_JSON_NAME))
+            search.add(folder, batch)
+            search.mark_indexed(folder)
+    return time.perf_counter() - start
+
+def bench_preview(users: int, requests: int) -> dict:
+    """
+    在当前目录（opus 根目录）下用 Flask 测试客户端请求预览应用，统计各页面的延迟分位数
+    """
+    sys.path.insert(0, os.path.join(REPO_DIR, 'opus'))
+    preview = importlib.import_module('__a_preview_app')
+    client = preview.app.test_client()
+    rng = random.Random(0)
+    words = ["插画", "摄影", "日常", "风景", "旅行"]
+
+    def folder():
+        return f"user{rng.randint(1, users)}"
+
+    pages = {
+        "index": lambda: "/",
+        "feed": lambda: f"/feed/{folder()}",
+        "api_feed": lambda: f"/api/feed/{folder()}?limit=20",
+        "search": lambda: f"/search?q={rng.choice(words)}",
+        "search_user": lambda: f"/search?q={rng.choice(words)}&user={folder()}",
+    }
+    result = {}
+    for name, make_url in pages.items():
+        latency = Histogram()
+        for _ in range(requests):
+            url = make_url()
+            start = time.perf_counter()
+            resp = client.get(url)
+            latency.observe(time.perf_counter() - start)
+            if resp.status_code != 200:
+                print(f"[WARN] {url} 返回 {resp.status_code}")
+        result[name] = latency.summary()
+    return result
+
+def print_result(title: str, result: dict, indent: int = 0):
+    pad = ' ' * indent
+    print(f"{pad}{title}")
+    for key, value in result.items():
+        if key == 'metrics':
+            continue
+        if isinstance(value, dict):
+            print_result(key, value, indent + 2)
+        else:
+            print(f"{pad}  {key}: {value}")
+
+def main(args):
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='bili_bench_')
+    os.makedirs(os.path.join(work_dir, 'opus'), exist_ok=True)
+    report = {"event": "bench", "scenario": args.scenario, "users": args.users, "posts": args.posts,
+              "images": args.images, "workers": args.workers, "concurrency": args.concurrency}
+    cwd = os.getcwd()
+    process = None
+    try:
+        os.chdir(work_dir)
+        if args.scenario in ('crawl', 'retry', 'all'):
+            config = MockConfig(posts=args.posts, images=args.images, latency=args.latency,
+                                cdn_latency=args.cdn_latency, error_rate=args.error_rate,
+                                rate_limit=args.rate_limit, image_size=args.image_size)
+            process = start_mock(args.port, config)
+            base_url = f"http://127.0.0.1:{args.port}"
+            MockUser.base_url = base_url
+            # get_opus_async 通过 user.User 创建用户，替换为请求模拟服务的 MockUser
+            dynamic.user = types.SimpleNamespace(User=MockUser)
+
+        if args.scenario in ('crawl', 'all'):
+            report["crawl"] = asyncio.run(bench_crawl(user_list(args.users), args.workers, args.api_rate))
+            print_result("爬取", report["crawl"])
+        if args.scenario in ('retry', 'all'):
+            report["retry"] = asyncio.run(bench_retry(base_url, args.retry_count, args.concurrency))
+            print_result("失败重试", report["retry"])
+        if args.scenario in ('preview', 'all'):
+            preview_dir = os.path.join(work_dir, 'preview')
+            shutil.rmtree(preview_dir, ignore_errors=True)
+            os.makedirs(preview_dir)
+            seconds = generate_archive(preview_dir, args.users, args.posts, args.images)
+            print(f"生成 {args.users * args.posts} 条动态用时 {seconds:.1f} 秒")
+            os.chdir(preview_dir)
+            report["preview"] = {"generate_seconds": round(seconds, 3), **bench_preview(args.users, args.requests)}
+            print_result("预览应用", report["preview"])
+    finally:
+        os.chdir(cwd)
+        if process is not None:
+            process.terminate()
+        if not args.work_dir and not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    append_report(args.report, report)
+    print(f"结果已追加到 {args.report}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='离线性能测试')
+    parser.add_argument('--scenario', choices=('crawl', 'retry', 'preview', 'all'), default='all')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--posts', type=int, default=120, help='每个用户的动态数')
+    parser.add_argument('--images', type=int, default=3, help='每条图文动态的图片数')
+    parser.add_argument('--workers', type=int, default=4, help='同时处理的用户数')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='失败重试场景同时下载的图片数')
+    parser.add_argument('--api-rate', type=float, default=50.0, help='客户端动态接口请求速率（次/秒）')
+    parser.add_argument('--port', type=int, default=8790)
+    parser.add_argument('--latency', type=float, default=0.05, help='动态接口延迟（秒）')
+    parser.add_argument('--cdn-latency', type=float, default=0.02, help='图片延迟（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='图片返回 503 的概率')
+    parser.add_argument('--rate-limit', type=float, default=0, help='模拟服务的接口速率上限，0 为不限')
+    parser.add_argument('--image-size', type=int, default=50 * 1024, help='图片大小（字节）')
+    parser.add_argument('--retry-count', type=int, default=500, help='失败重试场景的记录数')
+    parser.add_argument('--requests', type=int, default=200, help='预览应用每个页面的请求次数')
+    parser.add_argument('--work-dir', help='工作目录，默认使用临时目录并在结束后删除')
+    parser.add_argument('--keep', action='store_true', help='保留临时工作目录')
+    parser.add_argument('--report', default=os.path.join(REPO_DIR, 'log', 'bench.jsonl'))
+    main(parser.parse_args())
@@ -0,0 +1,146 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+
+BLOB_DIR_NAME = '__blobs'
+BLOB_INDEX_NAME = 'index.db'
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')
+
+def file_sha256(file_path: str) -> str:
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+class BlobStore:
+    """
+    按内容哈希存放图片的共享仓库，位于 ./opus/__blobs/。
+    每张图片只保存一份，用户文件夹中的同名文件是指向仓库文件的硬链接（不支持硬链接时复制）。
+    index.db 记录 bfs 文件名 → sha256，下载前按文件名查询即可跳过已有图片。
+    """
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(root, BLOB_INDEX_NAME), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                name TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def blob_path(self, sha256: str, name: str) -> str:
+        ext = os.path.splitext(name)[1].lower()
+        return os.path.join(self.root, sha256[:2], sha256 + ext)
+
+    def tmp_path(self, name: str) -> str:
+        """下载暂存路径，与仓库在同一分区，便于直接移动"""
+        tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        return os.path.join(tmp_dir, name)
+
+    def lookup(self, name: str) -> str|None:
+        """按 bfs 文件名查找已保存的图片，返回仓库中的路径，不存在时返回 None"""
+        row = self.conn.execute("SELECT sha256, size FROM blobs WHERE name = ?", (name,)).fetchone()
+        if not row:
+            return None
+        path = self.blob_path(row[0], name)
+        if os.path.isfile(path) and os.path.getsize(path) == row[1]:
+            return path
+        return None
+
+    def add_file(self, name: str, file_path: str, sha256: str|None = None) -> str:
+        """
+        把 file_path 移入仓库（内容已存在时删除 file_path），并记录文件名
+
+        :return: 仓库中的路径
+        """
+        sha256 = sha256 or file_sha256(file_path)
+        path = self.blob_path(sha256, name)
+        if os.path.isfile(path):
+            os.remove(file_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(file_path, path)
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO blobs (name, sha256, size) VALUES (?, ?, ?)",
+                (name, sha256, os.path.getsize(path))
+            )
+        return path
+
+    @staticmethod
+    def link(blob_path: str, dest_path: str):
+        """在用户文件夹中创建指向仓库文件的硬链接，不支持硬链接时复制"""
+        if os.path.exists(dest_path) and os.path.samefile(blob_path, dest_path):
+            return
+        tmp_path = dest_path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            os.link(blob_path, tmp_path)
+        except OSError:
+            shutil.copy2(blob_path, tmp_path)
+        os.replace(tmp_path, dest_path)
+
+    def import_folder(self, folder: str) -> int:
+        """
+        把已有用户文件夹中的图片移入仓库并替换为硬链接，用于对旧存档去重
+
+        :return: 处理的图片数量
+        """
+        count = 0
+        for name in os.listdir(folder):
+            file_path = os.path.join(folder, name)
+            if not name.lower().endswith(IMAGE_EXTS) or not os.path.isfile(file_path):
+                continue
+            stat = os.stat(file_path)
+            if stat.st_nlink > 1:
+                # 已经是硬链接
+                continue
+            blob_path = self.add_file(name, file_path)
+            self.link(blob_path, file_path)
+            set_mtime(file_path, stat.st_mtime)
+            count += 1
+        return count
+
+def set_mtime(file_path: str, time_stamp: float):
+    """
+    把图片的修改时间设置为动态发布时间。
+    硬链接共享同一个 inode，同一张图片链接到多个用户文件夹时只能有一个修改时间，
+    此时保留其中最早的时间，后来的转发或重复发布不会改写其他文件夹中图片的时间。
+    """
+    # 仓库中的文件与本文件夹各占一个链接，超过 2 个即已链接到其他文件夹
+    st = os.stat(file_path)
+    if st.st_nlink > 2:
+        time_stamp = min(time_stamp, st.st_mtime)
+    os.utime(file_path, (time_stamp, time_stamp))
+
+def open_blob_store(save_dir: str = "./opus") -> BlobStore:
+    return BlobStore(os.path.join(save_dir, BLOB_DIR_NAME))
+
+def dedupe_all(save_dir: str = "./opus"):
+    """对 save_dir 下所有用户文件夹的已有图片去重"""
+    blobs = open_blob_store(save_dir)
+    try:
+        for name in os.listdir(save_dir):
+            folder = os.path.join(save_dir, name)
+            # 跳过 __blobs、__pages、__thumbs 等内部目录
+            if name.startswith('__') or not os.path.isdir(folder):
+                continue
+            count = blobs.import_folder(folder)
+            print(f"{name}：{count} 张图片已移入共享仓库")
+    finally:
+        blobs.close()
+
+if __name__ == '__main__':
+    dedupe_all("./opus")
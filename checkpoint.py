@@ -0,0 +1,46 @@
+import json
+import os
+import time
+
+CHECKPOINT_NAME = '__checkpoint.json'
+
+def load_checkpoint(save_path: str) -> dict|None:
+    """
+    读取用户文件夹下未完成的爬取进度
+
+    :return: {"stop_value": ..., "offset": ..., "pages": ..., "updated": ...}，没有进度时返回 None
+    """
+    checkpoint_path = os.path.join(save_path, CHECKPOINT_NAME)
+    if not os.path.exists(checkpoint_path):
+        return None
+    try:
+        with open(checkpoint_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"[WARN] 无法读取爬取进度 {checkpoint_path}：{e}")
+        return None
+
+def save_checkpoint(save_path: str, stop_value: int, offset: str, pages: int = 0):
+    """
+    保存爬取进度，先写临时文件再替换
+
+    :param stop_value: 本次爬取开始时的停止动态ID，恢复时沿用，避免漏掉更早的页
+    :param offset: 下一页的 offset
+    :param pages: 已获取的页数
+    """
+    checkpoint_path = os.path.join(save_path, CHECKPOINT_NAME)
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "stop_value": stop_value,
+            "offset": offset,
+            "pages": pages,
+            "updated": int(time.time())
+        }, f, ensure_ascii=False)
+    os.replace(tmp_path, checkpoint_path)
+
+def clear_checkpoint(save_path: str):
+    """爬取完成后删除进度文件"""
+    checkpoint_path = os.path.join(save_path, CHECKPOINT_NAME)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
@@ -0,0 +1,263 @@
+import argparse
+import asyncio
+import signal
+import time
+from datetime import datetime
+
+from aiohttp import web
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from archive_export import update_archive
+from batch_get_user_dynamics import read_user_list
+from blob_store import open_blob_store
+from downloader import new_session
+from dynamic import get_opus_async
+from metrics import metrics
+from page_cache import open_page_cache
+from rate_limit import AdaptiveRateLimiter, interval_to_rate
+from re_download import retry_failed_download_async
+from retry import RetryEngine
+from search_index import open_search_index
+from sync_state import load_sync_state, next_check_time, record_check, save_sync_state
+
+# 常驻模式：进程一直运行，下载会话、图片仓库、全文索引和同步状态都保持打开，
+# 每个用户按自己的发帖频率单独排期检查，有新动态时立即进入下载流水线。
+#   python ./daemon.py --min-interval 600 --notify http://127.0.0.1:8080/api/notify
+# 控制接口（默认 http://127.0.0.1:8788）：
+#   GET  /status          各用户的下次检查时间、上次检查结果、速率与下载统计
+#   POST /check/<uid>     立即检查该用户
+#   POST /pause, /resume  暂停/恢复所有检查
+#   GET  /metrics         Prometheus 格式的指标
+
+SAVE_DIR = "./opus"
+USER_LIST_PATH = './user_list.txt'
+
+# 常驻模式下的最短检查间隔（秒）
+DAEMON_MIN_INTERVAL = 600
+
+# 重新读取 user_list.txt 与重试失败下载的间隔（秒）
+RELOAD_INTERVAL = 60
+RETRY_INTERVAL = 1800
+
+class ArchiveDaemon:
+    """
+    :param workers: 同时检查的用户数
+    :param min_interval: 每个用户的最短检查间隔（秒）
+    :param notify_url: 有新动态时通知预览应用刷新缓存的地址，为 None 时不通知
+    :param sleep_time: 请求动态接口的初始间隔（秒），为 0 时按 MAX_RATE 请求
+    """
+    def __init__(self, workers: int = 4, min_interval: float = DAEMON_MIN_INTERVAL,
+                 notify_url: str|None = None, sleep_time: float = 1.0):
+        self.workers = workers
+        self.min_interval = min_interval
+        self.notify_url = notify_url
+        self.limiter = AdaptiveRateLimiter(rate=interval_to_rate(sleep_time))
+        self.retry = RetryEngine()
+        self.scheduler = AsyncIOScheduler()
+        self.users = {}
+        self.running = set()
+        self.tasks = set()
+        self.last_result = {}
+        self.paused = False
+        self.started = time.time()
+
+    async def start(self):
+        """打开共享资源，为每个用户排期，需在事件循环中调用"""
+        self.session = new_session()
+        self.blobs = open_blob_store(SAVE_DIR)
+        self.search = open_search_index(SAVE_DIR)
+        self.state = load_sync_state(SAVE_DIR)
+        self.page_cache = open_page_cache(SAVE_DIR)
+        self.semaphore = asyncio.Semaphore(max(1, self.workers))
+        self.reload_users()
+        self.scheduler.add_job(self.reload_users_job, 'interval', seconds=RELOAD_INTERVAL, id='__reload')
+        self.scheduler.add_job(self.retry_failed, 'interval', seconds=RETRY_INTERVAL, id='__retry',
+                               max_instances=1, coalesce=True)
+        self.scheduler.start()
+
+    async def stop(self):
+        """停止排期，取消正在进行的检查并等待其清理完毕后再关闭共享资源"""
+        self.scheduler.shutdown(wait=False)
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.session.close()
+        self.blobs.close()
+        self.search.close()
+
+    def job_id(self, uid: int) -> str:
+        return f"user:{uid}"
+
+    def schedule(self, uid: int, run_at: float|None = None):
+        """在 run_at 检查该用户，默认按同步状态计算下次检查时间"""
+        if run_at is None:
+            run_at = next_check_time(self.state.get(str(uid)), min_interval=self.min_interval)
+        run_date = datetime.fromtimestamp(max(run_at, time.time()))
+        self.scheduler.add_job(self.check, 'date', run_date=run_date, args=(uid,),
+                               id=self.job_id(uid), replace_existing=True, misfire_grace_time=None)
+
+    def reload_users(self):
+        """重新读取 user_list.txt，为新增的用户排期，移除已删除用户的任务"""
+        users = {uid: uname for uname, uid in read_user_list(USER_LIST_PATH)}
+        for uid in self.users.keys() - users.keys():
+            if self.scheduler.get_job(self.job_id(uid)):
+                self.scheduler.remove_job(self.job_id(uid))
+        added = users.keys() - self.users.keys()
+        self.users = users
+        for uid in added:
+            self.schedule(uid)
+
+    async def reload_users_job(self):
+        # 协程任务在事件循环中执行，普通函数会被放到线程池
+        self.reload_users()
+
+    async def check(self, uid: int):
+        """检查一个用户，完成后按新的同步状态重新排期"""
+        uname = self.users.get(uid)
+        if uname is None or uid in self.running:
+            return
+        if self.paused:
+            self.schedule(uid, time.time() + RELOAD_INTERVAL)
+            return
+        self.running.add(uid)
+        task = asyncio.current_task()
+        self.tasks.add(task)
+        try:
+            async with self.semaphore:
+                start = time.perf_counter()
+                print(f'{uname} ({uid})')
+                result = await get_opus_async(uname, uid, SAVE_DIR, limiter=self.limiter,
+                                              session=self.session, blobs=self.blobs,
+                                              search=self.search, retry=self.retry,
+                                              page_cache=self.page_cache)
+                metrics.observe('user_seconds', time.perf_counter() - start)
+                record_check(self.state, uid, uname, result["latest_id"], result["new_pub_ts"],
+                             known_pub_ts=result["known_pub_ts"])
+                save_sync_state(SAVE_DIR, self.state)
+                self.last_result[uid] = {"time": int(time.time()), "new": result["new"], "error": None}
+                if result["new"]:
+                    await asyncio.to_thread(update_archive, SAVE_DIR, [uname])
+                    await self.notify([uname])
+        except Exception as e:
+            print(f"[ERR] {uname} ({uid}) 处理失败：{e}")
+            self.last_result[uid] = {"time": int(time.time()), "new": 0, "error": str(e)}
+        finally:
+            self.running.discard(uid)
+            self.tasks.discard(task)
+            if uid in self.users and self.scheduler.running:
+                if self.last_result.get(uid, {}).get("error"):
+                    # 出错时不更新同步状态，稍后重试
+                    self.schedule(uid, time.time() + self.min_interval)
+                else:
+                    self.schedule(uid)
+
+    async def retry_failed(self):
+        """重试已到重试时间的失败下载，并清理过期的动态页缓存"""
+        if not self.paused:
+            await retry_failed_download_async(SAVE_DIR, session=self.session, blobs=self.blobs,
+                                              retry=self.retry, due_only=True)
+        await asyncio.to_thread(self.page_cache.evict)
+
+    async def notify(self, folders: list):
+        """通知预览应用这些文件夹有新动态"""
+        if not self.notify_url:
+            return
+        try:
+            async with self.session.post(self.notify_url, json={"folders": folders}) as resp:
+                resp.raise_for_status()
+        except Exception as e:
+            print(f"[WARN] 通知预览应用失败：{e}")
+
+    def status(self) -> dict:
+        users = []
+        for uid, uname in sorted(self.users.items(), key=lambda item: item[1]):
+            job = self.scheduler.get_job(self.job_id(uid))
+            entry = self.state.get(str(uid), {})
+            users.append({
+                "uid": uid,
+                "uname": uname,
+                "running": uid in self.running,
+                "next_check": int(job.next_run_time.timestamp()) if job and job.next_run_time else None,
+                "last_check": entry.get("last_check"),
+                "avg_post_interval": entry.get("avg_post_interval"),
+                "last_result": self.last_result.get(uid),
+            })
+        return {
+            "started": int(self.started),
+            "paused": self.paused,
+            "limiter": self.limiter.stats(),
+            "retry": self.retry.stats(),
+            "metrics": metrics.snapshot(),
+            "users": users,
+        }
+
+def create_control_app(daemon: ArchiveDaemon) -> web.Application:
+    async def status(request):
+        return web.json_response(daemon.status())
+
+    async def check_now(request):
+        uid = int(request.match_info['uid'])
+        if uid not in daemon.users:
+            raise web.HTTPNotFound()
+        daemon.schedule(uid, time.time())
+        return web.json_response({"scheduled": uid})
+
+    async def pause(request):
+        daemon.paused = True
+        return web.json_response({"paused": True})
+
+    async def resume(request):
+        daemon.paused = False
+        return web.json_response({"paused": False})
+
+    async def prometheus(request):
+        return web.Response(text=metrics.prometheus(), content_type='text/plain')
+
+    app = web.Application()
+    app.router.add_get('/status', status)
+    app.router.add_post('/check/{uid}', check_now)
+    app.router.add_post('/pause', pause)
+    app.router.add_post('/resume', resume)
+    app.router.add_get('/metrics', prometheus)
+    return app
+
+async def run_daemon(workers: int = 4, min_interval: float = DAEMON_MIN_INTERVAL,
+                     notify_url: str|None = None, host: str = '127.0.0.1', port: int = 8788,
+                     sleep_time: float = 1.0):
+    """运行直到收到 SIGINT / SIGTERM，退出前关闭控制接口、取消进行中的检查并关闭共享资源"""
+    daemon = ArchiveDaemon(workers, min_interval, notify_url, sleep_time)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows 不支持，Ctrl+C 时 asyncio.run 会取消本协程，同样执行下面的清理
+            pass
+    await daemon.start()
+    runner = web.AppRunner(create_control_app(daemon), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"常驻模式已启动，{len(daemon.users)} 个用户，控制接口：http://{host}:{port}/status")
+    try:
+        await stop_event.wait()
+        print("正在停止……")
+    finally:
+        await runner.cleanup()
+        await daemon.stop()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='常驻模式：按各用户的发帖频率持续检查并下载新动态')
+    parser.add_argument('--workers', type=int, default=4, help='同时检查的用户数')
+    parser.add_argument('--min-interval', type=float, default=DAEMON_MIN_INTERVAL, help='每个用户的最短检查间隔（秒）')
+    parser.add_argument('--notify', default=None, help='预览应用的通知地址，如 http://127.0.0.1:8080/api/notify')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8788)
+    parser.add_argument('--sleep-time', type=float, default=1.0, help='请求动态接口的初始间隔（秒）')
+    args = parser.parse_args()
+    try:
+        asyncio.run(run_daemon(args.workers, args.min_interval, args.notify, args.host, args.port,
+                               args.sleep_time))
+    except KeyboardInterrupt:
+        pass
+    print("已停止")
@@ -0,0 +1,285 @@
+import asyncio
+import hashlib
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+
+import aiohttp
+
+from blob_store import BlobStore, set_mtime
+from metrics import metrics
+from retry import RetryEngine
+
+# 默认同时下载的图片数量
+DEFAULT_CONCURRENCY = 8
+
+# 单个连接空闲多久后关闭（秒），在此期间复用 keep-alive 连接
+KEEPALIVE_TIMEOUT = 30
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                  "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Referer": "https://www.bilibili.com/",
+}
+
+CHUNK_SIZE = 64 * 1024
+
+# 其他进程留下的 .part 超过这么久（秒）没有写入才视为中断残留，可以续传
+PART_STALE_SECONDS = 300
+
+# 本进程创建的 .part 文件，重试时可直接续传
+_owned_parts = set()
+
+# 正在下载的文件：(事件循环, 路径) -> [锁, 等待数]，同一图片被多个任务同时下载时后来者等待
+_inflight = {}
+
+@asynccontextmanager
+async def _download_lock(path: str):
+    key = (id(asyncio.get_running_loop()), path)
+    entry = _inflight.setdefault(key, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _inflight[key]
+
+
+def clean_url(url: str) -> str:
+    """去掉 URL 中的 query 参数"""
+    return re.sub(r'\?.*$', '', url)
+
+def url_file_name(url: str) -> str|None:
+    """从 URL 中提取文件名，提取失败返回 None"""
+    match = re.search(r'/([^/]+)$', clean_url(url))
+    return match.group(1) if match else None
+
+def new_session(concurrency: int = DEFAULT_CONCURRENCY, limit_per_host: int = 0) -> aiohttp.ClientSession:
+    """
+    创建共享的下载会话，需在事件循环中调用。
+
+    :param concurrency: 连接池总连接数上限
+    :param limit_per_host: 每个主机的连接数上限，0 表示与 concurrency 相同
+    :return: aiohttp.ClientSession
+    """
+    connector = aiohttp.TCPConnector(
+        limit=concurrency,
+        limit_per_host=limit_per_host or concurrency,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=300,
+    )
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=15, sock_read=60)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, headers=HEADERS)
+
+def _hash_file(file_path: str):
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h
+
+def _total_size(resp: aiohttp.ClientResponse) -> int|None:
+    """响应对应的完整文件大小，206 时取 Content-Range 中的总长度"""
+    if resp.status == 206:
+        match = re.search(r'/(\d+)$', resp.headers.get('Content-Range', ''))
+        return int(match.group(1)) if match else None
+    return resp.content_length
+
+async def fetch_to_file(session: aiohttp.ClientSession, url: str, file_path: str,
+                        resume: bool = True) -> str:
+    """
+    下载 url 到 file_path，非 2xx 状态码会抛出 aiohttp.ClientResponseError。
+    先写入 file_path.part，校验大小与 Content-Length 一致后再原子地重命名为 file_path；
+    .part 已存在时（上次下载被中断）用 Range 请求续传。
+
+    :param resume: 是否尝试续传已有的 .part 文件
+    :return: 文件内容的 sha256
+    """
+    part_path = file_path + '.part'
+    if os.path.exists(part_path) and part_path not in _owned_parts \
+            and time.time() - os.path.getmtime(part_path) < PART_STALE_SECONDS:
+        # 另一个进程可能正在写入该 .part，改用本进程独有的暂存文件
+        part_path = f"{file_path}.{os.getpid()}.part"
+    _owned_parts.add(part_path)
+    offset = os.path.getsize(part_path) if resume and os.path.exists(part_path) else 0
+    headers = {'Range': f'bytes={offset}-'} if offset else None
+
+    start = time.perf_counter()
+    async with session.get(url, headers=headers) as resp:
+        if offset and resp.status == 416:
+            # .part 与服务器文件不符，重新下载
+            os.remove(part_path)
+            return await fetch_to_file(session, url, file_path, resume=False)
+        resp.raise_for_status()
+
+        if offset and resp.status == 206:
+            h = _hash_file(part_path)
+            mode = 'ab'
+        else:
+            # 服务器不支持 Range 时从头下载
+            h = hashlib.sha256()
+            mode = 'wb'
+        expected = _total_size(resp)
+
+        disk_time = 0.0
+        with open(part_path, mode) as f:
+            async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                h.update(chunk)
+                t = time.perf_counter()
+                f.write(chunk)
+                disk_time += time.perf_counter() - t
+                metrics.inc('download_bytes', len(chunk))
+        metrics.inc('disk_write_seconds', disk_time)
+    metrics.observe('download_seconds', time.perf_counter() - start)
+
+    size = os.path.getsize(part_path)
+    if expected is not None and size != expected:
+        # 连接中途断开，可重试，下次从 .part 续传
+        raise aiohttp.ClientPayloadError(f"文件不完整：{size}/{expected} 字节")
+    os.replace(part_path, file_path)
+    _owned_parts.discard(part_path)
+    return h.hexdigest()
+
+async def is_complete(session: aiohttp.ClientSession, url: str, file_path: str) -> bool:
+    """用 HEAD 请求的 Content-Length 判断本地文件是否完整，无法判断时视为不完整"""
+    try:
+        async with session.head(url, allow_redirects=True) as resp:
+            resp.raise_for_status()
+            length = resp.content_length
+    except aiohttp.ClientError:
+        return False
+    return length is not None and length == os.path.getsize(file_path)
+
+async def fetch_picture(session: aiohttp.ClientSession, url: str, file_path: str,
+                        blobs: BlobStore|None = None, skip_existing: bool = True):
+    """
+    下载图片到 file_path。传入 blobs 时先按文件名查询共享仓库，
+    已有的图片直接硬链接，新图片下载后移入仓库再链接到 file_path。
+
+    :param skip_existing: file_path 已存在且与服务器文件大小一致时跳过下载
+    """
+    name = os.path.basename(file_path)
+    # 同一图片（多个用户转发、转发与原动态、队列中重复的 url）同时下载时依次进行，
+    # 后来者在前一个完成后直接从仓库链接，不会共用同一个 .part
+    async with _download_lock(name if blobs is not None else file_path):
+        if blobs is not None:
+            blob_path = blobs.lookup(name)
+            if blob_path:
+                print(f"已存在，跳过下载: {name}")
+                metrics.inc('downloads_skipped')
+                blobs.link(blob_path, file_path)
+                return
+
+        if skip_existing and os.path.isfile(file_path) and await is_complete(session, url, file_path):
+            print(f"已完整存在，跳过下载: {name}")
+            metrics.inc('downloads_skipped')
+            if blobs is not None:
+                # 旧存档中的完整文件直接移入仓库
+                blobs.link(blobs.add_file(name, file_path), file_path)
+            return
+
+        if blobs is None:
+            await fetch_to_file(session, url, file_path)
+            return
+
+        tmp_path = blobs.tmp_path(name)
+        sha256 = await fetch_to_file(session, url, tmp_path)
+        blobs.link(blobs.add_file(name, tmp_path, sha256), file_path)
+
+async def download_one(session: aiohttp.ClientSession, download: dict, save_path: str,
+                       blobs: BlobStore|None = None, skip_existing: bool = True,
+                       retry: RetryEngine|None = None) -> dict|None:
+    """
+    下载单张图片，并把文件修改时间设置为动态发布时间（同一张图片链接到多个文件夹时取最早的，见 set_mtime）。
+    传入 retry 时，超时、5xx 等临时错误会按退避策略重试，404 等错误直接失败。
+
+    :param download: {"url": ..., "time_stamp": ...}
+    :param blobs: 共享图片仓库，为 None 时直接保存到 save_path
+    :param skip_existing: 本地文件已完整时跳过下载
+    :param retry: 重试引擎，为 None 时只尝试一次
+    :return: 下载失败时返回失败记录（url 已去掉 query 参数），成功返回 None
+    """
+    url = clean_url(download.get('url'))
+    time_stamp = download.get('time_stamp')
+    print(f"Downloading: {url}")
+    try:
+        file_name = url_file_name(url)
+        if file_name is None:
+            raise ValueError("无法从 URL 提取文件名")
+        file_path = os.path.join(save_path, file_name)
+        if retry is None:
+            await fetch_picture(session, url, file_path, blobs, skip_existing)
+        else:
+            await retry.run(url, lambda: fetch_picture(session, url, file_path, blobs, skip_existing))
+        set_mtime(file_path, time_stamp)
+        metrics.inc('downloads_ok')
+        return None
+    except Exception as e:
+        print(f"Failed to download {url}: {e}")
+        metrics.inc('downloads_failed')
+        return {
+            "url": url,
+            "time_stamp": time_stamp,
+            "error": str(e) or type(e).__name__,
+        }
+
+async def download_worker(queue: asyncio.Queue, save_path: str,
+                          session: aiohttp.ClientSession, failed_list: list,
+                          blobs: BlobStore|None = None, retry: RetryEngine|None = None,
+                          on_done=None):
+    """
+    从 queue 中持续取出下载任务，取到 None 时退出，失败记录追加到 failed_list
+
+    :param on_done: 每个任务完成（成功或失败）后调用 on_done(download)
+    """
+    while True:
+        download = await queue.get()
+        try:
+            if download is None:
+                return
+            failed = await download_one(session, download, save_path, blobs, retry=retry)
+            if failed:
+                failed_list.append(failed)
+            if on_done:
+                on_done(download)
+        finally:
+            queue.task_done()
+
+async def download_all(download_queue: list, save_path: str,
+                       session: aiohttp.ClientSession|None = None,
+                       concurrency: int = DEFAULT_CONCURRENCY,
+                       blobs: BlobStore|None = None, skip_existing: bool = True,
+                       retry: RetryEngine|None = None) -> list:
+    """
+    并发下载 download_queue 中的图片，并把文件修改时间设置为动态发布时间。
+
+    :param download_queue: [{"url": ..., "time_stamp": ...}, ...]
+    :param save_path: 图片保存路径
+    :param session: 共享的下载会话，为 None 时内部创建并在结束后关闭
+    :param concurrency: 同时下载的数量
+    :param blobs: 共享图片仓库，为 None 时直接保存到 save_path
+    :param skip_existing: 本地文件已完整时跳过下载
+    :param retry: 共享的重试引擎，为 None 时内部创建
+    :return: 下载失败的列表，格式同 download_queue（url 已去掉 query 参数）
+    """
+    own_session = session is None
+    if own_session:
+        session = new_session(concurrency)
+
+    retry = retry or RetryEngine()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def worker(download: dict):
+        async with semaphore:
+            return await download_one(session, download, save_path, blobs, skip_existing, retry)
+
+    try:
+        results = await asyncio.gather(*(worker(d) for d in download_queue))
+    finally:
+        if own_session:
+            await session.close()
+
+    return [failed for failed in results if failed]
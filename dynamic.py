@@ -1,200 +1,329 @@
+import asyncio
 import json
 import os
-import re
-import time
-import urllib.request
 
 from bilibili_api import user, sync
 from bilibili_api.user import User
 
 from file_op import *
-
-async def get_dynamics(u: User, sleep_time: float = 1.0, stop_value: int = 0) -> list:
+from downloader import DEFAULT_CONCURRENCY, download_all, download_worker, new_session
+from failed_ledger import open_failed_ledger
+from blob_store import BlobStore, open_blob_store
+from checkpoint import clear_checkpoint, load_checkpoint, save_checkpoint
+from folder_index import update_folders
+from info_store import INFO_JSON_NAME, open_info_store
+from metrics import metrics
+from page_cache import PageCache, open_page_cache
+from parsers import parse_item
+from rate_limit import AdaptiveRateLimiter, RateLimiter, is_risk_control
+from retry import RetryEngine
+from search_index import SearchIndex, open_search_index
+
+# 下载队列长度上限，翻页速度超过下载速度时在此处等待
+DOWNLOAD_QUEUE_SIZE = 256
+
+# 同一页连续触发风控的最大重试次数
+MAX_THROTTLE_RETRIES = 5
+
+async def iter_dynamic_pages(u: User, sleep_time: float = 1.0, stop_value: int = 0,
+                             limiter: RateLimiter|None = None, offset: str = "", on_page=None):
     """
+    逐页获取动态的异步生成器，翻页的同时调用方即可处理已获取的页
+
     :param u: User实例
     :param sleep_time: 每页爬取时的间隔时间，防止爬取过快导致Ban IP
     :param stop_value: 爬到<=指定的动态ID以后停止爬取
-    :return: 返回一个列表
+    :param limiter: 多个用户共享的速率限制，传入时代替 sleep_time 控制请求间隔，
+                    触发风控（412 / -352）时由 limiter 退避并重试当前页
+    :param offset: 起始页的 offset，用于从中断处继续爬取
+    :param on_page: 每获取一页 await on_page(offset, page)，page 为接口返回的原始数据
+    :return: 逐页 yield (该页中动态ID大于 stop_value 的动态列表, 下一页的 offset)，
+             最后一页的 offset 为 None
     """
-    # 用于记录下一次起点
-    offset = ""
-
-    # 用于存储所有动态
-    dynamics = []
+    limiter = limiter or RateLimiter(sleep_time)
+    # 当前页连续触发风控的次数
+    throttled = 0
 
     # 无限循环，直到 has_more != 1
     while True:
         # 获取该页动态
-        page = await u.get_dynamics_new(offset)
-
-        dynamics.extend(page["items"])
+        with metrics.timer('rate_limit_wait_seconds'):
+            await limiter.acquire()
+        metrics.inc('api_requests')
+        try:
+            with metrics.timer('api_request_seconds'):
+                page = await u.get_dynamics_new(offset)
+        except Exception as e:
+            metrics.inc('api_errors')
+            if not is_risk_control(e) or throttled >= MAX_THROTTLE_RETRIES:
+                raise
+            # 触发风控，降低速率后重试同一页
+            metrics.inc('api_throttled')
+            throttled += 1
+            limiter.on_throttle(e)
+            continue
+        throttled = 0
+        limiter.on_success()
+        if on_page:
+            await on_page(offset, page)
+
+        items = [item for item in page["items"] if int(item['id_str']) > stop_value]
 
         if page["has_more"] != 1:
             # 如果没有更多动态，跳出循环
+            yield items, None
             break
 
         # 先判断 page["items"] 中是否有 id_str 小于等于 stop_value 的
-        if any(int(item['id_str']) <= stop_value for item in page["items"]):
+        if len(items) < len(page["items"]):
+            yield items, None
             break
 
         # 设置 offset，用于下一轮循环
         offset = page["offset"]
+        yield items, offset
 
-        time.sleep(sleep_time)
+async def get_dynamics(u: User, sleep_time: float = 1.0, stop_value: int = 0,
+                       limiter: RateLimiter|None = None) -> list:
+    """
+    :param u: User实例
+    :param sleep_time: 每页爬取时的间隔时间，防止爬取过快导致Ban IP
+    :param stop_value: 爬到<=指定的动态ID以后停止爬取
+    :param limiter: 多个用户共享的速率限制，传入时代替 sleep_time 控制请求间隔
+    :return: 返回一个列表
+    """
+    # 用于存储所有动态
+    dynamics = []
+    async for items, _ in iter_dynamic_pages(u, sleep_time, stop_value, limiter):
+        dynamics.extend(items)
 
     # 打印动态数量
     print(f"遍历 {len(dynamics)} 条动态")
-
-    dynamics = [item for item in dynamics if int(item['id_str']) > stop_value]
     return dynamics
 
 def parse_dynamic(dynamic: dict) -> dict|None:
-    if dynamic['type'] != 'DYNAMIC_TYPE_DRAW': # DYNAMIC_TYPE_DRAW 为图文
-        return None
-
-    try:
-        major = dynamic['modules']['module_dynamic']['major']
-        opus_data = major.get('opus', {})
-        author = dynamic['modules']['module_author']
-
-        pictures = [p['url'] for p in opus_data.get('pics', [])]
-        item = {
-            "title": opus_data.get('title'),
-            "description": opus_data.get('summary', {}).get('text'),
-            "pictures": pictures
-        }
-
-        # 时间戳转换
-        formatted_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(author.get('pub_ts')))
-        return {
-            "dynamic_id": int(dynamic.get('id_str')),
-            "time": formatted_time,
-            "type": dynamic['type'],
-            "item": item
-        }
-    except KeyError as e:
-        print(f"字段缺失: {e}")
-        return None
+    """解析一条动态的元数据，各类型的解析见 parsers.py"""
+    return parse_item(dynamic)[0]
 
 def get_download_queue(dynamic: dict) -> list|None:
-    if dynamic['type'] != 'DYNAMIC_TYPE_DRAW': # DYNAMIC_TYPE_DRAW 为图文
-        return None
+    """一条动态需要下载的图片（图文、专栏/视频封面、转发的原动态图片）"""
+    return parse_item(dynamic)[1]
 
-    try:
-        major = dynamic['modules']['module_dynamic']['major']
-        opus_data = major.get('opus', {})
-        author = dynamic['modules']['module_author']
-
-        pictures = [p['url'] for p in opus_data.get('pics', [])]
-        time_stamp = author.get('pub_ts')
-        download_queue = []
-        for url in pictures:
-            url_and_timestamp = {
-                "url": url,
-                "time_stamp": time_stamp
-            }
-            download_queue.append(url_and_timestamp)
-        return download_queue
-
-    except KeyError as e:
-        print(f"字段缺失: {e}")
-        return None
-
-def save_failed_list(save_path, failed_list):
-    # 加载旧数据
-    if os.path.exists(save_path):
-        with open(save_path, "r", encoding="utf-8") as f:
-            try:
-                old_failed = json.load(f)
-            except json.JSONDecodeError:
-                old_failed = []
-    else:
-        old_failed = []
-
-    # 合并新旧列表
-    combined = old_failed + failed_list
-
-    # 去重（以 url 为唯一键，保留时间戳较新的记录）
-    url_to_data = {}
-    for item in combined:
-        url = item.get("url")
-        ts = item.get("time_stamp", 0)
-        if url:
-            # 如果已存在，则保留时间戳更大的
-            if url not in url_to_data or ts > url_to_data[url]["time_stamp"]:
-                url_to_data[url] = item
-
-    # 生成去重后的列表
-    unique_failed_list = list(url_to_data.values())
-
-    # 写入去重后的文件
-    with open(save_path, "w", encoding="utf-8") as f:
-        json.dump(unique_failed_list, f, indent=4, ensure_ascii=False)
+def save_failed_list(save_dir: str, folder: str, failed_list: list):
+    """
+    把下载失败的项追加到 save_dir 下的失败记录（__failed.db）
 
-    print(f"存在下载失败记录，共 {len(unique_failed_list)} 项。")
+    :param save_dir: 保存目录，如 ./opus
+    :param folder: 用户文件夹名
+    """
+    with open_failed_ledger(save_dir) as ledger:
+        ledger.record(folder, failed_list)
+        print(f"存在下载失败记录，共 {ledger.count(folder)} 项。")
 
 
-def download_pictures(download_queue: list, save_path: str, failed_download_path: str):
-    failed_list = []
-    for download in download_queue:
-        url = download.get('url')
-        time_stamp = download.get('time_stamp')
-        url = re.sub(r'\?.*', '', url)
-
-        print(f"Downloading: {url}")
-        try:
-            match = re.search(r'/([^/]+)$', url)
-            file_name = match.group(1)
-            file_path = os.path.join(save_path, file_name)
-            urllib.request.urlretrieve(url, file_path)
-            os.utime(file_path, (time_stamp, time_stamp))
+async def download_pictures_async(download_queue: list, save_path: str,
+                                  session=None, concurrency: int = DEFAULT_CONCURRENCY,
+                                  retry: RetryEngine|None = None):
+    """
+    并发下载图片，下载失败的项记录到上级目录的 __failed.db
 
-        except Exception as e:
-            print(f"Failed to download {url}: {e}")
-            failed_data = {
-                "url": url,
-                "time_stamp": time_stamp
-            }
-            failed_list.append(failed_data)
+    :param download_queue: [{"url": ..., "time_stamp": ...}, ...]
+    :param save_path: 图片保存路径，如 ./opus/<用户名>
+    :param session: 共享的下载会话，为 None 时内部创建
+    :param concurrency: 同时下载的数量
+    :param retry: 共享的重试引擎，临时错误会先在进程内重试，仍失败的才写入失败列表
+    """
+    failed_list = await download_all(download_queue, save_path, session=session,
+                                     concurrency=concurrency, retry=retry)
 
     if failed_list:
-        save_failed_list(failed_download_path, failed_list)
-
-def get_opus(user_name: str, user_id: int, save_dir: str = "./opus"):
+        save_dir, folder = os.path.split(os.path.normpath(save_path))
+        save_failed_list(save_dir, folder, failed_list)
+
+def download_pictures(download_queue: list, save_path: str, concurrency: int = DEFAULT_CONCURRENCY):
+    sync(download_pictures_async(download_queue, save_path, concurrency=concurrency))
+
+async def get_opus_async(user_name: str, user_id: int, save_dir: str = "./opus",
+                         limiter: RateLimiter|None = None, session=None,
+                         concurrency: int = DEFAULT_CONCURRENCY, export_json: bool = False,
+                         blobs: BlobStore|None = None, search: SearchIndex|None = None,
+                         retry: RetryEngine|None = None, page_cache: PageCache|None = None,
+                         full: bool = False):
+    """
+    爬取并下载指定用户的动态（图文、文字、专栏、视频与转发，见 parsers.py）。翻页、解析与下载流水线并行：
+    每获取一页即解析并把图片放入有界队列，由下载协程边翻页边下载。
+    每页的动态即时写入 __info.db，翻页进度记录在 __checkpoint.json，中断后再次运行会从中断的页继续。
+
+    :param user_name: 用户名，作为保存文件夹名
+    :param user_id: 用户uid
+    :param save_dir: 保存目录
+    :param limiter: 多个用户共享的速率限制
+    :param session: 共享的下载会话
+    :param concurrency: 该用户同时下载的数量
+    :param export_json: 有新动态时是否同步导出兼容旧格式的 __info.json（需重写整个文件，默认不导出，
+                        需要时运行 info_store.py export）
+    :param blobs: 共享图片仓库，为 None 时打开 save_dir 下的 __blobs
+    :param search: 全文索引，为 None 时打开 save_dir 下的 __search.db
+    :param retry: 共享的重试引擎，为 None 时内部创建
+    :param page_cache: 原始动态页缓存，为 None 时使用 save_dir 下的 __pages
+    :param full: 不在已保存的最大动态ID处停止，重新翻完全部历史动态，
+                 用于补全支持新类型之前爬取的、早于最大动态ID的文字/专栏/视频/转发动态
+    :return: {"new": 新增动态数, "latest_id": 已保存的最大动态ID,
+              "new_pub_ts": 本次保存的新动态（不含置顶等旧动态）的发布时间戳列表,
+              "known_pub_ts": 本次爬取前已保存动态的最新发布时间戳}
+    """
     path = os.getcwd()
     save_path = os.path.join(path, save_dir, user_name) # 图片保存路径
-    info_path = os.path.join(save_path, '__info.json') # 图
-    failed_download_path = os.path.join(save_path, '__failed_download.json') # 错误下载列表保存路径
+    info_path = os.path.join(save_path, INFO_JSON_NAME) # 兼容旧格式的元数据
     os.makedirs(save_path, exist_ok=True) # 创建输出文件夹
 
     u = user.User(user_id)
-
-    info = rjson(info_path)
-    stop_value = int(info[0].get('dynamic_id')) if info else 0
-    # print(stop_value)
-    # 获取动态
-    dynamics = sync(get_dynamics(u, 1.0, stop_value))
-    # 解析图文内容
-    opus = [post for i in dynamics if (post := parse_dynamic(i))]
-    opus.sort(key=lambda x: int(x["dynamic_id"]), reverse=True) # 排序
-    print(f"筛选出 {len(opus)} 条图文动态")
-    # 保存或追加 info
-    if info:
-        info[:0] = opus # 插在最前面
+    limiter = limiter or AdaptiveRateLimiter()
+
+    store = open_info_store(save_path)
+    checkpoint = load_checkpoint(save_path)
+    if checkpoint:
+        # 上次爬取中断，沿用当时的停止ID，从中断的页继续
+        stop_value = 0 if full else checkpoint['stop_value']
+        offset = checkpoint['offset']
+        pages = checkpoint.get('pages', 0)
+        print(f"从上次中断处继续：已获取 {pages} 页，offset={offset}")
+        # 中断前已保存的页同样算作本次的新动态
+        known_id = checkpoint['stop_value']
     else:
-        info = opus
-    # 保存info
-    w2json(info_path, info)
+        known_id = store.latest_id()
+        stop_value = 0 if full else known_id
+        offset = ""
+        pages = 0
+        # 先记录停止ID，第一页写入后中断也不会漏掉更早的页
+        save_checkpoint(save_path, stop_value, offset, pages)
+    # print(stop_value)
 
+    own_session = session is None
+    if own_session:
+        session = new_session(concurrency)
+    own_blobs = blobs is None
+    if own_blobs:
+        blobs = open_blob_store(os.path.join(path, save_dir))
+    own_search = search is None
+    if own_search:
+        search = open_search_index(os.path.join(path, save_dir))
+
+    retry = retry or RetryEngine()
+    page_cache = page_cache or open_page_cache(os.path.join(path, save_dir))
+
+    async def cache_page(page_offset: str, page: dict):
+        # 原样保存每一页，解析逻辑修改后可用 page_cache.py 离线重新解析；
+        # 压缩与写文件放到线程中，不阻塞事件循环中其他用户的翻页与下载
+        with metrics.timer('page_cache_write_seconds'):
+            try:
+                await asyncio.to_thread(page_cache.put, user_id, page_offset, page)
+            except OSError as e:
+                print(f"[WARN] 保存动态页缓存失败：{e}")
 
-    # 提取url和时间戳
-    download_queue = [
-        item
-        for i in dynamics
-        for item in (get_download_queue(i) or [])
+    # 有界下载队列，队列满时暂停翻页，保证内存占用不随动态数量增长
+    queue = asyncio.Queue(maxsize=DOWNLOAD_QUEUE_SIZE)
+    failed_list = []
+
+    # 一页的图片全部下载完成（或已记入失败记录）后才推进断点，
+    # 中断时已入队但未下载的图片会在继续爬取时重新获取该页并下载
+    page_pending = {}    # {页序号: 未完成的下载数}
+    page_offsets = []    # [(页序号, 下一页的 offset)]，按页序排列
+
+    def advance_checkpoint():
+        if page_offsets and not page_pending.get(page_offsets[0][0]) and failed_list:
+            # 推进断点前先保存失败项，避免中断后丢失
+            save_failed_list(os.path.join(path, save_dir), user_name, failed_list)
+            failed_list.clear()
+        while page_offsets and not page_pending.get(page_offsets[0][0]):
+            page_no, page_next_offset = page_offsets.pop(0)
+            page_pending.pop(page_no, None)
+            save_checkpoint(save_path, stop_value, page_next_offset, page_no)
+
+    def on_download_done(download: dict):
+        page_pending[download['page']] -= 1
+        advance_checkpoint()
+
+    workers = [
+        asyncio.create_task(download_worker(queue, save_path, session, failed_list, blobs, retry,
+                                            on_download_done))
+        for _ in range(concurrency)
     ]
-    # 下载图片
-    download_pictures(download_queue, save_path, failed_download_path)
+
+    async def stop_workers():
+        # 通知下载协程退出，并等待剩余图片下载完成
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    workers_stopped = False
+    try:
+        # 索引建立前已保存的动态先补进全文索引
+        backfilled = search.ensure_folder(user_name, store)
+        if backfilled:
+            print(f"补建全文索引 {backfilled} 条动态")
+        # 获取动态，逐页解析动态内容并提取url和时间戳
+        opus_count = 0
+        count = 0
+        new_pub_ts = []
+        async for items, next_offset in iter_dynamic_pages(u, 1.0, stop_value, limiter, offset, cache_page):
+            count += len(items)
+            page_no = pages + 1
+            opus = []
+            for i in items:
+                # 每条动态只解析一次，同时得到元数据与下载任务
+                post, downloads = parse_item(i)
+                if post:
+                    opus.append(post)
+                    if post['dynamic_id'] > known_id:
+                        new_pub_ts.append(post['pub_ts'])
+                for download in downloads:
+                    download["page"] = page_no
+                    page_pending[page_no] = page_pending.get(page_no, 0) + 1
+                    # 下载跟不上翻页时在此等待
+                    with metrics.timer('download_queue_wait_seconds'):
+                        await queue.put(download)
+            # 每页提交一次，该页的图片下载完成后记录下一页的 offset
+            with metrics.timer('db_write_seconds'):
+                opus_count += store.add(opus)
+                search.add(user_name, opus)
+            metrics.inc('posts_seen', len(items))
+            metrics.inc('posts_saved', len(opus))
+            pages = page_no
+            if next_offset is not None:
+                page_offsets.append((page_no, next_offset))
+                advance_checkpoint()
+        print(f"遍历 {count} 条动态")
+        print(f"保存 {opus_count} 条动态")
+
+        workers_stopped = True
+        await stop_workers()
+        clear_checkpoint(save_path)
+
+        if export_json and (opus_count or checkpoint or not os.path.exists(info_path)):
+            store.export_json(info_path)
+        return {"new": opus_count, "latest_id": store.latest_id(), "new_pub_ts": new_pub_ts,
+                "known_pub_ts": store.latest_pub_ts(known_id)}
+    finally:
+        store.close()
+        if not workers_stopped:
+            await stop_workers()
+        if own_session:
+            await session.close()
+        if own_blobs:
+            blobs.close()
+        if own_search:
+            search.close()
+        if failed_list:
+            save_failed_list(os.path.join(path, save_dir), user_name, failed_list)
+        # 更新预览应用使用的文件夹统计，失败不影响本次爬取的结果
+        try:
+            update_folders(os.path.join(path, save_dir), [user_name])
+        except Exception as e:
+            print(f"[WARN] 更新文件夹统计失败：{e}")
+
+def get_opus(user_name: str, user_id: int, save_dir: str = "./opus"):
+    return sync(get_opus_async(user_name, user_id, save_dir))
 
 def demo():
     u = user.User(660303135)
@@ -0,0 +1,190 @@
+import os
+import sqlite3
+import time
+
+from file_op import rjson
+
+FAILED_DB_NAME = '__failed.db'
+LEGACY_FAILED_NAME = '__failed_download.json'
+
+# 第 n 次失败后等待 RETRY_DELAY * 2^(n-1) 秒再重试，最长 MAX_RETRY_DELAY
+RETRY_DELAY = 600
+MAX_RETRY_DELAY = 7 * 24 * 3600
+
+# 领取的记录在该时间内不会被其他重试进程再次领取（秒），进程中途退出后自动释放
+CLAIM_TIMEOUT = 3600
+
+CREATE_FAILED_TABLE = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        url TEXT NOT NULL,
+        folder TEXT NOT NULL,
+        time_stamp INTEGER,
+        attempts INTEGER NOT NULL DEFAULT 1,
+        last_error TEXT,
+        first_failed REAL NOT NULL,
+        last_failed REAL NOT NULL,
+        next_retry REAL NOT NULL,
+        claimed_until REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (folder, url)
+    )
+"""
+
+class FailedLedger:
+    """
+    所有用户共用的下载失败记录（SQLite），位于 ./opus/__failed.db。
+    每个用户文件夹中的每个 url 一行，记录失败次数、最后一次错误和下次重试时间；
+    写入只插入或更新对应的行，不会重写整个文件，多个协程/进程同时写入也是安全的。
+    """
+    def __init__(self, db_path: str):
+        self.path = db_path
+        # 由 busy timeout 等待其他进程的写事务，事务由 _transaction 显式管理
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(CREATE_FAILED_TABLE.format(name='failed'))
+        self._migrate_primary_key()
+        self.conn.execute("CREATE INDEX IF NOT EXISTS failed_due ON failed (folder, next_retry)")
+
+    def _migrate_primary_key(self):
+        """旧版以 url 为主键，同一图片在多个用户文件夹失败时会互相覆盖，改为 (folder, url)"""
+        pk = [row[1] for row in sorted(self.conn.execute("PRAGMA table_info(failed)"), key=lambda r: r[5]) if row[5]]
+        if pk == ['folder', 'url']:
+            return
+        self._transaction()
+        try:
+            self.conn.execute(CREATE_FAILED_TABLE.format(name='failed_new'))
+            self.conn.execute("INSERT INTO failed_new SELECT url, folder, time_stamp, attempts, last_error, "
+                              "first_failed, last_failed, next_retry, claimed_until FROM failed")
+            self.conn.execute("DROP TABLE failed")
+            self.conn.execute("ALTER TABLE failed_new RENAME TO failed")
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _transaction(self):
+        """开始写事务（BEGIN IMMEDIATE），避免两个进程读到同一批记录后再争抢写锁"""
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def record(self, folder: str, failed_list: list, now: float|None = None) -> int:
+        """
+        记录一批下载失败，该文件夹中已有的 url 失败次数加一并推迟下次重试时间
+
+        :param folder: 用户文件夹名
+        :param failed_list: [{"url": ..., "time_stamp": ..., "error": ...}, ...]
+        :return: 写入的条数
+        """
+        now = now or time.time()
+        rows = [
+            (item["url"], folder, item.get("time_stamp"), item.get("error"), now, now, now + RETRY_DELAY)
+            for item in failed_list if item.get("url")
+        ]
+        self._transaction()
+        try:
+            self.conn.executemany("""
+                INSERT INTO failed (url, folder, time_stamp, last_error, first_failed, last_failed, next_retry)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (folder, url) DO UPDATE SET
+                    time_stamp = COALESCE(excluded.time_stamp, time_stamp),
+                    attempts = attempts + 1,
+                    last_error = excluded.last_error,
+                    last_failed = excluded.last_failed,
+                    next_retry = excluded.last_failed + MIN(?, ? * (1 << MIN(attempts, 20))),
+                    claimed_until = 0
+            """, [row + (MAX_RETRY_DELAY, RETRY_DELAY) for row in rows])
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        return len(rows)
+
+    def resolve(self, folder: str, urls: list):
+        """下载成功后删除该用户文件夹的对应记录"""
+        self._transaction()
+        try:
+            self.conn.executemany("DELETE FROM failed WHERE folder = ? AND url = ?", [(folder, url) for url in urls])
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    def claim(self, limit: int = 500, folder: str|None = None, now: float|None = None,
+              due_only: bool = True, failed_before: float|None = None) -> list:
+        """
+        领取一批到期的记录，领取后 CLAIM_TIMEOUT 秒内不会被再次领取。
+        处理完后用 resolve 删除成功的项，用 record 记录仍失败的项（同时释放领取）。
+
+        :param folder: 只领取该用户文件夹的记录，为 None 时领取全部
+        :param due_only: 是否只领取已到重试时间的记录
+        :param failed_before: 只领取最后一次失败早于该时间的记录，用于同一轮中不重复领取
+        :return: [{"url", "folder", "time_stamp", "attempts", "last_error"}, ...]
+        """
+        now = now or time.time()
+        sql = "SELECT url, folder, time_stamp, attempts, last_error FROM failed WHERE claimed_until < ?"
+        params = [now]
+        if folder is not None:
+            sql += " AND folder = ?"
+            params.append(folder)
+        if due_only:
+            sql += " AND next_retry <= ?"
+            params.append(now)
+        if failed_before is not None:
+            sql += " AND last_failed < ?"
+            params.append(failed_before)
+        sql += " ORDER BY next_retry LIMIT ?"
+        params.append(int(limit))
+
+        self._transaction()
+        try:
+            rows = self.conn.execute(sql, params).fetchall()
+            self.conn.executemany(
+                "UPDATE failed SET claimed_until = ? WHERE folder = ? AND url = ?",
+                [(now + CLAIM_TIMEOUT, row[1], row[0]) for row in rows]
+            )
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        return [
+            {"url": url, "folder": folder, "time_stamp": ts, "attempts": attempts, "last_error": error}
+            for url, folder, ts, attempts, error in rows
+        ]
+
+    def count(self, folder: str|None = None) -> int:
+        if folder is None:
+            return self.conn.execute("SELECT COUNT(*) FROM failed").fetchone()[0]
+        return self.conn.execute("SELECT COUNT(*) FROM failed WHERE folder = ?", (folder,)).fetchone()[0]
+
+    def import_json(self, folder: str, json_path: str) -> int:
+        """导入旧的 __failed_download.json，立即可重试"""
+        failed_list = rjson(json_path) or []
+        count = self.record(folder, failed_list)
+        self.conn.execute("UPDATE failed SET next_retry = 0 WHERE folder = ?", (folder,))
+        return count
+
+def open_failed_ledger(save_dir: str = "./opus") -> FailedLedger:
+    """
+    打开 save_dir 下的 __failed.db，首次打开时导入各用户文件夹中旧的 __failed_download.json
+    """
+    db_path = os.path.join(save_dir, FAILED_DB_NAME)
+    is_new = not os.path.exists(db_path)
+    ledger = FailedLedger(db_path)
+    if is_new and os.path.isdir(save_dir):
+        for name in os.listdir(save_dir):
+            json_path = os.path.join(save_dir, name, LEGACY_FAILED_NAME)
+            if os.path.isfile(json_path):
+                count = ledger.import_json(name, json_path)
+                print(f"已从 {json_path} 导入 {count} 条失败记录")
+    return ledger
+
+if __name__ == '__main__':
+    with open_failed_ledger("./opus") as ledger:
+        print(f"共 {ledger.count()} 条下载失败记录")
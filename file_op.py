@@ -1,8 +1,14 @@
 import json
 
-def w2json(json_file_name: str, json_dict, mode: str = 'w'):
+def w2json(json_file_name: str, json_dict, mode: str = 'w', compact: bool = False):
+    """
+    :param compact: 紧凑格式（无缩进），文件大小约为缩进格式的一半
+    """
     with open(json_file_name, mode, encoding='utf-8') as f:
-        json.dump(json_dict, f, indent=4, ensure_ascii=False)
+        if compact:
+            json.dump(json_dict, f, separators=(',', ':'), ensure_ascii=False)
+        else:
+            json.dump(json_dict, f, indent=4, ensure_ascii=False)
 
 def w2file(file_name: str, msg: str, mode: str = 'w'):
     with open(file_name, mode, encoding='utf-8') as f:
@@ -15,4 +21,69 @@ def rjson(json_file_name: str):
         return data
     except Exception as e:
         print(e)
-        return None
\ No newline at end of file
+        return None
+
+_WHITESPACE = ' \t\n\r'
+# 数组中一个数字之后可能出现的字符
+_NUMBER_END = _WHITESPACE + ',]'
+
+def iter_json_array(json_file_name: str, chunk_size: int = 64 * 1024):
+    """
+    逐条读取 JSON 数组文件中的元素，不把整个数组载入内存，可随时停止迭代。
+    文件格式错误时抛出 json.JSONDecodeError。
+    """
+    decoder = json.JSONDecoder()
+    with open(json_file_name, 'r', encoding='utf-8') as f:
+        buf = ''
+        pos = 0
+        eof = False
+
+        def skip_whitespace() -> bool:
+            """跳过空白，缓冲区读完时继续读取；到达文件末尾返回 False"""
+            nonlocal buf, pos, eof
+            while True:
+                while pos < len(buf) and buf[pos] in _WHITESPACE:
+                    pos += 1
+                if pos < len(buf):
+                    return True
+                if eof:
+                    return False
+                buf = f.read(chunk_size)
+                pos = 0
+                eof = not buf
+
+        if not skip_whitespace() or buf[pos] != '[':
+            raise json.JSONDecodeError("需要 JSON 数组", buf, pos)
+        pos += 1
+
+        first = True
+        while True:
+            if not skip_whitespace():
+                raise json.JSONDecodeError("数组未结束", buf, pos)
+            if buf[pos] == ']':
+                return
+            if not first:
+                if buf[pos] != ',':
+                    raise json.JSONDecodeError("需要 ','", buf, pos)
+                pos += 1
+                if not skip_whitespace():
+                    raise json.JSONDecodeError("数组未结束", buf, pos)
+            first = False
+
+            while True:
+                try:
+                    obj, end = decoder.raw_decode(buf, pos)
+                    # 元素恰好在缓冲区末尾结束时需读入更多数据后重新解析；
+                    # 数字后面不是分隔符时（如 "12." 或 "1e" 被截断）同样可能尚未读完
+                    if eof or (end < len(buf) and (
+                            not isinstance(obj, (int, float)) or buf[end] in _NUMBER_END)):
+                        break
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                more = f.read(chunk_size)
+                eof = not more
+                buf = buf[pos:] + more
+                pos = 0
+            yield obj
+            pos = end
@@ -0,0 +1,151 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+from file_op import iter_json_array, rjson
+from info_store import INFO_DB_NAME, INFO_JSON_NAME, InfoStore
+
+FOLDER_INDEX_NAME = '__folders.json'
+
+# 同一进程内的线程先获取此锁，再获取跨进程的文件锁
+_index_lock = threading.Lock()
+
+@contextmanager
+def index_lock(save_dir: str):
+    """
+    __folders.json 的读-改-写锁。预览应用的后台线程、爬虫和常驻进程都会更新索引，
+    不加锁时后写入的一方会覆盖另一方的更新。
+    """
+    lock_path = os.path.join(save_dir, FOLDER_INDEX_NAME + '.lock')
+    with _index_lock:
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        # LK_LOCK 重试约 10 秒后仍未获得锁，继续等待
+                        pass
+            yield
+        finally:
+            # 关闭文件时自动释放锁
+            os.close(fd)
+
+def folder_mtime(folder_path: str) -> int:
+    """
+    文件夹元数据的更新时间（纳秒）：有 __info.db 时取它与 WAL 文件中较新的 mtime
+    （写入先进入 __info.db-wal），只有旧的 __info.json 时取它的 mtime
+    """
+    db_path = os.path.join(folder_path, INFO_DB_NAME)
+    if os.path.exists(db_path):
+        mtime = os.stat(db_path).st_mtime_ns
+        wal_path = db_path + '-wal'
+        if os.path.exists(wal_path):
+            mtime = max(mtime, os.stat(wal_path).st_mtime_ns)
+        return mtime
+    return os.stat(os.path.join(folder_path, INFO_JSON_NAME)).st_mtime_ns
+
+def summarize_folder(folder_path: str) -> dict:
+    """
+    统计用户文件夹：动态数量、最新动态ID、预览图（最近一条带图动态的首张图）
+
+    :return: {"count", "latest_id", "preview", "preview_local", "updated", "mtime"}
+    """
+    mtime = folder_mtime(folder_path)
+    db_path = os.path.join(folder_path, INFO_DB_NAME)
+    preview = None
+    if os.path.isfile(db_path):
+        with InfoStore(db_path) as store:
+            count = len(store)
+            latest_id = store.latest_id()
+            # 从新到旧，找到第一条带图的动态即停止
+            for post in store.iter_posts():
+                pictures = post.get('item', {}).get('pictures', [])
+                if pictures:
+                    preview = pictures[0]
+                    break
+    else:
+        # 流式遍历 __info.json，不要求文件有序
+        count = 0
+        latest_id = 0
+        preview_id = 0
+        for post in iter_json_array(os.path.join(folder_path, INFO_JSON_NAME)):
+            count += 1
+            dynamic_id = int(post.get('dynamic_id') or 0)
+            latest_id = max(latest_id, dynamic_id)
+            pictures = post.get('item', {}).get('pictures', [])
+            if pictures and dynamic_id >= preview_id:
+                preview_id = dynamic_id
+                preview = pictures[0]
+
+    if preview:
+        preview = preview.split('?', 1)[0]
+    return {
+        "count": count,
+        "latest_id": latest_id,
+        "preview": preview,
+        "preview_local": bool(preview) and os.path.isfile(os.path.join(folder_path, os.path.basename(preview))),
+        "updated": int(time.time()),
+        "mtime": mtime,
+    }
+
+def load_folder_index(save_dir: str = "./opus") -> dict:
+    """读取 {文件夹名: 统计信息}，文件不存在或损坏时返回空字典"""
+    index_path = os.path.join(save_dir, FOLDER_INDEX_NAME)
+    if not os.path.exists(index_path):
+        return {}
+    return rjson(index_path) or {}
+
+def save_folder_index(save_dir: str, index: dict):
+    """先写本次独有的临时文件再替换，多个写入方不会共用同一个临时文件"""
+    index_path = os.path.join(save_dir, FOLDER_INDEX_NAME)
+    fd, tmp_path = tempfile.mkstemp(prefix=FOLDER_INDEX_NAME + '.', suffix='.tmp', dir=save_dir)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def update_folders(save_dir: str, names: list) -> dict:
+    """重新统计指定的用户文件夹并写回索引，返回更新后的索引"""
+    summaries = {}
+    for name in names:
+        folder_path = os.path.join(save_dir, name)
+        try:
+            summaries[name] = summarize_folder(folder_path)
+        except Exception as e:
+            print(f"[WARN] 统计 {name} 失败：{e}")
+    with index_lock(save_dir):
+        index = load_folder_index(save_dir)
+        index.update(summaries)
+        save_folder_index(save_dir, index)
+    return index
+
+def rebuild_all(save_dir: str = "./opus"):
+    names = [
+        name for name in os.listdir(save_dir)
+        if os.path.isfile(os.path.join(save_dir, name, INFO_JSON_NAME))
+        or os.path.isfile(os.path.join(save_dir, name, INFO_DB_NAME))
+    ]
+    index = update_folders(save_dir, names)
+    print(f"已统计 {len(index)} 个用户文件夹")
+
+if __name__ == '__main__':
+    rebuild_all("./opus")
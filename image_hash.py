@@ -0,0 +1,342 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from thumbnail import IMAGE_EXTS
+
+HASH_DB_NAME = '__hashes.db'
+DUP_REPORT_NAME = '__duplicates.json'
+
+# 两张图片的 pHash 汉明距离不超过该值时视为重复（共 64 位）
+DEFAULT_THRESHOLD = 6
+
+# pHash：缩放到 32x32 做 DCT，取左上角 8x8 低频系数
+_DCT_SIZE = 32
+_DCT_KEEP = 8
+_k = np.arange(_DCT_SIZE)
+_DCT = np.sqrt(2 / _DCT_SIZE) * np.cos(np.pi * (2 * _k[None, :] + 1) * _k[:, None] / (2 * _DCT_SIZE))
+_DCT[0] /= np.sqrt(2)
+
+# 没有 np.bitwise_count（NumPy < 2.0）时按字节查表计算 popcount
+_POPCOUNT8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.astype(np.uint8)).tobytes(), 'big')
+
+def image_hashes(path: str) -> tuple:
+    """
+    计算图片的 pHash 与 dHash（均为 64 位无符号整数）
+
+    :return: (phash, dhash, width, height)
+    """
+    with Image.open(path) as img:
+        width, height = img.size
+        # JPEG 解码时直接缩小，大图只需解码一小部分像素
+        img.draft('L', (_DCT_SIZE * 2, _DCT_SIZE * 2))
+        gray = img.convert('L')
+        pixels = np.asarray(gray.resize((_DCT_SIZE, _DCT_SIZE), Image.BILINEAR), dtype=np.float64)
+        small = np.asarray(gray.resize((9, 8), Image.BILINEAR), dtype=np.int16)
+
+    dct = _DCT @ pixels @ _DCT.T
+    low = dct[:_DCT_KEEP, :_DCT_KEEP].flatten()
+    # 直流分量不参与中位数
+    phash = _bits_to_int(low > np.median(low[1:]))
+    dhash = _bits_to_int((small[:, 1:] > small[:, :-1]).flatten())
+    return phash, dhash, width, height
+
+def _hash_task(path: str) -> tuple:
+    """进程池任务，失败时返回 (path, None)"""
+    try:
+        return path, image_hashes(path)
+    except Exception as e:
+        print(f"计算哈希失败 {path}：{e}")
+        return path, None
+
+def hamming(hashes: np.ndarray, h) -> np.ndarray:
+    """hashes（uint64 数组）与 h 逐个计算汉明距离"""
+    x = np.bitwise_xor(hashes, np.uint64(h))
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x)
+    return _POPCOUNT8[x.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+class MultiIndexHash:
+    """
+    多索引哈希表：把 64 位哈希切成 threshold + 1 段，每段建一个有序索引。
+    汉明距离不超过 threshold 的两个哈希至少有一段完全相同（抽屉原理），
+    查询时只需比较任一段相同的候选项，再用 NumPy 批量计算汉明距离。
+    """
+    def __init__(self, hashes: np.ndarray, threshold: int = DEFAULT_THRESHOLD):
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.threshold = threshold
+        chunks = min(64, threshold + 1)
+        bounds = np.linspace(0, 64, chunks + 1).astype(int)
+        self.tables = []
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            shift, mask = np.uint64(lo), np.uint64((1 << int(hi - lo)) - 1)
+            keys = (self.hashes >> shift) & mask
+            order = np.argsort(keys, kind='stable')
+            self.tables.append((shift, mask, keys[order], order))
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def query(self, h: int) -> tuple:
+        """
+        :return: (下标数组, 距离数组)，只包含距离不超过 threshold 的项
+        """
+        h = np.uint64(h)
+        found = []
+        for shift, mask, sorted_keys, order in self.tables:
+            key = (h >> shift) & mask
+            lo = np.searchsorted(sorted_keys, key, 'left')
+            hi = np.searchsorted(sorted_keys, key, 'right')
+            if hi > lo:
+                found.append(order[lo:hi])
+        if not found:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint8)
+        candidates = np.unique(np.concatenate(found))
+        distances = hamming(self.hashes[candidates], h)
+        keep = distances <= self.threshold
+        return candidates[keep], distances[keep]
+
+    def pairs(self):
+        """逐个 yield 距离不超过 threshold 的 (i, j, 距离)，i < j"""
+        for i, h in enumerate(self.hashes):
+            indices, distances = self.query(h)
+            for j, d in zip(indices, distances):
+                if j > i:
+                    yield i, int(j), int(d)
+
+def find_clusters(records: list, threshold: int = DEFAULT_THRESHOLD) -> list:
+    """
+    把近似重复的图片聚成簇，每簇保留分辨率最高（其次文件最大）的一张
+
+    :param records: [{"name", "phash", "width", "height", "size"}, ...]
+    :return: [{"keep": name, "duplicates": [{"name", "distance"}, ...]}, ...]，按簇大小从大到小
+    """
+    if len(records) < 2:
+        return []
+    hashes = np.array([r["phash"] for r in records], dtype=np.uint64)
+    index = MultiIndexHash(hashes, threshold)
+
+    parent = list(range(len(records)))
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    for i, j, _ in index.pairs():
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[rj] = ri
+
+    groups = {}
+    for i in range(len(records)):
+        groups.setdefault(find(i), []).append(i)
+
+    clusters = []
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        members.sort(key=lambda i: (-(records[i]["width"] or 0) * (records[i]["height"] or 0),
+                                    -(records[i]["size"] or 0), records[i]["name"]))
+        keep = members[0]
+        distances = hamming(hashes[members[1:]], hashes[keep])
+        clusters.append({
+            "keep": records[keep]["name"],
+            "duplicates": [
+                {"name": records[i]["name"], "distance": int(d)}
+                for i, d in zip(members[1:], distances)
+            ],
+        })
+    clusters.sort(key=lambda c: len(c["duplicates"]), reverse=True)
+    return clusters
+
+def _to_signed(h: int) -> int:
+    """SQLite 的 INTEGER 为有符号 64 位"""
+    return h - (1 << 64) if h >= 1 << 63 else h
+
+def _to_unsigned(h: int) -> int:
+    return h + (1 << 64) if h < 0 else h
+
+class HashStore:
+    """
+    图片感知哈希的缓存（SQLite），位于 ./opus/__hashes.db。
+    按 (文件夹, 文件名) 记录哈希与文件的 mtime/size，只有新增或变化的图片需要重新计算；
+    bfs 文件名本身是内容哈希，其他文件夹中已计算过的同名图片直接复用。
+    """
+    def __init__(self, db_path: str):
+        self.path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS hashes (
+                folder TEXT NOT NULL,
+                name TEXT NOT NULL,
+                phash INTEGER NOT NULL,
+                dhash INTEGER NOT NULL,
+                width INTEGER,
+                height INTEGER,
+                size INTEGER,
+                mtime INTEGER,
+                PRIMARY KEY (folder, name)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS hashes_name ON hashes (name)")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def folder_state(self, folder: str) -> dict:
+        """{文件名: (mtime, size)}"""
+        rows = self.conn.execute("SELECT name, mtime, size FROM hashes WHERE folder = ?", (folder,))
+        return {name: (mtime, size) for name, mtime, size in rows}
+
+    def lookup_name(self, name: str) -> tuple|None:
+        """其他文件夹中同名图片的 (phash, dhash, width, height)"""
+        row = self.conn.execute(
+            "SELECT phash, dhash, width, height FROM hashes WHERE name = ? LIMIT 1", (name,)
+        ).fetchone()
+        return (_to_unsigned(row[0]), _to_unsigned(row[1]), row[2], row[3]) if row else None
+
+    def put(self, folder: str, rows: list):
+        """:param rows: [(name, phash, dhash, width, height, size, mtime), ...]"""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO hashes (folder, name, phash, dhash, width, height, size, mtime) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(folder, name, _to_signed(p), _to_signed(d), w, h, size, mtime)
+                 for name, p, d, w, h, size, mtime in rows]
+            )
+
+    def remove(self, folder: str, names: list):
+        with self.conn:
+            self.conn.executemany("DELETE FROM hashes WHERE folder = ? AND name = ?",
+                                  [(folder, name) for name in names])
+
+    def records(self, folder: str|None = None) -> list:
+        """find_clusters 使用的记录；folder 为 None 时返回所有文件夹，name 为 文件夹/文件名"""
+        if folder is not None:
+            sql = "SELECT folder, name, phash, width, height, size FROM hashes WHERE folder = ?"
+            params = (folder,)
+        else:
+            # 不同文件夹中的同名图片是同一文件的硬链接，只取一张
+            sql = "SELECT MIN(folder), name, phash, width, height, size FROM hashes GROUP BY name"
+            params = ()
+        return [
+            {"name": name if folder is not None else f"{f}/{name}", "phash": _to_unsigned(p),
+             "width": w, "height": h, "size": size}
+            for f, name, p, w, h, size in self.conn.execute(sql, params)
+        ]
+
+def hash_folder(store: HashStore, save_dir: str, folder: str, pool: ProcessPoolExecutor) -> int:
+    """
+    增量计算文件夹中新增或变化图片的哈希，并删除已不存在的图片的记录
+
+    :return: 新计算（含复用）的图片数，为 0 表示文件夹没有变化
+    """
+    folder_path = os.path.join(save_dir, folder)
+    known = store.folder_state(folder)
+    current = {}
+    for entry in os.scandir(folder_path):
+        if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTS):
+            st = entry.stat()
+            current[entry.name] = (st.st_mtime_ns, st.st_size)
+
+    removed = [name for name in known if name not in current]
+    if removed:
+        store.remove(folder, removed)
+
+    rows = []
+    todo = []
+    for name, (mtime, size) in current.items():
+        if known.get(name) == (mtime, size):
+            continue
+        cached = store.lookup_name(name) if name not in known else None
+        if cached:
+            rows.append((name, *cached, size, mtime))
+        else:
+            todo.append(name)
+
+    for path, result in pool.map(_hash_task, [os.path.join(folder_path, n) for n in todo], chunksize=32):
+        if result:
+            name = os.path.basename(path)
+            rows.append((name, *result, *current[name][::-1]))
+    store.put(folder, rows)
+    return len(rows) + len(removed)
+
+def write_report(path: str, clusters: list, threshold: int):
+    """先写临时文件再替换"""
+    report = {
+        "threshold": threshold,
+        "generated": int(time.time()),
+        "clusters": clusters,
+    }
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def update_all(save_dir: str = "./opus", threshold: int = DEFAULT_THRESHOLD, workers: int|None = None,
+               archive: bool = False, force: bool = False):
+    """
+    为 save_dir 下每个用户文件夹增量计算图片哈希，有变化的文件夹重新生成 __duplicates.json
+
+    :param archive: 同时在所有文件夹之间查找重复，结果写入 save_dir/__duplicates.json
+    :param force: 忽略缓存，重新生成所有文件夹的报告
+    """
+    folders = sorted(
+        name for name in os.listdir(save_dir)
+        if not name.startswith('__') and os.path.isdir(os.path.join(save_dir, name))
+    )
+    total_clusters = 0
+    with HashStore(os.path.join(save_dir, HASH_DB_NAME)) as store, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        for folder in folders:
+            changed = hash_folder(store, save_dir, folder, pool)
+            report_path = os.path.join(save_dir, folder, DUP_REPORT_NAME)
+            if not changed and not force and os.path.exists(report_path):
+                continue
+            clusters = find_clusters(store.records(folder), threshold)
+            write_report(report_path, clusters, threshold)
+            total_clusters += len(clusters)
+            if clusters:
+                print(f"{folder}：{len(clusters)} 组重复图片")
+        if archive:
+            clusters = find_clusters(store.records(), threshold)
+            write_report(os.path.join(save_dir, DUP_REPORT_NAME), clusters, threshold)
+            print(f"所有文件夹之间：{len(clusters)} 组重复图片")
+    print(f"已检查 {len(folders)} 个文件夹，新发现 {total_clusters} 组重复图片")
+
+def load_duplicates(folder_path: str) -> set:
+    """读取文件夹的 __duplicates.json，返回可以隐藏的重复图片（每簇保留的那张除外）的文件名"""
+    report_path = os.path.join(folder_path, DUP_REPORT_NAME)
+    try:
+        with open(report_path, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    return {dup["name"] for cluster in report.get("clusters", []) for dup in cluster["duplicates"]}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='用感知哈希查找近似重复的图片')
+    parser.add_argument('save_dir', nargs='?', default='./opus')
+    parser.add_argument('--threshold', type=int, default=DEFAULT_THRESHOLD, help='pHash 汉明距离阈值')
+    parser.add_argument('--workers', type=int, default=None, help='进程数，默认为 CPU 核数')
+    parser.add_argument('--archive', action='store_true', help='同时在所有文件夹之间查找重复')
+    parser.add_argument('--force', action='store_true', help='重新生成所有报告')
+    args = parser.parse_args()
+    update_all(args.save_dir, args.threshold, args.workers, args.archive, args.force)
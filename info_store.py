@@ -0,0 +1,209 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+
+from file_op import iter_json_array
+
+INFO_DB_NAME = '__info.db'
+INFO_JSON_NAME = '__info.json'
+
+# 迁移旧 __info.json 时使用的临时库后缀
+MIGRATING_SUFFIX = '.migrating'
+
+def post_pub_ts(post: dict) -> int|None:
+    """取动态的发布时间戳，旧记录没有 pub_ts 时由 time 字段换算"""
+    if post.get('pub_ts') is not None:
+        return int(post['pub_ts'])
+    try:
+        return int(time.mktime(time.strptime(post.get('time', ''), "%Y-%m-%d %H:%M:%S")))
+    except ValueError:
+        return None
+
+class InfoStore:
+    """
+    以 dynamic_id 为主键的动态元数据存储（SQLite）。
+    新增动态只需插入新行，每次 add 在一个事务中提交，中途崩溃不会破坏已有数据。
+    """
+    def __init__(self, db_path: str):
+        self.path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS posts (
+                dynamic_id INTEGER PRIMARY KEY,
+                pub_ts INTEGER,
+                data TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+    def latest_id(self) -> int:
+        """已保存的最大动态ID，没有记录时返回 0"""
+        row = self.conn.execute("SELECT MAX(dynamic_id) FROM posts").fetchone()
+        return row[0] or 0
+
+    def latest_pub_ts(self, max_id: int|None = None) -> int|None:
+        """
+        已保存动态的最新发布时间戳，没有记录时返回 None
+
+        :param max_id: 只看 dynamic_id 不大于该值的动态
+        """
+        if max_id is None:
+            row = self.conn.execute("SELECT MAX(pub_ts) FROM posts").fetchone()
+        else:
+            row = self.conn.execute("SELECT MAX(pub_ts) FROM posts WHERE dynamic_id <= ?", (max_id,)).fetchone()
+        return row[0]
+
+    def add(self, posts: list) -> int:
+        """
+        原子地写入一批动态，已存在的 dynamic_id 会被覆盖
+
+        :return: 写入的条数
+        """
+        rows = [
+            (int(post['dynamic_id']), post_pub_ts(post), json.dumps(post, ensure_ascii=False))
+            for post in posts
+        ]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO posts (dynamic_id, pub_ts, data) VALUES (?, ?, ?)", rows
+            )
+        return len(rows)
+
+    def iter_posts(self, before_id: int|None = None, limit: int|None = None):
+        """
+        按 dynamic_id 从新到旧遍历动态
+
+        :param before_id: 只返回 dynamic_id 小于该值的动态
+        :param limit: 最多返回的条数
+        """
+        sql = "SELECT data FROM posts"
+        params = []
+        if before_id is not None:
+            sql += " WHERE dynamic_id < ?"
+            params.append(int(before_id))
+        sql += " ORDER BY dynamic_id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        for (data,) in self.conn.execute(sql, params):
+            yield json.loads(data)
+
+    def export_json(self, json_path: str):
+        """
+        导出为兼容旧格式的 __info.json（从新到旧，紧凑格式，每行一条动态）。
+        先写临时文件再替换，写入中途崩溃不会损坏原文件。
+        """
+        tmp_path = json_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('[')
+            for i, post in enumerate(self.iter_posts()):
+                f.write(',\n' if i else '\n')
+                f.write(json.dumps(post, separators=(',', ':'), ensure_ascii=False))
+            f.write('\n]')
+        os.replace(tmp_path, json_path)
+
+    def migrate_from_json(self, json_path: str, batch_size: int = 1000) -> int:
+        """
+        从旧的 __info.json 流式导入全部动态，返回导入条数。
+        读取失败时抛出 OSError / json.JSONDecodeError，已导入的部分保留在库中。
+        """
+        count = 0
+        batch = []
+        for post in iter_json_array(json_path):
+            batch.append(post)
+            if len(batch) >= batch_size:
+                count += self.add(batch)
+                batch = []
+        return count + self.add(batch)
+
+def migrate_json(save_path: str) -> int:
+    """
+    把用户文件夹下旧的 __info.json 迁移为 __info.db。
+    先导入到临时库 __info.db.migrating，全部导入后再替换为 __info.db，
+    中途中断时 __info.db 不存在，下次打开会重新迁移，不会把不完整的库当作已迁移。
+    __info.json 读取失败时，把它改名为 __info.json.bak 保留下来，避免之后导出时被不完整的数据覆盖。
+
+    :return: 导入条数
+    """
+    db_path = os.path.join(save_path, INFO_DB_NAME)
+    json_path = os.path.join(save_path, INFO_JSON_NAME)
+    tmp_path = db_path + MIGRATING_SUFFIX
+    # 清理上次中断留下的临时库
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(tmp_path + suffix):
+            os.remove(tmp_path + suffix)
+
+    store = InfoStore(tmp_path)
+    try:
+        try:
+            count = store.migrate_from_json(json_path)
+        except (OSError, json.JSONDecodeError) as e:
+            count = len(store)
+            backup_path = json_path + '.bak'
+            print(f"[WARN] 读取 {json_path} 失败：{e}，仅迁移了 {count} 条，原文件已保留为 {backup_path}")
+            os.replace(json_path, backup_path)
+        # 切换回单文件日志，关闭后临时库只有一个文件，可以直接改名
+        store.conn.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        store.close()
+    os.replace(tmp_path, db_path)
+    return count
+
+def open_info_store(save_path: str) -> InfoStore:
+    """
+    打开用户文件夹下的 __info.db，不存在且有旧的 __info.json 时先完整迁移
+    """
+    db_path = os.path.join(save_path, INFO_DB_NAME)
+    json_path = os.path.join(save_path, INFO_JSON_NAME)
+    if not os.path.exists(db_path) and os.path.exists(json_path):
+        count = migrate_json(save_path)
+        print(f"已从 {json_path} 迁移 {count} 条动态")
+    return InfoStore(db_path)
+
+def migrate_all(save_dir: str = "./opus"):
+    """把 save_dir 下所有用户文件夹的 __info.json 一次性迁移到 __info.db"""
+    for name in os.listdir(save_dir):
+        save_path = os.path.join(save_dir, name)
+        if os.path.isfile(os.path.join(save_path, INFO_JSON_NAME)):
+            with open_info_store(save_path):
+                pass
+
+def export_all(save_dir: str = "./opus", names: list|None = None):
+    """
+    把用户文件夹的 __info.db 导出为兼容旧格式的 __info.json。
+    爬取时默认不再导出（每次都要重写整个文件），需要旧格式时运行此命令。
+
+    :param names: 只导出这些用户文件夹，为 None 时导出全部
+    """
+    for name in names or os.listdir(save_dir):
+        save_path = os.path.join(save_dir, name)
+        if os.path.isfile(os.path.join(save_path, INFO_DB_NAME)):
+            with open_info_store(save_path) as store:
+                store.export_json(os.path.join(save_path, INFO_JSON_NAME))
+            print(f"已导出 {name}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='动态元数据：迁移旧的 __info.json，或从 __info.db 导出 __info.json')
+    parser.add_argument('command', nargs='?', choices=('migrate', 'export'), default='migrate')
+    parser.add_argument('--save-dir', default='./opus')
+    parser.add_argument('--user', action='append', help='只导出这些用户文件夹，可多次指定')
+    args = parser.parse_args()
+    if args.command == 'export':
+        export_all(args.save_dir, args.user)
+    else:
+        migrate_all(args.save_dir)
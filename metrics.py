@@ -0,0 +1,158 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 延迟直方图的桶上限（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+class Histogram:
+    """固定桶的直方图，按桶估计分位数"""
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """返回第一个累计数量达到 q 的桶的上限（不超过最大值），落在最后一个桶时返回最大值"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for i, n in enumerate(self.counts):
+            cumulative += n
+            if cumulative >= target:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "avg": round(self.sum / self.count, 6) if self.count else 0.0,
+            "p50": round(self.quantile(0.5), 6),
+            "p90": round(self.quantile(0.9), 6),
+            "p99": round(self.quantile(0.99), 6),
+            "max": round(self.max, 6),
+        }
+
+class Metrics:
+    """
+    进程内的计数器与直方图。
+    计数器：api_requests、download_bytes 等累计值；直方图：各阶段每次调用的耗时（秒）。
+    加锁后可在 Prometheus 接口所在的线程中安全读取。
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}
+        self.histograms = {}
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.counters = {}
+            self.histograms = {}
+
+    def inc(self, name: str, value: float = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(value)
+
+    @contextmanager
+    def timer(self, name: str):
+        """记录 with 块的耗时到直方图 name，异常退出时同样记录"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        """当前所有指标，以及由 download_bytes 计算的平均下载速度"""
+        with self.lock:
+            elapsed = time.time() - self.started
+            counters = dict(self.counters)
+            histograms = {name: h.summary() for name, h in self.histograms.items()}
+        download_time = histograms.get("download_seconds", {}).get("sum", 0)
+        return {
+            "elapsed": round(elapsed, 3),
+            "counters": counters,
+            "histograms": histograms,
+            "throughput": {
+                "download_bytes_per_sec": round(counters.get("download_bytes", 0) / elapsed, 1) if elapsed else 0.0,
+                # 单个下载连接的平均速度（不含排队与跳过的图片）
+                "per_download_bytes_per_sec":
+                    round(counters.get("download_bytes", 0) / download_time, 1) if download_time else 0.0,
+            },
+        }
+
+    def prometheus(self) -> str:
+        """Prometheus 文本格式，指标名加 bili_ 前缀"""
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE bili_{name} counter")
+                lines.append(f"bili_{name} {value}")
+            for name, h in sorted(self.histograms.items()):
+                lines.append(f"# TYPE bili_{name} histogram")
+                cumulative = 0
+                for bound, n in zip(h.buckets, h.counts):
+                    cumulative += n
+                    lines.append(f'bili_{name}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'bili_{name}_bucket{{le="+Inf"}} {h.count}')
+                lines.append(f"bili_{name}_sum {h.sum}")
+                lines.append(f"bili_{name}_count {h.count}")
+        return "\n".join(lines) + "\n"
+
+# 全局指标，各模块直接 import 使用
+metrics = Metrics()
+
+def append_report(report_path: str, record: dict):
+    """向 JSON-lines 报告追加一行"""
+    os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+    record = {"time": int(time.time()), **record}
+    with open(report_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+def serve_metrics(port: int, host: str = '127.0.0.1'):
+    """
+    在后台线程中提供 http://host:port/metrics（Prometheus 文本格式），进程退出时自动结束
+
+    :return: HTTPServer，调用 shutdown() 可提前停止
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"指标接口已启动：http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import random
+import time
+
+import aiohttp
+from aiohttp import web
+from bilibili_api.exceptions import ResponseCodeException
+
+# 本地模拟的 B 站动态接口与 hdslb 图片 CDN，用于离线压测：
+#   python ./mock_bili.py --port 8790 --latency 0.05 --error-rate 0.01 --rate-limit 20
+# 动态接口：GET /x/polymer/web-dynamic/v1/feed/space?host_mid=<uid>&offset=<offset>
+#   返回与 get_dynamics_new 相同的 data 结构（items、offset、has_more），超过速率限制时返回 -352
+# 图片：GET/HEAD /bfs/new_dyn/<uid>_<序号>_<图序号>.jpg，按 error_rate 随机返回 503
+
+FEED_PATH = '/x/polymer/web-dynamic/v1/feed/space'
+
+# 动态ID基数，使生成的ID与真实ID一样超过 JS 安全整数
+ID_BASE = 10 ** 18
+
+class MockConfig:
+    """
+    :param posts: 每个用户的动态数
+    :param page_size: 每页动态数
+    :param images: 每条图文动态的图片数
+    :param draw_ratio: 图文动态所占比例，其余为文字动态
+    :param latency: 动态接口的响应延迟（秒）
+    :param cdn_latency: 图片的响应延迟（秒）
+    :param error_rate: 图片请求返回 503 的概率
+    :param rate_limit: 动态接口每秒允许的请求数，0 表示不限制
+    :param image_size: 图片大小（字节）
+    :param post_interval: 相邻两条动态的发布间隔（秒）
+    """
+    def __init__(self, posts: int = 120, page_size: int = 12, images: int = 3, draw_ratio: float = 0.8,
+                 latency: float = 0.05, cdn_latency: float = 0.02, error_rate: float = 0.0,
+                 rate_limit: float = 0, image_size: int = 200 * 1024, post_interval: int = 6 * 3600):
+        self.posts = posts
+        self.page_size = page_size
+        self.images = images
+        self.draw_ratio = draw_ratio
+        self.latency = latency
+        self.cdn_latency = cdn_latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.image_size = image_size
+        self.post_interval = post_interval
+
+def dynamic_id(uid: int, k: int, config: MockConfig) -> int:
+    """用户 uid 从新到旧第 k 条动态的ID"""
+    return ID_BASE + uid * 10 ** 7 + config.posts - k
+
+def make_item(base_url: str, uid: int, k: int, config: MockConfig, now: int) -> dict:
+    """生成第 k 条动态，是否为图文动态由 (uid, k) 决定，多次请求结果相同"""
+    is_draw = random.Random(uid * 1000003 + k).random() < config.draw_ratio
+    item = {
+        "id_str": str(dynamic_id(uid, k, config)),
+        "type": "DYNAMIC_TYPE_DRAW" if is_draw else "DYNAMIC_TYPE_WORD",
+        "modules": {
+            "module_author": {"mid": uid, "pub_ts": now - k * config.post_interval},
+            "module_dynamic": {"major": None},
+        },
+    }
+    if is_draw:
+        item["modules"]["module_dynamic"]["major"] = {
+            "type": "MAJOR_TYPE_OPUS",
+            "opus": {
+                "title": f"动态 {uid}-{k}",
+                "summary": {"text": f"用户 {uid} 的第 {config.posts - k} 条图文动态"},
+                "pics": [
+                    {"url": f"{base_url}/bfs/new_dyn/{uid}_{k}_{j}.jpg"}
+                    for j in range(config.images)
+                ],
+            },
+        }
+    return item
+
+def create_app(config: MockConfig) -> web.Application:
+    # 所有用户的动态都以同一时刻为最新，保证多次请求的 pub_ts 一致
+    now = int(time.time())
+    body = random.Random(0).randbytes(config.image_size)
+    bucket = {"tokens": config.rate_limit, "last": time.monotonic()}
+    stats = {"api": 0, "throttled": 0, "images": 0, "errors": 0}
+
+    def allow() -> bool:
+        if not config.rate_limit:
+            return True
+        t = time.monotonic()
+        bucket["tokens"] = min(config.rate_limit, bucket["tokens"] + (t - bucket["last"]) * config.rate_limit)
+        bucket["last"] = t
+        if bucket["tokens"] < 1:
+            return False
+        bucket["tokens"] -= 1
+        return True
+
+    async def feed(request):
+        stats["api"] += 1
+        if config.latency:
+            await asyncio.sleep(config.latency)
+        if not allow():
+            stats["throttled"] += 1
+            return web.json_response({"code": -352, "message": "风控校验失败", "data": None})
+
+        uid = int(request.query.get('host_mid', 0))
+        offset = request.query.get('offset') or ''
+        # offset 为上一页最后一条动态的ID
+        start = dynamic_id(uid, 0, config) - int(offset) + 1 if offset else 0
+        end = min(config.posts, start + config.page_size)
+        base_url = f"{request.scheme}://{request.host}"
+        items = [make_item(base_url, uid, k, config, now) for k in range(start, end)]
+        return web.json_response({"code": 0, "message": "0", "data": {
+            "items": items,
+            "offset": items[-1]["id_str"] if items else "",
+            "has_more": end < config.posts,
+        }})
+
+    async def image(request):
+        stats["images"] += 1
+        if config.cdn_latency:
+            await asyncio.sleep(config.cdn_latency)
+        if config.error_rate and random.random() < config.error_rate:
+            stats["errors"] += 1
+            return web.Response(status=503)
+        return web.Response(body=body, content_type='image/jpeg')
+
+    async def get_stats(request):
+        return web.json_response(stats)
+
+    app = web.Application()
+    app.router.add_get(FEED_PATH, feed)
+    app.router.add_get('/bfs/new_dyn/{name}', image)
+    app.router.add_get('/stats', get_stats)
+    return app
+
+def serve(port: int = 8790, config: MockConfig|None = None, host: str = '127.0.0.1'):
+    """启动模拟服务（阻塞）"""
+    web.run_app(create_app(config or MockConfig()), host=host, port=port, print=None,
+                access_log=None)
+
+class MockUser:
+    """
+    代替 bilibili_api.user.User，向模拟服务请求动态。
+    同一进程内的 MockUser 共享 MockUser.session，用完后调用 close_session。
+    """
+    base_url = 'http://127.0.0.1:8790'
+    session = None
+
+    def __init__(self, uid: int):
+        self.uid = uid
+
+    async def get_dynamics_new(self, offset: str = ""):
+        if MockUser.session is None:
+            MockUser.session = aiohttp.ClientSession()
+        params = {"host_mid": self.uid, "offset": offset}
+        async with MockUser.session.get(MockUser.base_url + FEED_PATH, params=params) as resp:
+            resp.raise_for_status()
+            raw = await resp.json()
+        if raw["code"] != 0:
+            raise ResponseCodeException(raw["code"], raw.get("message", ""), raw)
+        return raw["data"]
+
+    @classmethod
+    async def close_session(cls):
+        if cls.session is not None:
+            await cls.session.close()
+            cls.session = None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='本地模拟的 B 站动态接口与图片 CDN')
+    parser.add_argument('--port', type=int, default=8790)
+    parser.add_argument('--posts', type=int, default=120, help='每个用户的动态数')
+    parser.add_argument('--images', type=int, default=3, help='每条图文动态的图片数')
+    parser.add_argument('--latency', type=float, default=0.05, help='动态接口延迟（秒）')
+    parser.add_argument('--cdn-latency', type=float, default=0.02, help='图片延迟（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='图片返回 503 的概率')
+    parser.add_argument('--rate-limit', type=float, default=0, help='动态接口每秒请求数上限，0 为不限')
+    parser.add_argument('--image-size', type=int, default=200 * 1024, help='图片大小（字节）')
+    args = parser.parse_args()
+    print(f"模拟服务已启动：http://127.0.0.1:{args.port}/")
+    serve(args.port, MockConfig(posts=args.posts, images=args.images, latency=args.latency,
+                                cdn_latency=args.cdn_latency, error_rate=args.error_rate,
+                                rate_limit=args.rate_limit, image_size=args.image_size))
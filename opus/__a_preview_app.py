@@ -1,39 +1,305 @@
-from flask import Flask, render_template_string, abort, request
+from flask import Flask, abort, request, jsonify, send_file
+from werkzeug.utils import safe_join
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
 import os
-import json
+import sys
+import time
+import threading
+from urllib.parse import urlencode
+
+# 全文索引模块位于上级目录，与爬虫共用
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from folder_index import folder_mtime, load_folder_index, update_folders
+from file_op import iter_json_array
+from image_hash import DUP_REPORT_NAME, load_duplicates
+from info_store import INFO_DB_NAME, InfoStore
+from search_index import SEARCH_DB_NAME, SearchIndex
+from thumbnail import THUMB_DIR_NAME, THUMB_SIZES, evict, make_thumbnail, thumb_path
 
 # 将 static_folder 设置为当前目录，static_url_path 设置为空字符串，
 # 这样 /<folder>/<filename> 会映射到当前目录下的同名文件。
 app = Flask(__name__, static_folder='.', static_url_path='')
 
-# 启动时预加载所有文件夹的元数据，加速首页加载
-FOLDERS_META = []
-for name in os.listdir('.'):
-    if os.path.isdir(name) and os.path.isfile(os.path.join(name, '__info.json')):
-        folder_path = os.path.join('.', name)
-        json_path = os.path.join(folder_path, '__info.json')
+# 元数据缓存最多保留的动态条数（每条约 1 KiB），按条数而不是文件夹数限制内存
+MAX_CACHED_POSTS = 200_000
+
+class MetaCache:
+    """
+    LRU 元数据缓存：按文件夹缓存整理好的动态列表（读取 __info.db，没有时读取旧的 __info.json），
+    元数据的 mtime 或文件夹的 mtime（新图片下载完成）变化时自动重新加载。
+    容量按缓存的动态总条数计算，文件夹很多但动态不多时全部文件夹都能留在缓存中，
+    逐个扫描全部文件夹（无全文索引时的搜索）不会因为文件夹数超过上限而每次都重新加载。
+    """
+    def __init__(self, max_posts: int = MAX_CACHED_POSTS):
+        self.max_posts = max_posts
+        self.posts = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _discard(self, folder: str):
+        entry = self._data.pop(folder, None)
+        if entry:
+            self.posts -= len(entry[1])
+
+    def invalidate(self, folder: str):
+        with self._lock:
+            self._discard(folder)
+
+    def contains(self, folder: str) -> bool:
+        """是否已缓存（不检查是否过期）"""
+        with self._lock:
+            return folder in self._data
+
+    def get(self, folder: str) -> list|None:
+        """返回文件夹下整理好的动态列表，文件夹或元数据不存在时返回 None"""
+        folder_path = os.path.join('.', folder)
         try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                raw_data = json.load(f)
-        except Exception:
-            raw_data = []
-        # 列表视图: 取最近1条动态的首张图作为预览
+            key = (folder_mtime(folder_path), os.stat(folder_path).st_mtime_ns)
+        except OSError:
+            with self._lock:
+                self._discard(folder)
+            return None
+
+        with self._lock:
+            entry = self._data.get(folder)
+            if entry and entry[0] == key:
+                self._data.move_to_end(folder)
+                return entry[1]
+
+        posts = load_posts(folder)
+        with self._lock:
+            self._discard(folder)
+            self._data[folder] = (key, posts)
+            self.posts += len(posts)
+            # 至少保留刚加载的文件夹
+            while self.posts > self.max_posts and len(self._data) > 1:
+                _, (_, evicted) = self._data.popitem(last=False)
+                self.posts -= len(evicted)
+        return posts
+
+def resolve_images(folder: str, pictures: list) -> list:
+    """本地已下载的图片用本地路径，否则用原始 URL"""
+    image_srcs = []
+    for url in pictures:
+        clean_url = url.split('?', 1)[0]
+        filename = os.path.basename(clean_url)
+        local_file = os.path.join('.', folder, filename)
+        if os.path.isfile(local_file):
+            image_srcs.append(f"/{folder}/{filename}")
+        else:
+            image_srcs.append(clean_url)
+    return image_srcs
+
+def thumb_url(src: str, size: str = 'm') -> str:
+    """本地图片使用缩略图地址，远程图片保持原样"""
+    return f"/thumb/{size}{src}" if src.startswith('/') else src
+
+def post_view(folder: str, entry: dict) -> dict:
+    """把一条动态记录整理为模板使用的格式"""
+    title = entry.get('item', {}).get('title') or ''
+    description = entry.get('item', {}).get('description', '')
+    images = resolve_images(folder, entry.get('item', {}).get('pictures', []))
+    return {
+        'dynamic_id': int(entry.get('dynamic_id') or 0),
+        'title': title,
+        'description': description,
+        'time': entry.get('time', ''),
+        'images': images,
+        'thumbs': [thumb_url(src) for src in images],
+        'folder': folder,
+        'search_text': (title + ' ' + (description or '')).lower()
+    }
+
+def load_posts(folder: str) -> list:
+    db_path = os.path.join('.', folder, INFO_DB_NAME)
+    json_path = os.path.join('.', folder, '__info.json')
+    try:
+        # 边读边转换，不同时保留原始列表
+        if os.path.isfile(db_path):
+            with InfoStore(db_path) as store:
+                posts = [post_view(folder, entry) for entry in store.iter_posts()]
+        else:
+            posts = [post_view(folder, entry) for entry in iter_json_array(json_path)]
+    except Exception:
+        posts = []
+    posts.sort(key=lambda post: post['dynamic_id'], reverse=True)
+    return posts
+
+META_CACHE = MetaCache()
+
+# 每个请求线程使用自己的 SQLite 连接
+_local = threading.local()
+
+def search_index() -> SearchIndex|None:
+    """全文索引尚未建立（未运行过爬虫或 search_index.py）时返回 None"""
+    if not os.path.isfile(SEARCH_DB_NAME):
+        return None
+    if getattr(_local, 'search_index', None) is None:
+        _local.search_index = SearchIndex(SEARCH_DB_NAME)
+    return _local.search_index
+
+SEARCH_PAGE_SIZE = 20
+FEED_PAGE_SIZE = 20
+MAX_FEED_PAGE_SIZE = 100
+
+def stream_feed_slice(folder: str, cursor: int|None, count: int) -> list|None:
+    """
+    流式读取 __info.json，取 dynamic_id 小于 cursor 的 count 条后立即停止。
+    get_opus 导出的文件从新到旧排列；发现文件无序、文件不存在或已在缓存中时返回 None，由调用方使用缓存。
+    """
+    json_path = os.path.join('.', folder, '__info.json')
+    if not os.path.isfile(json_path) or META_CACHE.contains(folder):
+        return None
+    posts = []
+    last_id = None
+    try:
+        for entry in iter_json_array(json_path):
+            dynamic_id = int(entry.get('dynamic_id') or 0)
+            if last_id is not None and dynamic_id > last_id:
+                return None
+            last_id = dynamic_id
+            if cursor is None or dynamic_id < cursor:
+                posts.append(post_view(folder, entry))
+                if len(posts) >= count:
+                    break
+    except (OSError, ValueError):
+        return None
+    return posts
+
+_duplicates = {}
+_duplicates_lock = threading.Lock()
+
+def duplicate_names(folder: str) -> set:
+    """image_hash.py 生成的 __duplicates.json 中可隐藏的图片文件名，按文件 mtime 缓存"""
+    report_path = os.path.join('.', folder, DUP_REPORT_NAME)
+    try:
+        mtime = os.stat(report_path).st_mtime_ns
+    except OSError:
+        return set()
+    with _duplicates_lock:
+        cached = _duplicates.get(folder)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    names = load_duplicates(os.path.join('.', folder))
+    with _duplicates_lock:
+        _duplicates[folder] = (mtime, names)
+    return names
+
+def dedup_posts(folder: str, posts: list) -> list:
+    """去掉近似重复的图片（每组只保留一张），图片全部重复的动态不再显示"""
+    duplicates = duplicate_names(folder)
+    if not duplicates:
+        return posts
+    result = []
+    for post in posts:
+        keep = [i for i, src in enumerate(post['images']) if os.path.basename(src) not in duplicates]
+        if len(keep) == len(post['images']):
+            result.append(post)
+        elif keep:
+            result.append({**post, 'images': [post['images'][i] for i in keep],
+                           'thumbs': [post['thumbs'][i] for i in keep]})
+    return result
+
+def read_posts(folder: str, cursor: int|None, count: int) -> list|None:
+    """
+    取 dynamic_id 小于 cursor 的 count 条动态。
+    有 __info.db 时只查询这一段，否则从缓存的 __info.json 中截取；文件夹不存在时返回 None
+    """
+    db_path = os.path.join('.', folder, INFO_DB_NAME)
+    if os.path.isfile(db_path):
+        with InfoStore(db_path) as store:
+            return [post_view(folder, entry) for entry in store.iter_posts(cursor, count)]
+    posts = stream_feed_slice(folder, cursor, count)
+    if posts is None:
+        cached = META_CACHE.get(folder)
+        if cached is None:
+            return None
+        posts = [post for post in cached if cursor is None or post['dynamic_id'] < cursor][:count]
+    return posts
+
+def feed_page(folder: str, cursor: int|None = None, limit: int = FEED_PAGE_SIZE,
+              dedup: bool = False) -> tuple|None:
+    """
+    取 dynamic_id 小于 cursor 的 limit 条动态。
+    dedup 为 True 时隐藏近似重复的图片，这一页可能少于 limit 条；
+    整页都被隐藏时继续读取后面的页，直到至少剩下一条或没有更多，不返回游标不为空的空页。
+
+    :return: (动态列表, 下一页的 cursor)，没有更多时 cursor 为 None；文件夹不存在时返回 None
+    """
+    while True:
+        posts = read_posts(folder, cursor, limit + 1)
+        if posts is None:
+            return None
+        next_cursor = posts[limit - 1]['dynamic_id'] if len(posts) > limit else None
+        posts = posts[:limit]
+        if dedup:
+            posts = dedup_posts(folder, posts)
+        if posts or next_cursor is None:
+            return posts, next_cursor
+        cursor = next_cursor
+
+def parse_date(value: str|None) -> int|None:
+    """把 YYYY-MM-DD 转为当天 0 点的时间戳"""
+    try:
+        return int(time.mktime(time.strptime(value or '', "%Y-%m-%d")))
+    except ValueError:
+        return None
+
+def list_folders() -> list:
+    return sorted(
+        name for name in os.listdir('.')
+        if os.path.isdir(name) and (os.path.isfile(os.path.join(name, INFO_DB_NAME))
+                                    or os.path.isfile(os.path.join(name, '__info.json')))
+    )
+
+_rebuilding = set()
+_rebuild_lock = threading.Lock()
+
+def rebuild_folders_async(names: list):
+    """在后台线程中重新统计过期的文件夹，同一文件夹不会重复排队"""
+    with _rebuild_lock:
+        names = [name for name in names if name not in _rebuilding]
+        _rebuilding.update(names)
+    if not names:
+        return
+
+    def worker():
+        try:
+            update_folders('.', names)
+        finally:
+            with _rebuild_lock:
+                _rebuilding.difference_update(names)
+
+    threading.Thread(target=worker, daemon=True).start()
+
+def folders_meta() -> list:
+    """
+    首页的文件夹列表，从持久化的 __folders.json 读取预览图；
+    缺失或已过期（文件夹 mtime 变化）的条目在后台重新统计，本次先显示旧数据。
+    """
+    index = load_folder_index('.')
+    meta = []
+    stale = []
+    for name in list_folders():
+        entry = index.get(name)
+        try:
+            if entry is None or entry.get('mtime') != folder_mtime(name):
+                stale.append(name)
+        except OSError:
+            continue
         list_preview = None
-        if raw_data:
-            pictures = raw_data[0].get('item', {}).get('pictures', [])
-            if pictures:
-                clean_url = pictures[0].split('?', 1)[0]
-                filename = os.path.basename(clean_url)
-                local_file = os.path.join(folder_path, filename)
-                if os.path.isfile(local_file):
-                    list_preview = f"/{name}/{filename}"
-                else:
-                    list_preview = clean_url
-        # 网格视图: 取最近1条动态的首张图作为预览
-        grid_preview = list_preview
-        FOLDERS_META.append({'name': name, 'list_preview': list_preview, 'grid_preview': grid_preview})
-
-# 模板：显示所有包含 __info.json 的文件夹列表，带列表/网格切换、预览图片、搜索栏
+        if entry and entry.get('preview'):
+            if entry.get('preview_local'):
+                list_preview = f"/thumb/s/{name}/{os.path.basename(entry['preview'])}"
+            else:
+                list_preview = entry['preview']
+        meta.append({'name': name, 'list_preview': list_preview, 'grid_preview': list_preview})
+    if stale:
+        rebuild_folders_async(stale)
+    return meta
+
+# 模板：显示所有包含 __info.db 或 __info.json 的文件夹列表，带列表/网格切换、预览图片、搜索栏
 template_index = '''
 <!DOCTYPE html>
 <html lang="en">
@@ -120,6 +386,8 @@ template_feed = '''
         body { font-family: Arial, sans-serif; background: #f5f8fa; margin: 0; padding: 0; }
         .container { max-width: 600px; margin: 0 auto; padding: 20px; }
         .back-link { margin-bottom: 20px; display: inline-block; text-decoration: none; color: #1da1f2; cursor: pointer; }
+        .dedup-link { margin-bottom: 15px; font-size: 14px; }
+        .dedup-link a { color: #1da1f2; }
         .post { background: #fff; border: 1px solid #e1e8ed; border-radius: 8px; margin-bottom: 20px; padding: 15px; }
         .post-title { font-size: 16px; font-weight: bold; margin-bottom: 8px; }
         .post-time { color: #657786; font-size: 12px; margin-bottom: 10px; }
@@ -135,6 +403,12 @@ template_feed = '''
     <div class="container">
         <div class="back-link" onclick="window.location='/'">&larr; Back to folders</div>
         <h2>Feed - {{ folder }}</h2>
+        {% if has_duplicates %}
+        <div class="dedup-link">
+            {% if dedup %}<a href="?">显示全部图片</a>{% else %}<a href="?dedup=1">隐藏重复图片</a>{% endif %}
+        </div>
+        {% endif %}
+        <div id="posts">
         {% for post in posts %}
         <div class="post">
             {% if post.title %}
@@ -144,11 +418,13 @@ template_feed = '''
             <div class="post-desc">{{ post.description }}</div>
             <div class="post-images">
                 {% for img in post.images %}
-                <img src="{{ img }}" alt="Post image" onclick="openLightbox('{{ img }}')">
+                <img src="{{ post.thumbs[loop.index0] }}" data-full="{{ img }}" alt="Post image" loading="lazy" onclick="openLightbox(this.dataset.full)">
                 {% endfor %}
             </div>
         </div>
         {% endfor %}
+        </div>
+        <div id="sentinel" class="loading">{% if next_cursor %}加载中...{% endif %}</div>
     </div>
     <div id="lightboxOverlay" onclick="closeLightbox()">
         <img id="lightboxImg" src="" alt="">
@@ -163,6 +439,61 @@ template_feed = '''
         function closeLightbox() {
             document.getElementById('lightboxOverlay').style.display = 'none';
         }
+
+        // 无限滚动：接近页面底部时按 cursor 请求下一页
+        let nextCursor = {{ next_cursor | tojson }};
+        let loading = false;
+        const postsEl = document.getElementById('posts');
+        const sentinel = document.getElementById('sentinel');
+
+        function renderPost(post) {
+            const div = document.createElement('div');
+            div.className = 'post';
+            if (post.title) {
+                const title = document.createElement('div');
+                title.className = 'post-title';
+                title.textContent = post.title;
+                div.appendChild(title);
+            }
+            const time = document.createElement('div');
+            time.className = 'post-time';
+            time.textContent = post.time;
+            div.appendChild(time);
+            const desc = document.createElement('div');
+            desc.className = 'post-desc';
+            desc.textContent = post.description || '';
+            div.appendChild(desc);
+            const images = document.createElement('div');
+            images.className = 'post-images';
+            post.images.forEach((src, i) => {
+                const img = document.createElement('img');
+                img.src = post.thumbs[i];
+                img.alt = 'Post image';
+                img.loading = 'lazy';
+                img.onclick = () => openLightbox(src);
+                images.appendChild(img);
+            });
+            div.appendChild(images);
+            return div;
+        }
+
+        async function loadMore() {
+            if (loading || nextCursor === null) return;
+            loading = true;
+            try {
+                const resp = await fetch(`/api/feed/{{ folder | urlencode }}?cursor=${nextCursor}{% if dedup %}&dedup=1{% endif %}`);
+                const data = await resp.json();
+                data.posts.forEach(post => postsEl.appendChild(renderPost(post)));
+                nextCursor = data.next_cursor;
+                if (nextCursor === null) sentinel.textContent = '';
+            } finally {
+                loading = false;
+            }
+        }
+
+        new IntersectionObserver(entries => {
+            if (entries.some(e => e.isIntersecting)) loadMore();
+        }, { rootMargin: '800px' }).observe(sentinel);
     </script>
 </body>
 </html>
@@ -188,12 +519,29 @@ template_search = '''
         .result-images img { width: calc(50% - 5px); border-radius: 8px; cursor: pointer; }
         #lightboxOverlay { display: none; position: fixed; top: 0; left: 0; width: 100%; height: 100%; background: rgba(0,0,0,0.8); justify-content: center; align-items: center; z-index: 1000; }
         #lightboxOverlay img { max-width: 90%; max-height: 90%; border-radius: 8px; }
+        .filters { margin-bottom: 10px; display: flex; gap: 5px; flex-wrap: wrap; }
+        .summary { color: #657786; font-size: 14px; }
+        .pager { display: flex; justify-content: center; gap: 15px; margin: 20px 0; }
+        .pager a { color: #1da1f2; text-decoration: none; }
     </style>
 </head>
 <body>
     <div class="container">
         <div class="back-link" onclick="window.location='/'">&larr; Back to folders</div>
         <h2>Search Results for "{{ query }}"</h2>
+        <form method="get" action="/search" class="filters">
+            <input type="text" name="q" value="{{ query }}">
+            <select name="user">
+                <option value="">全部用户</option>
+                {% for name in folders %}
+                <option value="{{ name }}" {% if name == user %}selected{% endif %}>{{ name }}</option>
+                {% endfor %}
+            </select>
+            <input type="date" name="since" value="{{ since }}">
+            <input type="date" name="until" value="{{ until }}">
+            <button type="submit">搜索</button>
+        </form>
+        <p class="summary">共 {{ total }} 条结果</p>
         {% if results %}
             {% for res in results %}
             <div class="result">
@@ -204,11 +552,16 @@ template_search = '''
                 <div class="result-desc">{{ res.description }}</div>
                 <div class="result-images">
                     {% for img in res.images %}
-                    <img src="{{ img }}" alt="Result image" onclick="openLightbox('{{ img }}')">
+                    <img src="{{ res.thumbs[loop.index0] }}" data-full="{{ img }}" alt="Result image" loading="lazy" onclick="openLightbox(this.dataset.full)">
                     {% endfor %}
                 </div>
             </div>
             {% endfor %}
+            <div class="pager">
+                {% if page > 1 %}<a href="?{{ request.args | pager_args(page - 1) }}">&larr; 上一页</a>{% endif %}
+                <span>{{ page }} / {{ pages }}</span>
+                {% if page < pages %}<a href="?{{ request.args | pager_args(page + 1) }}">下一页 &rarr;</a>{% endif %}
+            </div>
         {% else %}
             <p>No results found.</p>
         {% endif %}
@@ -231,81 +584,153 @@ template_search = '''
 </html>
 '''
 
+# 模板在导入时编译一次，避免每个请求重复编译
+TEMPLATE_INDEX = app.jinja_env.from_string(template_index)
+TEMPLATE_FEED = app.jinja_env.from_string(template_feed)
+TEMPLATE_SEARCH = app.jinja_env.from_string(template_search)
+
+def render(template, **context) -> str:
+    """与 render_template_string 相同，但使用预编译的模板"""
+    app.update_template_context(context)
+    return template.render(context)
+
+# 缩略图缓存：按需生成，生成任务交给进程池以利用多核
+THUMB_ROOT = os.path.join('.', THUMB_DIR_NAME)
+THUMB_MAX_AGE = 365 * 24 * 3600
+EVICT_EVERY = 200
+_thumb_pool = None
+_thumb_lock = threading.Lock()
+_thumb_generated = 0
+
+def thumb_pool() -> ProcessPoolExecutor:
+    global _thumb_pool
+    with _thumb_lock:
+        if _thumb_pool is None:
+            _thumb_pool = ProcessPoolExecutor()
+        return _thumb_pool
+
+def count_generated():
+    """每生成 EVICT_EVERY 张缩略图，在后台检查一次缓存容量"""
+    global _thumb_generated
+    with _thumb_lock:
+        _thumb_generated += 1
+        due = _thumb_generated % EVICT_EVERY == 0
+    if due:
+        threading.Thread(target=evict, args=(THUMB_ROOT,), daemon=True).start()
+
+@app.route('/thumb/<size>/<folder>/<filename>')
+def thumb(size, folder, filename):
+    src_path = safe_join('.', folder, filename)
+    if size not in THUMB_SIZES or src_path is None or not os.path.isfile(src_path):
+        return abort(404)
+    dest_path = thumb_path(THUMB_ROOT, src_path, size)
+    if not os.path.isfile(dest_path):
+        try:
+            thumb_pool().submit(make_thumbnail, src_path, dest_path, size).result()
+        except Exception:
+            # 无法生成缩略图（如图片损坏）时返回原图
+            return send_file(src_path, max_age=THUMB_MAX_AGE)
+        count_generated()
+    return send_file(dest_path, mimetype='image/webp', max_age=THUMB_MAX_AGE)
+
+@app.template_filter('pager_args')
+def pager_args(args, page: int) -> str:
+    """保留当前查询参数，只替换页码"""
+    params = args.to_dict()
+    params['page'] = page
+    return urlencode(params)
+
 @app.route('/')
 def index():
-    return render_template_string(template_index, folders=FOLDERS_META)
+    return render(TEMPLATE_INDEX, folders=folders_meta())
 
 @app.route('/feed/<folder>')
 def feed(folder):
-    folder_path = os.path.join('.', folder)
-    json_path = os.path.join(folder_path, '__info.json')
-    if not os.path.isdir(folder_path) or not os.path.isfile(json_path):
+    dedup = request.args.get('dedup') == '1'
+    page = feed_page(folder, dedup=dedup)
+    if page is None:
         return abort(404)
+    posts, next_cursor = page
+    # dynamic_id 超出 JS 安全整数范围，以字符串传给前端
+    next_cursor = str(next_cursor) if next_cursor else None
+    return render(TEMPLATE_FEED, folder=folder, posts=posts, next_cursor=next_cursor, dedup=dedup,
+                  has_duplicates=bool(duplicate_names(folder)))
 
-    with open(json_path, 'r', encoding='utf-8') as f:
-        raw_data = json.load(f)
+@app.route('/api/feed/<folder>')
+def api_feed(folder):
+    """分页的动态 JSON 接口，cursor 为上一页最后一条的 dynamic_id"""
+    cursor = request.args.get('cursor', type=int)
+    limit = min(MAX_FEED_PAGE_SIZE, max(1, request.args.get('limit', FEED_PAGE_SIZE, type=int)))
+    page = feed_page(folder, cursor, limit, request.args.get('dedup') == '1')
+    if page is None:
+        return abort(404)
+    posts, next_cursor = page
+    # dynamic_id 超出 JS 安全整数范围，以字符串返回
+    return jsonify({
+        'posts': [
+            {**{k: v for k, v in post.items() if k != 'search_text'}, 'dynamic_id': str(post['dynamic_id'])}
+            for post in posts
+        ],
+        'next_cursor': str(next_cursor) if next_cursor else None
+    })
 
-    posts = []
-    for entry in raw_data:
-        title = entry.get('item', {}).get('title') or ''
-        description = entry.get('item', {}).get('description', '')
-        time = entry.get('time', '')
-        pictures = entry.get('item', {}).get('pictures', [])
-        image_srcs = []
-        for url in pictures:
-            clean_url = url.split('?', 1)[0]
-            filename = os.path.basename(clean_url)
-            local_file = os.path.join(folder_path, filename)
-            if os.path.isfile(local_file):
-                local_url = f"/{folder}/{filename}"
-                image_srcs.append(local_url)
-            else:
-                image_srcs.append(clean_url)
-        posts.append({
-            'title': title,
-            'description': description,
-            'time': time,
-            'images': image_srcs,
-            'folder': folder
-        })
-    return render_template_string(template_feed, folder=folder, posts=posts)
+@app.route('/api/notify', methods=['POST'])
+def notify():
+    """
+    爬虫（daemon.py）在文件夹有新动态时调用：丢弃这些文件夹的缓存并在后台重新统计首页信息。
+    只接受本机请求。
+    """
+    if request.remote_addr not in ('127.0.0.1', '::1'):
+        return abort(403)
+    data = request.get_json(silent=True) or {}
+    folders = [name for name in data.get('folders', []) if isinstance(name, str) and safe_join('.', name)]
+    for name in folders:
+        META_CACHE.invalidate(name)
+        with _duplicates_lock:
+            _duplicates.pop(name, None)
+    rebuild_folders_async(folders)
+    return jsonify({'invalidated': folders})
 
 @app.route('/search')
 def search():
-    query = request.args.get('q', '').strip().lower()
+    query = request.args.get('q', '').strip()
+    user = request.args.get('user', '').strip()
+    since = request.args.get('since', '').strip()
+    until = request.args.get('until', '').strip()
+    page = max(1, request.args.get('page', 1, type=int))
+    offset = (page - 1) * SEARCH_PAGE_SIZE
+    until_ts = parse_date(until)
+    if until_ts is not None:
+        until_ts += 86400 # 包含结束当天
+
     results = []
+    total = 0
     if query:
-        for name in os.listdir('.'):
-            if os.path.isdir(name) and os.path.isfile(os.path.join(name, '__info.json')):
-                folder_path = os.path.join('.', name)
-                json_path = os.path.join(folder_path, '__info.json')
-                with open(json_path, 'r', encoding='utf-8') as f:
-                    raw_data = json.load(f)
-                for entry in raw_data:
-                    title = entry.get('item', {}).get('title') or ''
-                    description = entry.get('item', {}).get('description', '')
-                    combined = (title + ' ' + description).lower()
-                    if query in combined:
-                        time = entry.get('time', '')
-                        pictures = entry.get('item', {}).get('pictures', [])
-                        image_srcs = []
-                        for url in pictures:
-                            clean_url = url.split('?', 1)[0]
-                            filename = os.path.basename(clean_url)
-                            local_file = os.path.join(folder_path, filename)
-                            if os.path.isfile(local_file):
-                                local_url = f"/{name}/{filename}"
-                                image_srcs.append(local_url)
-                            else:
-                                image_srcs.append(clean_url)
-                        results.append({
-                            'folder': name,
-                            'title': title,
-                            'description': description,
-                            'time': time,
-                            'images': image_srcs
-                        })
-    return render_template_string(template_search, query=query, results=results)
+        index = search_index()
+        names = [user] if user else list_folders()
+        indexed = index.indexed_folders() if index is not None else set()
+        if indexed & set(names):
+            total, hits = index.search(query, user or None, parse_date(since), until_ts,
+                                       SEARCH_PAGE_SIZE, offset, indexed_only=True)
+            results = [post_view(hit['folder'], hit['post']) for hit in hits]
+        # 还没有完整索引的文件夹（没有全文索引、或索引建立后尚未爬取过的用户）逐条匹配，排在索引结果之后
+        lowered = query.lower()
+        matched = [
+            post
+            for name in names if name not in indexed
+            for post in META_CACHE.get(name) or []
+            if lowered in post['search_text']
+            and (not since or post['time'][:10] >= since)
+            and (not until or post['time'][:10] <= until)
+        ]
+        start = max(0, offset - total)
+        results += matched[start:start + SEARCH_PAGE_SIZE - len(results)]
+        total += len(matched)
+
+    pages = (total + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE
+    return render(TEMPLATE_SEARCH, query=query, results=results, total=total,
+                  page=page, pages=pages, user=user, since=since, until=until,
+                  folders=list_folders())
 
 if __name__ == '__main__':
     app.run(debug=True)
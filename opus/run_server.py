@@ -0,0 +1,69 @@
+import argparse
+import gzip
+
+from flask import request
+
+from __a_preview_app import app
+
+# 局域网多人浏览用的生产模式入口：
+#   python ./run_server.py --host 0.0.0.0 --port 8080
+# 安装了 waitress 时使用 waitress 多线程服务，否则使用 werkzeug 的多线程服务器。
+# Linux 上也可以用 gunicorn（会通过 wsgi.file_wrapper 调用 sendfile 零拷贝发送图片）：
+#   gunicorn -w 1 --threads 16 -b 0.0.0.0:8080 run_server:app
+# 前面有 nginx 时加上 --x-sendfile，由 nginx 直接发送图片文件。
+
+GZIP_MIMETYPES = ('text/html', 'application/json')
+GZIP_MIN_SIZE = 512
+
+# 原图按内容哈希命名，内容不会变化，可以长时间缓存
+STATIC_MAX_AGE = 7 * 24 * 3600
+
+def compress_and_validate(response):
+    """
+    HTML/JSON 响应：按需 gzip 压缩，并加上 ETag，浏览器带 If-None-Match 再次请求且内容未变时返回 304。
+    图片由 send_file 处理，本身已带 ETag/Last-Modified 并支持 304。
+    """
+    if (request.method != 'GET' or response.status_code != 200 or response.direct_passthrough
+            or response.mimetype not in GZIP_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if 'gzip' in request.headers.get('Accept-Encoding', '') and len(data) >= GZIP_MIN_SIZE:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+
+    # 每次向服务器校验，未变化时只返回 304
+    response.headers['Cache-Control'] = 'no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+def configure(flask_app):
+    flask_app.config['SEND_FILE_MAX_AGE_DEFAULT'] = STATIC_MAX_AGE
+    if compress_and_validate not in flask_app.after_request_funcs.get(None, []):
+        flask_app.after_request(compress_and_validate)
+
+configure(app)
+
+def serve(host: str = '0.0.0.0', port: int = 8080, threads: int = 16, x_sendfile: bool = False):
+    app.config['USE_X_SENDFILE'] = x_sendfile
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        waitress_serve = None
+
+    print(f"预览服务已启动：http://{host}:{port}/")
+    if waitress_serve:
+        waitress_serve(app, host=host, port=port, threads=threads)
+    else:
+        from werkzeug.serving import run_simple
+        run_simple(host, port, app, threaded=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='预览应用的生产模式服务')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--x-sendfile', action='store_true', help='由前置的 nginx 等服务器发送文件')
+    args = parser.parse_args()
+    serve(args.host, args.port, args.threads, args.x_sendfile)
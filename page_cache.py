@@ -0,0 +1,273 @@
+import argparse
+import gzip
+import json
+import os
+import tempfile
+import time
+
+from bilibili_api import sync
+
+from archive_export import update_archive
+from file_op import w2json
+from folder_index import update_folders
+from info_store import INFO_JSON_NAME, open_info_store
+from metrics import metrics
+from parsers import parse_item
+from search_index import open_search_index
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 原始动态页缓存：get_dynamics_new 返回的每一页原样压缩保存在 ./opus/__pages/<uid>/ 下，
+# 文件名为该页第一条动态的ID，同一页重新获取时覆盖。解析逻辑修改后可直接从缓存重新解析，不访问网络：
+#   python ./page_cache.py reparse                 # 重建全部用户的 __info.db / __info.json 与下载队列
+#   python ./page_cache.py reparse --user 用户名 --download   # 并下载缺少的图片
+#   python ./page_cache.py evict --max-age-days 180 --max-size-mb 2048
+#   python ./page_cache.py stats
+# 安装了 zstandard 时用 zstd 压缩，否则用 gzip；读取时按扩展名解压。
+
+PAGE_CACHE_DIR = '__pages'
+DOWNLOAD_QUEUE_NAME = '__download_queue.json'
+
+# 默认保留时间与总大小上限，超出时先删除最早获取的页
+PAGE_RETENTION_DAYS = 365
+PAGE_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+ZSTD_EXT = '.json.zst'
+GZIP_EXT = '.json.gz'
+
+class PageCache:
+    """
+    :param root: 缓存目录，如 ./opus/__pages
+    :param level: 压缩级别，None 时 zstd 为 10，gzip 为 6
+    """
+    def __init__(self, root: str, level: int|None = None):
+        self.root = root
+        self.ext = ZSTD_EXT if zstandard else GZIP_EXT
+        self.level = level if level is not None else (10 if zstandard else 6)
+        os.makedirs(root, exist_ok=True)
+
+    def user_dir(self, uid: int) -> str:
+        return os.path.join(self.root, str(uid))
+
+    def compress(self, data: bytes) -> bytes:
+        if zstandard:
+            return zstandard.ZstdCompressor(level=self.level).compress(data)
+        return gzip.compress(data, compresslevel=self.level)
+
+    @staticmethod
+    def decompress(path: str, data: bytes) -> bytes:
+        if path.endswith(ZSTD_EXT):
+            if not zstandard:
+                raise RuntimeError("读取 zstd 缓存需要安装 zstandard")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def put(self, uid: int, offset: str, page: dict) -> int:
+        """
+        保存一页原始响应，没有动态的页不保存。
+        文件以该页第一条动态的ID命名，第一页总以同一条置顶动态开头，
+        同名文件已存在时把旧文件中的动态合并进来（同一条动态以本次获取的为准），而不是覆盖。
+
+        :param offset: 请求该页时使用的 offset
+        :return: 写入的字节数
+        """
+        items = page.get("items") or []
+        if not items:
+            return 0
+        save_path = self.user_dir(uid)
+        os.makedirs(save_path, exist_ok=True)
+        name = items[0]['id_str']
+        old_items = []
+        for ext in (ZSTD_EXT, GZIP_EXT):
+            old_path = os.path.join(save_path, name + ext)
+            if not os.path.exists(old_path):
+                continue
+            try:
+                old_items.extend(self.read(old_path)["page"].get("items") or [])
+            except (OSError, ValueError, RuntimeError) as e:
+                print(f"[WARN] 读取缓存 {old_path} 失败，将被覆盖：{e}")
+            # 同一页的 zstd / gzip 版本只保留一个
+            if ext != self.ext:
+                os.remove(old_path)
+        if old_items:
+            new_ids = {item['id_str'] for item in items}
+            merged = items + [item for item in old_items if item['id_str'] not in new_ids]
+            merged.sort(key=lambda item: int(item['id_str']), reverse=True)
+            # 置顶动态仍放在最前，保持文件名与内容一致
+            merged.remove(items[0])
+            page = {**page, "items": [items[0]] + merged}
+
+        record = {"uid": uid, "offset": offset, "fetched": int(time.time()), "page": page}
+        data = self.compress(json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+        path = os.path.join(save_path, name + self.ext)
+        fd, tmp_path = tempfile.mkstemp(dir=save_path, prefix=name, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        metrics.inc('page_cache_bytes', len(data))
+        return len(data)
+
+    def read(self, path: str) -> dict:
+        """读取一个缓存文件，返回 {"uid", "offset", "fetched", "page"}"""
+        with open(path, 'rb') as f:
+            return json.loads(self.decompress(path, f.read()))
+
+    def iter_files(self, uid: int|None = None):
+        """遍历缓存文件，yield (uid, 路径, 大小, 修改时间)"""
+        if uid is not None:
+            uids = [str(uid)]
+        else:
+            uids = [name for name in os.listdir(self.root) if name.isdigit()]
+        for name in uids:
+            user_path = os.path.join(self.root, name)
+            if not os.path.isdir(user_path):
+                continue
+            with os.scandir(user_path) as entries:
+                for entry in entries:
+                    if entry.name.endswith((ZSTD_EXT, GZIP_EXT)):
+                        stat = entry.stat()
+                        yield int(name), entry.path, stat.st_size, stat.st_mtime
+
+    def iter_pages(self, uid: int):
+        """按获取时间从早到晚 yield 该用户缓存的每一页 {"uid", "offset", "fetched", "page"}"""
+        for _, path, _, _ in sorted(self.iter_files(uid), key=lambda f: f[3]):
+            try:
+                yield self.read(path)
+            except (OSError, ValueError, RuntimeError) as e:
+                print(f"[WARN] 读取缓存 {path} 失败：{e}")
+
+    def iter_items(self, uid: int) -> list:
+        """
+        该用户缓存中的全部动态，按动态ID从新到旧排列。
+        同一条动态出现在多页中时使用最后获取的版本。
+        """
+        items = {}
+        for record in self.iter_pages(uid):
+            for item in record["page"].get("items") or []:
+                items[item['id_str']] = item
+        return [items[key] for key in sorted(items, key=int, reverse=True)]
+
+    def evict(self, max_age_days: float|None = PAGE_RETENTION_DAYS,
+              max_bytes: int|None = PAGE_CACHE_MAX_BYTES) -> dict:
+        """
+        删除超过保留时间的页，总大小仍超过上限时从最早获取的页开始删除
+
+        :return: {"files", "bytes", "removed", "removed_bytes"}
+        """
+        files = sorted(self.iter_files(), key=lambda f: f[3])
+        now = time.time()
+        removed = 0
+        removed_bytes = 0
+        total = sum(f[2] for f in files)
+        for _, path, size, mtime in files:
+            expired = max_age_days is not None and now - mtime > max_age_days * 86400
+            oversize = max_bytes is not None and total > max_bytes
+            if not expired and not oversize:
+                # 按获取时间排序，之后的文件更新，且总大小已不超过上限
+                break
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"[WARN] 删除缓存 {path} 失败：{e}")
+                continue
+            removed += 1
+            removed_bytes += size
+            total -= size
+        return {"files": len(files) - removed, "bytes": total, "removed": removed, "removed_bytes": removed_bytes}
+
+    def stats(self) -> dict:
+        users = set()
+        files = 0
+        size = 0
+        for uid, _, file_size, _ in self.iter_files():
+            users.add(uid)
+            files += 1
+            size += file_size
+        return {"users": len(users), "files": files, "bytes": size}
+
+def open_page_cache(save_dir: str) -> PageCache:
+    """打开 save_dir 下的 __pages"""
+    return PageCache(os.path.join(save_dir, PAGE_CACHE_DIR))
+
+def reparse_user(cache: PageCache, save_dir: str, user_name: str, uid: int) -> tuple:
+    """
+    从缓存重新解析一个用户：覆盖写入 __info.db 中缓存里有的动态（缓存之外的旧记录保留），
+    重新导出 __info.json，并把下载队列写入 __download_queue.json
+
+    :return: (解析出的动态列表, 下载队列)
+    """
+    save_path = os.path.join(save_dir, user_name)
+    posts = []
+    download_queue = []
+    for item in cache.iter_items(uid):
+        post, downloads = parse_item(item)
+        if post:
+            posts.append(post)
+        download_queue.extend(downloads)
+    if not posts:
+        return posts, download_queue
+
+    os.makedirs(save_path, exist_ok=True)
+    with open_info_store(save_path) as store:
+        store.add(posts)
+        store.export_json(os.path.join(save_path, INFO_JSON_NAME))
+    w2json(os.path.join(save_path, DOWNLOAD_QUEUE_NAME), download_queue, compact=True)
+    return posts, download_queue
+
+def reparse_all(save_dir: str = './opus', names: list|None = None, download: bool = False):
+    """
+    从缓存重新解析 user_list.txt 中的用户，不请求动态接口
+
+    :param names: 只处理这些用户名，为 None 时处理全部用户
+    :param download: 是否下载下载队列中本地缺少的图片（只访问图片 CDN）
+    """
+    # dynamic 会导入本模块，在函数内导入避免循环导入
+    from batch_get_user_dynamics import read_user_list
+    from dynamic import download_pictures_async
+
+    users = [(uname, uid) for uname, uid in read_user_list('./user_list.txt')
+             if names is None or uname in names]
+    cache = open_page_cache(save_dir)
+    updated = []
+    with open_search_index(save_dir) as search:
+        for uname, uid in users:
+            posts, download_queue = reparse_user(cache, save_dir, uname, uid)
+            if not posts:
+                print(f"{uname} ({uid}) 没有缓存的动态")
+                continue
+            with open_info_store(os.path.join(save_dir, uname)) as store:
+                # 还没有完整索引的用户补建全部动态，否则只更新重新解析的动态
+                if not search.ensure_folder(uname, store):
+                    search.add(uname, posts)
+            updated.append(uname)
+            print(f"{uname} ({uid}) 解析 {len(posts)} 条动态，下载队列 {len(download_queue)} 项")
+            if download and download_queue:
+                sync(download_pictures_async(download_queue, os.path.join(save_dir, uname)))
+    update_folders(save_dir, updated)
+    # 重新解析后已导出的记录可能变化，重新导出这些用户
+    update_archive(save_dir, updated, full=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='原始动态页缓存：离线重新解析与清理')
+    parser.add_argument('--save-dir', default='./opus')
+    sub = parser.add_subparsers(dest='command', required=True)
+    reparse_parser = sub.add_parser('reparse', help='从缓存重建 __info.json 与下载队列')
+    reparse_parser.add_argument('--user', action='append', help='只处理这些用户名，可多次指定')
+    reparse_parser.add_argument('--download', action='store_true', help='下载本地缺少的图片')
+    evict_parser = sub.add_parser('evict', help='按保留时间与大小上限清理缓存')
+    evict_parser.add_argument('--max-age-days', type=float, default=PAGE_RETENTION_DAYS)
+    evict_parser.add_argument('--max-size-mb', type=float, default=PAGE_CACHE_MAX_BYTES / 1024 / 1024)
+    sub.add_parser('stats', help='缓存统计')
+    args = parser.parse_args()
+
+    if args.command == 'reparse':
+        reparse_all(args.save_dir, args.user, args.download)
+    elif args.command == 'evict':
+        result = open_page_cache(args.save_dir).evict(args.max_age_days, int(args.max_size_mb * 1024 * 1024))
+        print(f"删除 {result['removed']} 页（{result['removed_bytes'] / 1024 / 1024:.1f} MiB），"
+              f"剩余 {result['files']} 页（{result['bytes'] / 1024 / 1024:.1f} MiB）")
+    else:
+        print(open_page_cache(args.save_dir).stats())
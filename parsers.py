@@ -0,0 +1,125 @@
+import time
+
+# 按动态类型注册的解析器。每条动态只遍历一次，同时得到元数据记录与下载任务：
+#   record, downloads = parse_item(dynamic)
+# record 的格式与原先的图文动态一致（dynamic_id、time、pub_ts、type、item），
+# item 中 title、description、pictures 三个字段对所有类型都存在，预览与全文索引无需区分类型；
+# 转发动态的原动态解析后放在 item["orig"] 中，其图片同样加入下载任务。
+#
+# 新增类型时用 register 注册一个函数，接收 (dynamic, major, desc)，返回 item 字典：
+#   @register('DYNAMIC_TYPE_XXX')
+#   def parse_xxx(dynamic, major, desc): ...
+
+PARSERS = {}
+
+def register(*dynamic_types: str):
+    """把解析函数注册到一个或多个动态类型"""
+    def decorator(func):
+        for dynamic_type in dynamic_types:
+            PARSERS[dynamic_type] = func
+        return func
+    return decorator
+
+def normalize_url(url: str|None) -> str|None:
+    """补全以 // 开头的图片地址"""
+    if url and url.startswith('//'):
+        return 'https:' + url
+    return url
+
+def opus_fields(major: dict, desc: dict) -> tuple:
+    """
+    取图文类内容的标题、正文与图片，兼容新版 opus 与旧版 draw 结构
+
+    :return: (title, text, pictures)
+    """
+    opus = major.get('opus') or {}
+    if opus:
+        pictures = [p['url'] for p in opus.get('pics') or []]
+        return opus.get('title'), (opus.get('summary') or {}).get('text'), pictures
+    draw = major.get('draw') or {}
+    pictures = [p['src'] for p in draw.get('items') or []]
+    return None, desc.get('text'), pictures
+
+@register('DYNAMIC_TYPE_DRAW', 'DYNAMIC_TYPE_WORD')
+def parse_draw(dynamic: dict, major: dict, desc: dict) -> dict:
+    title, text, pictures = opus_fields(major, desc)
+    return {"title": title, "description": text, "pictures": pictures}
+
+@register('DYNAMIC_TYPE_ARTICLE')
+def parse_article(dynamic: dict, major: dict, desc: dict) -> dict:
+    """专栏：新版为 opus 结构（pics 为封面），旧版为 article 结构（covers）"""
+    item = parse_draw(dynamic, major, desc)
+    article = major.get('article') or {}
+    if article:
+        item["title"] = item["title"] or article.get('title')
+        item["description"] = item["description"] or article.get('desc')
+        item["pictures"] = item["pictures"] or list(article.get('covers') or [])
+        item["link"] = normalize_url(article.get('jump_url'))
+    else:
+        item["link"] = normalize_url((major.get('opus') or {}).get('jump_url'))
+    return item
+
+@register('DYNAMIC_TYPE_AV')
+def parse_video(dynamic: dict, major: dict, desc: dict) -> dict:
+    """视频：下载封面，动态正文与视频简介都保留"""
+    archive = major.get('archive') or {}
+    description = desc.get('text') or archive.get('desc')
+    return {
+        "title": archive.get('title'),
+        "description": description,
+        "pictures": [archive['cover']] if archive.get('cover') else [],
+        "bvid": archive.get('bvid'),
+        "link": normalize_url(archive.get('jump_url')),
+    }
+
+@register('DYNAMIC_TYPE_FORWARD')
+def parse_forward(dynamic: dict, major: dict, desc: dict) -> dict:
+    """转发：转发语作为正文，原动态完整解析后放在 orig 中，图片沿用原动态的图片"""
+    item = {"title": None, "description": desc.get('text'), "pictures": []}
+    orig = dynamic.get('orig')
+    if orig:
+        orig_record, _ = parse_item(orig)
+        if orig_record:
+            item["orig"] = orig_record
+            item["pictures"] = orig_record["item"]["pictures"]
+    return item
+
+def parse_item(dynamic: dict) -> tuple:
+    """
+    解析一条动态
+
+    :param dynamic: get_dynamics_new 返回的 items 中的一项
+    :return: (记录, 下载任务列表)，无法解析时记录为 None；
+             下载任务为 [{"url": ..., "time_stamp": ...}, ...]，转发动态使用原动态的发布时间
+    """
+    dynamic_type = dynamic.get('type')
+    if dynamic_type == 'DYNAMIC_TYPE_NONE':
+        # 已删除的动态（多见于转发的原动态）
+        return None, []
+    try:
+        modules = dynamic['modules']
+        author = modules['module_author']
+        module_dynamic = modules.get('module_dynamic') or {}
+        major = module_dynamic.get('major') or {}
+        desc = module_dynamic.get('desc') or {}
+        # 未注册的类型按图文解析，至少保留正文
+        item = PARSERS.get(dynamic_type, parse_draw)(dynamic, major, desc)
+        item["pictures"] = [normalize_url(url) for url in item["pictures"]]
+
+        pub_ts = author.get('pub_ts')
+        record = {
+            "dynamic_id": int(dynamic['id_str']),
+            # 时间戳转换
+            "time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(pub_ts)),
+            "pub_ts": int(pub_ts) if pub_ts is not None else None,
+            "type": dynamic_type,
+            "item": item,
+        }
+    except (KeyError, TypeError, ValueError) as e:
+        print(f"字段缺失: {e}")
+        return None, []
+
+    orig = item.get("orig")
+    time_stamp = orig["pub_ts"] if orig else record["pub_ts"]
+    downloads = [{"url": url, "time_stamp": time_stamp} for url in dict.fromkeys(item["pictures"])]
+    return record, downloads
@@ -0,0 +1,152 @@
+import asyncio
+import collections
+import time
+
+# 风控（412 / -352）后暂停请求的基础时长（秒）
+THROTTLE_PAUSE = 30.0
+
+# 连续触发风控时暂停时长的上限（秒）
+MAX_THROTTLE_PAUSE = 600.0
+
+# 请求间隔设为 0（不主动限速）时使用的速率（次/秒）
+MAX_RATE = 4.0
+
+def interval_to_rate(sleep_time: float) -> float:
+    """把请求间隔（秒）换算为速率，间隔不大于 0 时取 MAX_RATE"""
+    return 1 / sleep_time if sleep_time > 0 else MAX_RATE
+
+def is_risk_control(e: Exception) -> bool:
+    """
+    判断异常是否为 B 站风控：HTTP 412（NetworkException.status）
+    或接口返回 -352 / -412（ResponseCodeException.code）
+    """
+    return getattr(e, 'status', None) == 412 or getattr(e, 'code', None) in (-352, -412)
+
+class RateLimiter:
+    """
+    全局请求速率限制，多个协程共享同一个实例时，总请求间隔不小于 interval。
+    """
+    def __init__(self, interval: float = 1.0):
+        """
+        :param interval: 相邻两次请求的最小间隔（秒）
+        """
+        self.interval = interval
+        self._lock = asyncio.Lock()
+        self._next_time = 0.0
+
+    async def acquire(self):
+        """等待直到允许发出下一次请求"""
+        async with self._lock:
+            delay = self._next_time - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_time = time.monotonic() + self.interval
+
+    def on_success(self):
+        """请求成功时调用"""
+
+    def on_throttle(self, e: Exception|None = None):
+        """触发风控时调用，暂停 THROTTLE_PAUSE 秒"""
+        self._next_time = max(self._next_time, time.monotonic() + THROTTLE_PAUSE)
+        print(f"[RATE] 触发风控，暂停 {THROTTLE_PAUSE:.0f} 秒：{e}")
+
+    @property
+    def rate(self) -> float:
+        """当前速率（次/秒）"""
+        return 1 / self.interval if self.interval > 0 else float('inf')
+
+    def stats(self) -> dict:
+        return {"rate": self.rate}
+
+class AdaptiveRateLimiter(RateLimiter):
+    """
+    令牌桶 + AIMD 自适应速率限制：
+    请求成功时速率线性增加 increase，触发风控时速率乘以 decrease 并暂停一段时间，
+    连续触发风控时暂停时长翻倍。
+    """
+    def __init__(self, rate: float = 1.0, min_rate: float = 0.05, max_rate: float|None = None,
+                 burst: float = 1.0, increase: float = 0.02, decrease: float = 0.5,
+                 pause: float = THROTTLE_PAUSE, max_events: int = 100):
+        """
+        :param rate: 初始速率（次/秒）
+        :param min_rate: 速率下限
+        :param max_rate: 速率上限，为 None 或小于 rate 时取 rate，即默认只在风控降速后恢复到初始速率
+        :param burst: 令牌桶容量，允许的突发请求数
+        :param increase: 每次成功后增加的速率
+        :param decrease: 触发风控后速率乘以的系数
+        :param pause: 触发风控后暂停的基础时长（秒）
+        :param max_events: 保留的最近退避事件数量
+        """
+        super().__init__(1 / rate)
+        self._rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max(max_rate or rate, rate)
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.pause = pause
+        self._tokens = burst
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._consecutive = 0
+        self.backoff_count = 0
+        self.events = collections.deque(maxlen=max_events)
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self._rate)
+        self._last_refill = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                delay = self._paused_until - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+    def _set_rate(self, rate: float):
+        # 先按旧速率补充令牌，再切换速率
+        self._refill()
+        self._rate = min(self.max_rate, max(self.min_rate, rate))
+        self.interval = 1 / self._rate
+
+    def on_success(self):
+        self._consecutive = 0
+        self._set_rate(self._rate + self.increase)
+
+    def on_throttle(self, e: Exception|None = None):
+        old_rate = self._rate
+        self._consecutive += 1
+        self.backoff_count += 1
+        self._set_rate(self._rate * self.decrease)
+        self._tokens = 0
+        pause = min(MAX_THROTTLE_PAUSE, self.pause * 2 ** (self._consecutive - 1))
+        self._paused_until = max(self._paused_until, time.monotonic() + pause)
+        self.events.append({
+            "time": time.time(),
+            "old_rate": old_rate,
+            "new_rate": self._rate,
+            "pause": pause,
+            "error": str(e) if e else None,
+        })
+        print(f"[RATE] 触发风控，速率 {old_rate:.3f} → {self._rate:.3f} 次/秒，暂停 {pause:.0f} 秒：{e}")
+
+    def stats(self) -> dict:
+        """当前速率与退避事件，用于按部署环境调整吞吐量"""
+        return {
+            "rate": self._rate,
+            "min_rate": self.min_rate,
+            "max_rate": self.max_rate,
+            "backoff_count": self.backoff_count,
+            "recent_backoffs": list(self.events),
+        }
@@ -1,73 +1,94 @@
 import os
-import re
-import json
-import urllib.request
+import time
 
-def retry_failed_download(failed_path: str, save_path: str):
-    """
-    重新尝试下载 failed_path 指定的 JSON 文件中记录的所有失败项，
-    下载成功后从失败列表中移除，并对目标文件进行覆盖。
-    """
+from bilibili_api import sync
 
-    # 1. 加载失败列表
-    if os.path.exists(failed_path):
-        with open(failed_path, "r", encoding="utf-8") as f:
-            try:
-                failed_list = json.load(f)
-            except json.JSONDecodeError:
-                print(f"[WARN] 无法解析 {failed_path}，重置为空列表")
-                failed_list = []
-    else:
-        print(f"[INFO] 失败列表文件 {failed_path} 不存在，退出重试")
-        return
+from blob_store import BlobStore, open_blob_store
+from downloader import DEFAULT_CONCURRENCY, clean_url, download_all, url_file_name
+from failed_ledger import FailedLedger, open_failed_ledger
+from metrics import metrics
+from retry import RetryEngine
 
-    if not failed_list:
-        print("[INFO] 没有需要重试的下载项")
-        return
+# 每次从失败记录中领取的条数
+CLAIM_BATCH_SIZE = 500
 
-    os.makedirs(save_path, exist_ok=True)
+async def retry_failed_download_async(save_dir: str = "./opus", folder: str|None = None,
+                                      session=None, concurrency: int = DEFAULT_CONCURRENCY,
+                                      blobs: BlobStore|None = None, retry: RetryEngine|None = None,
+                                      ledger: FailedLedger|None = None, due_only: bool = False):
+    """
+    重新下载 save_dir/__failed.db 中记录的失败项，每次领取一批，
+    下载成功后删除记录，仍失败的增加失败次数并推迟下次重试时间。
+    共享图片仓库中已有的图片直接链接，不再重复下载；中断留下的 .part 文件会续传。
+    临时错误按 retry 的退避策略重试，主机持续失败时熔断，不会持续请求。
 
-    succeeded = []
-    still_failed = []
+    :param save_dir: 保存目录，如 ./opus
+    :param folder: 只重试该用户文件夹的记录，为 None 时重试全部
+    :param due_only: 只重试已到重试时间的记录，为 False 时本轮之前失败的都重试
+    """
+    own_ledger = ledger is None
+    if own_ledger:
+        ledger = open_failed_ledger(save_dir)
+    own_blobs = blobs is None
+    if own_blobs:
+        blobs = open_blob_store(save_dir)
+    retry = retry or RetryEngine()
 
-    # 2. 遍历每条失败记录，尝试下载
-    for entry in failed_list:
-        url = entry.get("url")
-        ts  = entry.get("time_stamp", None)
-        if not url or ts is None:
-            continue
+    started = time.time()
+    total = succeeded = 0
+    try:
+        while True:
+            # 1. 领取一批失败记录，本轮中再次失败的记录不会被重复领取
+            entries = ledger.claim(CLAIM_BATCH_SIZE, folder, due_only=due_only, failed_before=started)
+            if not entries:
+                break
+            total += len(entries)
+            metrics.inc('retry_claimed', len(entries))
 
-        # 去掉可能的 query 参数
-        clean_url = re.sub(r'\?.*$', '', url)
-        match = re.search(r'/([^/]+)$', clean_url)
-        if not match:
-            print(f"[WARN] 无法从 URL 提取文件名，跳过：{url}")
-            still_failed.append(entry)
-            continue
+            by_folder = {}
+            for entry in entries:
+                by_folder.setdefault(entry["folder"], []).append(entry)
 
-        file_name = match.group(1)
-        file_path = os.path.join(save_path, file_name)
+            # 2. 按用户文件夹并发重新下载
+            for name, group in by_folder.items():
+                save_path = os.path.join(save_dir, name)
+                os.makedirs(save_path, exist_ok=True)
+                retry_queue = []
+                still_failed = []
+                for entry in group:
+                    url = entry["url"]
+                    if url_file_name(url) is None or entry["time_stamp"] is None:
+                        print(f"[WARN] 记录不完整，跳过：{url}")
+                        still_failed.append({"url": url, "time_stamp": entry["time_stamp"],
+                                             "error": "记录不完整"})
+                        continue
+                    retry_queue.append({"url": clean_url(url), "time_stamp": entry["time_stamp"]})
 
-        print(f"[RETRY] 下载：{clean_url} → {file_path}")
-        try:
-            # 无论文件是否已存在，都覆盖下载
-            urllib.request.urlretrieve(clean_url, file_path)
-            # 恢复时间戳
-            os.utime(file_path, (ts, ts))
-            succeeded.append(entry)
-            print(f"[OK]   下载并设置时间：{file_name}")
-        except Exception as e:
-            print(f"[ERR]  下载失败：{clean_url}，原因：{e}")
-            still_failed.append(entry)
+                print(f"[RETRY] 重新下载 {len(retry_queue)} 项 → {save_path}")
+                retry_failed = await download_all(retry_queue, save_path, session=session,
+                                                  concurrency=concurrency, blobs=blobs, retry=retry)
+                failed_urls = {item["url"] for item in retry_failed}
 
-    # 3. 将仍然失败的写回 JSON
-    with open(failed_path, "w", encoding="utf-8") as f:
-        json.dump(still_failed, f, indent=4, ensure_ascii=False)
+                # 3. 成功的删除，仍失败的写回
+                ledger.resolve(name, [item["url"] for item in retry_queue if item["url"] not in failed_urls])
+                ledger.record(name, still_failed + retry_failed)
+                succeeded += len(retry_queue) - len(retry_failed)
+                metrics.inc('retry_succeeded', len(retry_queue) - len(retry_failed))
+    finally:
+        if own_blobs:
+            blobs.close()
+        remaining = ledger.count(folder)
+        if own_ledger:
+            ledger.close()
 
-    print(f"\n重试完成：总 {len(failed_list)} 项，成功 {len(succeeded)}，失败 {len(still_failed)}")
+    if not total:
+        print("[INFO] 没有需要重试的下载项")
+        return
+    print(f"\n重试完成：总 {total} 项，成功 {succeeded}，剩余失败记录 {remaining} 项")
 
-if __name__ == "__main__":
-    FAILED_JSON = "./opus/芙兰剔牙_Flantia/__failed_download.json"
-    SAVE_DIR    = "./opus/芙兰剔牙_Flantia/"
+def retry_failed_download(save_dir: str = "./opus", folder: str|None = None,
+                          concurrency: int = DEFAULT_CONCURRENCY):
+    sync(retry_failed_download_async(save_dir, folder, concurrency=concurrency))
 
-    retry_failed_download(FAILED_JSON, SAVE_DIR)
+if __name__ == "__main__":
+    retry_failed_download("./opus", "芙兰剔牙_Flantia")
@@ -0,0 +1,187 @@
+import asyncio
+import random
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from metrics import metrics
+
+# 服务器端的临时错误，值得重试；其余 4xx（如 404、403）重试也不会成功
+RETRY_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+# Retry-After 最多等待的秒数，服务器给出更长的时间时按此值重试
+MAX_RETRY_AFTER = 300.0
+
+class CircuitOpenError(Exception):
+    """主机连续失败过多，熔断器已放弃该主机"""
+
+def is_retryable(e: Exception) -> bool:
+    """
+    判断错误是否值得重试：5xx/429/408、超时、连接错误、下载不完整可以重试，
+    其余 HTTP 错误（如 404）和本地错误直接失败
+    """
+    if isinstance(e, aiohttp.ClientResponseError):
+        return e.status in RETRY_STATUS or e.status >= 500
+    return isinstance(e, (asyncio.TimeoutError, aiohttp.ClientConnectionError,
+                          aiohttp.ClientPayloadError))
+
+def retry_after(e: Exception) -> float|None:
+    """429/503 响应中 Retry-After 指定的等待秒数，限制在 [0, MAX_RETRY_AFTER] 内"""
+    headers = getattr(e, 'headers', None)
+    if not headers:
+        return None
+    try:
+        return min(MAX_RETRY_AFTER, max(0.0, float(headers.get('Retry-After'))))
+    except (TypeError, ValueError):
+        return None
+
+class RetryPolicy:
+    """
+    指数退避 + 完全抖动：第 n 次重试前等待 [0, min(max_delay, base_delay * 2^n)] 内的随机时间，
+    避免大量失败的下载同时重试
+    """
+    def __init__(self, max_attempts: int = 4, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """
+        :param attempt: 已失败的次数（从 1 开始）
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+class CircuitBreaker:
+    """
+    单个主机的熔断器：
+    连续失败 threshold 次后断开，cooldown 秒内不再请求该主机；
+    冷却结束后只放行一个试探请求，成功则恢复，失败则再次断开且冷却时间加倍。
+    连续断开 max_trips 次仍未恢复时认为该主机暂时不可用（dead），之后 dead_cooldown 秒内的请求直接失败，
+    再放行一个试探请求，成功即完全恢复，常驻进程不会因为一次长时间故障永久放弃该主机。
+    """
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0, max_cooldown: float = 600.0,
+                 max_trips: int = 5, dead_cooldown: float = 3600.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_trips = max_trips
+        self.dead_cooldown = dead_cooldown
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+        self.probing = False
+
+    @property
+    def dead(self) -> bool:
+        return self.trips >= self.max_trips
+
+    @property
+    def state(self) -> str:
+        if self.trips and (self.probing or time.monotonic() < self.open_until):
+            return 'dead' if self.dead else 'open'
+        return 'half_open' if self.trips else 'closed'
+
+    async def before_request(self) -> bool:
+        """
+        断开期间等待冷却结束；主机处于 dead 状态（且不是本次试探）时抛出 CircuitOpenError
+
+        :return: 本次请求是否为冷却后的试探请求
+        """
+        while True:
+            if not self.trips:
+                return False
+            wait = self.open_until - time.monotonic()
+            if wait <= 0 and not self.probing:
+                self.probing = True
+                return True
+            if self.dead:
+                raise CircuitOpenError(f"连续熔断 {self.trips} 次，{max(wait, 0):.0f} 秒内不再请求该主机")
+            await asyncio.sleep(max(wait, 1.0))
+
+    def on_success(self, probe: bool = False):
+        self.failures = 0
+        self.trips = 0
+        self.probing = False
+
+    def on_failure(self, probe: bool = False):
+        if probe:
+            self.probing = False
+        elif self.trips:
+            # 断开前已发出的请求陆续失败，不重复计数
+            return
+        else:
+            self.failures += 1
+            if self.failures < self.threshold:
+                return
+        self.trips += 1
+        self.failures = 0
+        if self.dead:
+            cooldown = self.dead_cooldown
+        else:
+            cooldown = min(self.max_cooldown, self.cooldown * 2 ** (self.trips - 1))
+        self.open_until = time.monotonic() + cooldown
+        metrics.inc('circuit_trips')
+        print(f"[WARN] 主机连续失败，暂停请求 {cooldown:.0f} 秒")
+
+    def release(self, probe: bool = False):
+        """请求因不计入熔断的错误（如 404）结束时，试探请求的名额交给下一个请求"""
+        if probe:
+            self.probing = False
+
+class RetryEngine:
+    """
+    按错误类型决定是否重试，重试间隔指数退避加抖动，并为每个主机维护一个熔断器。
+    同一进程内的下载应共享一个 RetryEngine，熔断状态才能在各用户之间生效。
+    """
+    def __init__(self, policy: RetryPolicy|None = None, **breaker_args):
+        self.policy = policy or RetryPolicy()
+        self.breaker_args = breaker_args
+        self.breakers = {}
+        self.retries = 0
+        self.gave_up = 0
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).hostname or ''
+        if host not in self.breakers:
+            self.breakers[host] = CircuitBreaker(**self.breaker_args)
+        return self.breakers[host]
+
+    async def run(self, url: str, func):
+        """
+        调用 func() 直到成功，返回其结果；不可重试的错误或重试次数用完时抛出最后一次的异常
+
+        :param url: 请求的 URL，用于选择熔断器
+        :param func: 无参数的协程函数，每次尝试调用一次
+        """
+        breaker = self.breaker(url)
+        attempt = 0
+        while True:
+            probe = await breaker.before_request()
+            attempt += 1
+            try:
+                result = await func()
+            except Exception as e:
+                if not is_retryable(e):
+                    breaker.release(probe)
+                    raise
+                breaker.on_failure(probe)
+                if attempt >= self.policy.max_attempts:
+                    self.gave_up += 1
+                    metrics.inc('download_gave_up')
+                    raise
+                delay = retry_after(e) or self.policy.delay(attempt)
+                self.retries += 1
+                metrics.inc('download_retries')
+                print(f"[RETRY] {url} 第 {attempt} 次失败（{e or type(e).__name__}），{delay:.1f} 秒后重试")
+                await asyncio.sleep(delay)
+            else:
+                breaker.on_success(probe)
+                return result
+
+    def stats(self) -> dict:
+        return {
+            "retries": self.retries,
+            "gave_up": self.gave_up,
+            "breakers": {host: b.state for host, b in self.breakers.items() if b.state != 'closed'},
+        }
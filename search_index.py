@@ -0,0 +1,201 @@
+import json
+import os
+import re
+import sqlite3
+import time
+
+from file_op import rjson
+from info_store import INFO_DB_NAME, INFO_JSON_NAME, InfoStore, post_pub_ts
+
+SEARCH_DB_NAME = '__search.db'
+
+# 补建索引时每批写入的条数
+INDEX_BATCH_SIZE = 1000
+
+# 中日韩文字按二元组切分，其余按字母数字连续串切分
+_CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+_TOKEN_RE = re.compile(f'[{_CJK}]+|[0-9a-z]+')
+_CJK_RE = re.compile(f'[{_CJK}]')
+
+def _is_cjk(run: str) -> bool:
+    return bool(_CJK_RE.match(run))
+
+def tokenize(text: str) -> list:
+    """
+    CJK 感知的分词：中文等连续串切成相邻二元组，并在末尾补上最后一个字，
+    这样单字查询也能通过前缀匹配命中；其他文字按字母数字串切分。
+    """
+    tokens = []
+    for run in _TOKEN_RE.findall((text or '').lower()):
+        if _is_cjk(run):
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            tokens.append(run[-1])
+        else:
+            tokens.append(run)
+    return tokens
+
+def build_match_query(query: str) -> str|None:
+    """把用户输入转换为 FTS5 查询，所有词都需命中；无法分词时返回 None"""
+    terms = []
+    for run in _TOKEN_RE.findall((query or '').lower()):
+        if _is_cjk(run) and len(run) > 1:
+            # 连续二元组组成短语，要求在原文中相邻
+            terms.append('"' + ' '.join(run[i:i + 2] for i in range(len(run) - 1)) + '"')
+        else:
+            terms.append(f'"{run}"*')
+    return ' AND '.join(terms) if terms else None
+
+class SearchIndex:
+    """
+    所有用户动态的全文索引（SQLite FTS5），保存在 ./opus/__search.db。
+    get_opus 写入新动态时增量更新，预览应用的 /search 直接查询。
+    folders 表记录已完整索引（包括爬取前已有的历史动态）的文件夹，
+    其他文件夹在下次爬取时由 ensure_folder 补建，在此之前预览应用对其逐条匹配。
+    """
+    def __init__(self, db_path: str):
+        self.path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                id INTEGER PRIMARY KEY,
+                folder TEXT NOT NULL,
+                dynamic_id INTEGER NOT NULL,
+                pub_ts INTEGER,
+                data TEXT NOT NULL,
+                UNIQUE (folder, dynamic_id)
+            );
+            CREATE INDEX IF NOT EXISTS docs_pub_ts ON docs (pub_ts);
+            CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(tokens);
+            CREATE TABLE IF NOT EXISTS folders (
+                folder TEXT PRIMARY KEY,
+                indexed INTEGER NOT NULL
+            );
+        """)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, folder: str, posts: list) -> int:
+        """在一个事务中写入（或更新）一批动态，返回写入条数"""
+        with self.conn:
+            for post in posts:
+                dynamic_id = int(post['dynamic_id'])
+                item = post.get('item', {})
+                text = (item.get('title') or '') + ' ' + (item.get('description') or '')
+                # 转发动态同时按原动态的内容检索
+                orig = item.get('orig', {}).get('item', {})
+                text += ' ' + (orig.get('title') or '') + ' ' + (orig.get('description') or '')
+                tokens = ' '.join(tokenize(text))
+                row = self.conn.execute(
+                    "SELECT id FROM docs WHERE folder = ? AND dynamic_id = ?", (folder, dynamic_id)
+                ).fetchone()
+                if row:
+                    self.conn.execute("DELETE FROM docs_fts WHERE rowid = ?", (row[0],))
+                    self.conn.execute("DELETE FROM docs WHERE id = ?", (row[0],))
+                cur = self.conn.execute(
+                    "INSERT INTO docs (folder, dynamic_id, pub_ts, data) VALUES (?, ?, ?, ?)",
+                    (folder, dynamic_id, post_pub_ts(post), json.dumps(post, ensure_ascii=False))
+                )
+                self.conn.execute("INSERT INTO docs_fts (rowid, tokens) VALUES (?, ?)", (cur.lastrowid, tokens))
+        return len(posts)
+
+    def indexed_folders(self) -> set:
+        """已完整索引的文件夹"""
+        return {row[0] for row in self.conn.execute("SELECT folder FROM folders")}
+
+    def mark_indexed(self, folder: str):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO folders (folder, indexed) VALUES (?, ?) "
+                "ON CONFLICT (folder) DO UPDATE SET indexed = excluded.indexed",
+                (folder, int(time.time()))
+            )
+
+    def ensure_folder(self, folder: str, store: InfoStore) -> int:
+        """
+        该文件夹还没有完整索引时（索引建立前已爬取或从 __info.json 迁移的用户），
+        把 store 中已有的全部动态写入索引并记为已索引
+
+        :return: 补建的条数
+        """
+        if self.conn.execute("SELECT 1 FROM folders WHERE folder = ?", (folder,)).fetchone():
+            return 0
+        count = 0
+        batch = []
+        for post in store.iter_posts():
+            batch.append(post)
+            if len(batch) >= INDEX_BATCH_SIZE:
+                count += self.add(folder, batch)
+                batch = []
+        count += self.add(folder, batch)
+        self.mark_indexed(folder)
+        return count
+
+    def search(self, query: str, folder: str|None = None, since: int|None = None,
+               until: int|None = None, limit: int = 20, offset: int = 0,
+               indexed_only: bool = False) -> tuple:
+        """
+        按相关度（bm25）排序检索，相关度相同时新的在前
+
+        :param folder: 只搜索该用户文件夹
+        :param since: 发布时间下限（时间戳，含）
+        :param until: 发布时间上限（时间戳，不含）
+        :param indexed_only: 只搜索已完整索引的文件夹，其余文件夹由调用方逐条匹配
+        :return: (命中总数, [{"folder": ..., "post": {...}}, ...])
+        """
+        match = build_match_query(query)
+        if match is None:
+            return 0, []
+
+        where = ["docs_fts MATCH ?"]
+        params = [match]
+        if folder:
+            where.append("docs.folder = ?")
+            params.append(folder)
+        if since is not None:
+            where.append("docs.pub_ts >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("docs.pub_ts < ?")
+            params.append(until)
+        if indexed_only:
+            where.append("docs.folder IN (SELECT folder FROM folders)")
+        sql_from = "FROM docs_fts JOIN docs ON docs.id = docs_fts.rowid WHERE " + " AND ".join(where)
+
+        total = self.conn.execute(f"SELECT COUNT(*) {sql_from}", params).fetchone()[0]
+        rows = self.conn.execute(
+            f"SELECT docs.folder, docs.data {sql_from} "
+            f"ORDER BY bm25(docs_fts), docs.pub_ts DESC LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        return total, [{"folder": name, "post": json.loads(data)} for name, data in rows]
+
+def open_search_index(save_dir: str = "./opus") -> SearchIndex:
+    return SearchIndex(os.path.join(save_dir, SEARCH_DB_NAME))
+
+def rebuild_all(save_dir: str = "./opus"):
+    """从所有用户的 __info.db（没有时读取 __info.json）重建全文索引"""
+    with open_search_index(save_dir) as index:
+        for name in sorted(os.listdir(save_dir)):
+            folder = os.path.join(save_dir, name)
+            db_path = os.path.join(folder, INFO_DB_NAME)
+            if os.path.isfile(db_path):
+                with InfoStore(db_path) as store:
+                    posts = list(store.iter_posts())
+            elif os.path.isfile(os.path.join(folder, INFO_JSON_NAME)):
+                posts = rjson(os.path.join(folder, INFO_JSON_NAME)) or []
+            else:
+                continue
+            print(f"{name}：索引 {index.add(name, posts)} 条动态")
+            index.mark_indexed(name)
+
+if __name__ == '__main__':
+    rebuild_all("./opus")
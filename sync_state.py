@@ -0,0 +1,93 @@
+import json
+import os
+import time
+
+from file_op import rjson
+
+SYNC_STATE_NAME = '__sync_state.json'
+
+# 检查间隔取平均发帖间隔乘以该系数，并限制在上下限之间（秒）
+POLL_FACTOR = 0.25
+MIN_POLL_INTERVAL = 3600
+MAX_POLL_INTERVAL = 7 * 24 * 3600
+
+# 平均发帖间隔的指数加权系数
+EWMA_ALPHA = 0.3
+
+def load_sync_state(save_dir: str = "./opus") -> dict:
+    """读取 {uid: 同步状态}，文件不存在时返回空字典"""
+    state_path = os.path.join(save_dir, SYNC_STATE_NAME)
+    if not os.path.exists(state_path):
+        return {}
+    return rjson(state_path) or {}
+
+def save_sync_state(save_dir: str, state: dict):
+    """先写临时文件再替换"""
+    state_path = os.path.join(save_dir, SYNC_STATE_NAME)
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, state_path)
+
+def record_check(state: dict, uid: int, uname: str, latest_id: int, new_pub_ts: list,
+                 now: float|None = None, known_pub_ts: int|None = None) -> dict:
+    """
+    记录一次检查的结果，并更新该用户的平均发帖间隔
+
+    :param latest_id: 检查后已保存的最大动态ID
+    :param new_pub_ts: 本次新增动态的发布时间戳
+    :param known_pub_ts: 检查前已保存动态的最新发布时间戳，
+                         还没有 last_post_ts 的用户（如迁移来的用户）以此为起点，没有新动态时也能按发帖时间排期
+    :return: 更新后的状态
+    """
+    now = now or time.time()
+    entry = state.setdefault(str(uid), {"uname": uname, "checks": 0})
+    entry["uname"] = uname
+    entry["last_seen_id"] = latest_id
+    entry["last_check"] = int(now)
+    entry["checks"] = entry.get("checks", 0) + 1
+
+    last_post_ts = entry.get("last_post_ts") or known_pub_ts
+    avg = entry.get("avg_post_interval")
+    for ts in sorted(t for t in new_pub_ts if t):
+        if last_post_ts and ts > last_post_ts:
+            interval = ts - last_post_ts
+            avg = interval if avg is None else EWMA_ALPHA * interval + (1 - EWMA_ALPHA) * avg
+        last_post_ts = max(ts, last_post_ts or 0)
+    entry["last_post_ts"] = last_post_ts
+    entry["avg_post_interval"] = avg
+    if new_pub_ts:
+        entry["last_new"] = int(now)
+    return entry
+
+def poll_interval(entry: dict|None, now: float|None = None,
+                  min_interval: float = MIN_POLL_INTERVAL) -> float:
+    """
+    该用户的检查间隔：发帖越少检查越少。
+    长时间没有新动态时，间隔至少为距离上次发帖时间的 POLL_FACTOR 倍。
+
+    :param min_interval: 间隔下限，常驻模式下可以更短
+    """
+    if not entry or not entry.get("last_post_ts"):
+        return min_interval
+    now = now or time.time()
+    expected = max(entry.get("avg_post_interval") or 0, now - entry["last_post_ts"])
+    return min(MAX_POLL_INTERVAL, max(min_interval, expected * POLL_FACTOR))
+
+def next_check_time(entry: dict|None, now: float|None = None,
+                    min_interval: float = MIN_POLL_INTERVAL) -> float:
+    if not entry or not entry.get("last_check"):
+        return 0
+    return entry["last_check"] + poll_interval(entry, now, min_interval)
+
+def due_users(users: list, state: dict, now: float|None = None) -> list:
+    """
+    从 [(uname, uid), ...] 中筛选出已到检查时间的用户，最久未检查的在前
+    """
+    now = now or time.time()
+    due = [
+        (uname, uid) for uname, uid in users
+        if next_check_time(state.get(str(uid)), now) <= now
+    ]
+    due.sort(key=lambda user: state.get(str(user[1]), {}).get("last_check", 0))
+    return due
@@ -0,0 +1,34 @@
+import os
+
+from archive_export import open_archive_export, update_archive
+from info_store import open_info_store
+
+def make_posts(ids):
+    return [
+        {"dynamic_id": i, "pub_ts": 1700000000 + i, "type": "DYNAMIC_TYPE_DRAW",
+         "item": {"title": str(i), "description": "", "pictures": [f"http://x/{i}.jpg"]}}
+        for i in ids
+    ]
+
+def archived_count(save_dir, folder):
+    with open_archive_export(save_dir) as archive:
+        return archive.conn.execute("SELECT COUNT(*) FROM posts WHERE folder = ?", (folder,)).fetchone()[0]
+
+def test_older_posts_added_later_are_exported(tmp_path):
+    save_dir = str(tmp_path)
+    os.makedirs(os.path.join(save_dir, 'user1'))
+    # 中断的爬取先写入了最新的几页
+    with open_info_store(os.path.join(save_dir, 'user1')) as store:
+        store.add(make_posts(range(12, 23)))
+    assert update_archive(save_dir, ['user1']) == 11
+
+    # 继续爬取补上更早的页
+    with open_info_store(os.path.join(save_dir, 'user1')) as store:
+        store.add(make_posts(range(1, 12)))
+    assert update_archive(save_dir, ['user1']) == 11
+    assert archived_count(save_dir, 'user1') == 22
+    assert update_archive(save_dir, ['user1']) == 0
+
+def test_skips_users_without_archive(tmp_path, capsys):
+    assert update_archive(str(tmp_path), ['never_crawled']) == 0
+    assert '[WARN]' not in capsys.readouterr().out
@@ -0,0 +1,12 @@
+import os
+
+from blob_store import dedupe_all
+
+def test_dedupe_all_skips_internal_dirs(tmp_path):
+    for folder in ("user", "__thumbs", "__pages"):
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / "a.jpg").write_bytes(b"jpeg")
+    dedupe_all(str(tmp_path))
+    assert os.stat(tmp_path / "user" / "a.jpg").st_nlink == 2
+    assert os.stat(tmp_path / "__thumbs" / "a.jpg").st_nlink == 1
+    assert os.stat(tmp_path / "__pages" / "a.jpg").st_nlink == 1
@@ -0,0 +1,81 @@
+import asyncio
+import json
+import os
+import types
+
+from aiohttp import web
+
+import dynamic
+from checkpoint import CHECKPOINT_NAME
+from rate_limit import AdaptiveRateLimiter
+
+def make_page(base_url, ids, next_offset, slow=False):
+    items = [{
+        "id_str": str(i),
+        "type": "DYNAMIC_TYPE_DRAW",
+        "modules": {
+            "module_author": {"pub_ts": 1700000000 + i},
+            "module_dynamic": {"major": {"opus": {
+                "title": str(i), "summary": {"text": ""},
+                "pics": [{"url": f"{base_url}/bfs/{'slow' if slow else 'fast'}_{i}.jpg"}],
+            }}},
+        },
+    } for i in ids]
+    return {"items": items, "offset": next_offset, "has_more": 1 if next_offset else 0}
+
+async def image(request):
+    if request.match_info['name'].startswith('slow'):
+        await asyncio.sleep(2)
+    return web.Response(body=b'x' * 100, content_type='image/jpeg')
+
+def test_checkpoint_waits_for_page_downloads(tmp_path, monkeypatch):
+    async def run():
+        app = web.Application()
+        app.router.add_get('/bfs/{name}', image)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        base_url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+        # 第一页的图片下载很慢，后两页很快
+        pages = {
+            "": make_page(base_url, [30, 29], "29", slow=True),
+            "29": make_page(base_url, [20, 19], "19"),
+            "19": make_page(base_url, [10, 9], "9"),
+            "9": make_page(base_url, [5], ""),
+        }
+        fetched = asyncio.Event()
+
+        class FakeUser:
+            def __init__(self, uid):
+                pass
+
+            async def get_dynamics_new(self, offset=""):
+                if offset == "9":
+                    fetched.set()
+                    await asyncio.sleep(30)
+                return pages[offset]
+
+        monkeypatch.setattr(dynamic, 'user', types.SimpleNamespace(User=FakeUser))
+        task = asyncio.create_task(dynamic.get_opus_async(
+            "user1", 1, "opus", limiter=AdaptiveRateLimiter(rate=100, max_rate=100), concurrency=2))
+        await fetched.wait()
+        await asyncio.sleep(0.3)
+        # 第一页的图片还没下载完，此时进程崩溃的话，断点不能越过第一页
+        with open(tmp_path / 'opus' / 'user1' / CHECKPOINT_NAME, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        assert checkpoint["offset"] == ""
+        assert checkpoint["stop_value"] == 0
+        # 中断时等待已入队的图片下载完成，之后断点推进到最后获取的页
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await runner.cleanup()
+
+    monkeypatch.chdir(tmp_path)
+    asyncio.run(run())
+    with open(tmp_path / 'opus' / 'user1' / CHECKPOINT_NAME, encoding='utf-8') as f:
+        assert json.load(f)["offset"] == "9"
+    assert os.path.isfile(tmp_path / 'opus' / 'user1' / 'slow_30.jpg')
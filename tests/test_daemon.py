@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("apscheduler")
+from aiohttp.test_utils import TestClient, TestServer
+
+import daemon
+from daemon import RELOAD_INTERVAL, ArchiveDaemon, create_control_app
+from sync_state import next_check_time
+
+UID = 42
+
+def next_run(archive: ArchiveDaemon) -> float:
+    return archive.scheduler.get_job(archive.job_id(UID)).next_run_time.timestamp()
+
+@pytest.fixture
+def run_daemon(tmp_path, monkeypatch):
+    """在事件循环中运行 ArchiveDaemon，共享资源不打开，get_opus_async 由各测试替换"""
+    monkeypatch.setattr(daemon, "SAVE_DIR", str(tmp_path))
+    monkeypatch.setattr(daemon, "update_archive", lambda *args: 0)
+
+    def run(test):
+        async def main():
+            archive = ArchiveDaemon(min_interval=600)
+            archive.state = {}
+            archive.session = archive.blobs = archive.search = archive.page_cache = None
+            archive.semaphore = asyncio.Semaphore(1)
+            archive.users = {UID: "user"}
+            # 暂停执行，只检查排期
+            archive.scheduler.start(paused=True)
+            try:
+                await test(archive)
+            finally:
+                archive.scheduler.shutdown(wait=False)
+        asyncio.run(main())
+    return run
+
+def test_check_reschedules_from_sync_state(run_daemon, monkeypatch):
+    now = time.time()
+
+    async def fake_get_opus(*args, **kwargs):
+        return {"new": 2, "latest_id": 100, "new_pub_ts": [int(now) - 7200, int(now) - 3600],
+                "known_pub_ts": int(now) - 86400}
+    monkeypatch.setattr(daemon, "get_opus_async", fake_get_opus)
+
+    async def test(archive):
+        await archive.check(UID)
+        assert archive.last_result[UID]["new"] == 2 and archive.last_result[UID]["error"] is None
+        entry = archive.state[str(UID)]
+        assert entry["last_seen_id"] == 100
+        assert next_run(archive) == pytest.approx(next_check_time(entry, min_interval=600), abs=2)
+        assert not archive.running
+    run_daemon(test)
+
+def test_check_error_retries_after_min_interval(run_daemon, monkeypatch):
+    async def failing_get_opus(*args, **kwargs):
+        raise RuntimeError("boom")
+    monkeypatch.setattr(daemon, "get_opus_async", failing_get_opus)
+
+    async def test(archive):
+        start = time.time()
+        await archive.check(UID)
+        assert archive.last_result[UID]["error"] == "boom"
+        # 出错时不更新同步状态
+        assert str(UID) not in archive.state
+        assert next_run(archive) == pytest.approx(start + 600, abs=2)
+    run_daemon(test)
+
+def test_pause_and_resume(run_daemon, monkeypatch):
+    calls = []
+
+    async def fake_get_opus(*args, **kwargs):
+        calls.append(args)
+        return {"new": 0, "latest_id": 0, "new_pub_ts": [], "known_pub_ts": None}
+    monkeypatch.setattr(daemon, "get_opus_async", fake_get_opus)
+
+    async def test(archive):
+        async with TestClient(TestServer(create_control_app(archive))) as client:
+            assert (await (await client.post("/pause")).json()) == {"paused": True}
+            start = time.time()
+            await archive.check(UID)
+            assert not calls
+            assert next_run(archive) == pytest.approx(start + RELOAD_INTERVAL, abs=2)
+
+            assert (await (await client.post("/resume")).json()) == {"paused": False}
+            await archive.check(UID)
+            assert len(calls) == 1
+            assert archive.last_result[UID]["error"] is None
+
+            # 立即检查把任务提前到现在
+            assert (await client.post(f"/check/{UID}")).status == 200
+            assert next_run(archive) == pytest.approx(time.time(), abs=2)
+            assert (await client.post("/check/7")).status == 404
+    run_daemon(test)
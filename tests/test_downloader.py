@@ -0,0 +1,77 @@
+import asyncio
+import hashlib
+import os
+
+from aiohttp import web
+
+from blob_store import BlobStore
+from downloader import download_all, new_session
+
+BODY = os.urandom(256 * 1024)
+
+async def slow_image(request):
+    resp = web.StreamResponse(headers={"Content-Length": str(len(BODY))})
+    await resp.prepare(request)
+    for i in range(0, len(BODY), 32 * 1024):
+        await resp.write(BODY[i:i + 32 * 1024])
+        await asyncio.sleep(0.01)
+    return resp
+
+async def serve():
+    app = web.Application()
+    app.router.add_get('/bfs/{name}', slow_image)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+def test_same_picture_downloaded_concurrently(tmp_path):
+    async def run():
+        runner, base_url = await serve()
+        blobs = BlobStore(str(tmp_path / '__blobs'))
+        session = new_session(8)
+        try:
+            url = f"{base_url}/bfs/a.jpg"
+            queue = [{"url": url, "time_stamp": 1700000000}]
+            # 两个用户文件夹同时下载同一张图片，其中一个队列里还重复出现
+            results = await asyncio.gather(
+                download_all(queue * 2, str(tmp_path / 'user1'), session=session, blobs=blobs),
+                download_all(queue, str(tmp_path / 'user2'), session=session, blobs=blobs),
+            )
+        finally:
+            await session.close()
+            blobs.close()
+            await runner.cleanup()
+        return results
+
+    os.makedirs(tmp_path / 'user1')
+    os.makedirs(tmp_path / 'user2')
+    assert asyncio.run(run()) == [[], []]
+    expected = hashlib.sha256(BODY).hexdigest()
+    for folder in ('user1', 'user2'):
+        with open(tmp_path / folder / 'a.jpg', 'rb') as f:
+            assert hashlib.sha256(f.read()).hexdigest() == expected
+    assert not os.listdir(tmp_path / '__blobs' / 'tmp')
+
+def test_shared_picture_keeps_earliest_mtime(tmp_path):
+    async def run():
+        runner, base_url = await serve()
+        blobs = BlobStore(str(tmp_path / '__blobs'))
+        session = new_session(8)
+        try:
+            url = f"{base_url}/bfs/b.jpg"
+            # 先下载较晚发布的动态，再下载较早的，最后再下载一次较晚的
+            for folder, time_stamp in (('user1', 1800000000), ('user2', 1700000000), ('user3', 1750000000)):
+                os.makedirs(tmp_path / folder)
+                assert await download_all([{"url": url, "time_stamp": time_stamp}], str(tmp_path / folder),
+                                          session=session, blobs=blobs) == []
+        finally:
+            await session.close()
+            blobs.close()
+            await runner.cleanup()
+
+    asyncio.run(run())
+    for folder in ('user1', 'user2', 'user3'):
+        assert os.stat(tmp_path / folder / 'b.jpg').st_mtime == 1700000000
@@ -0,0 +1,38 @@
+import sqlite3
+
+from failed_ledger import FailedLedger
+
+def test_same_url_in_two_folders(tmp_path):
+    with FailedLedger(str(tmp_path / '__failed.db')) as ledger:
+        failed = [{"url": "http://x/a.jpg", "time_stamp": 1700000000, "error": "503"}]
+        ledger.record("user1", failed, now=1000)
+        ledger.record("user2", failed, now=1000)
+        assert ledger.count("user1") == 1
+        assert ledger.count("user2") == 1
+
+        entries = ledger.claim(folder=None, now=10 ** 6)
+        assert sorted(e["folder"] for e in entries) == ["user1", "user2"]
+
+        ledger.resolve("user1", ["http://x/a.jpg"])
+        assert ledger.count("user1") == 0
+        assert ledger.count("user2") == 1
+
+def test_migrates_url_primary_key(tmp_path):
+    db_path = str(tmp_path / '__failed.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        CREATE TABLE failed (
+            url TEXT PRIMARY KEY, folder TEXT NOT NULL, time_stamp INTEGER,
+            attempts INTEGER NOT NULL DEFAULT 1, last_error TEXT, first_failed REAL NOT NULL,
+            last_failed REAL NOT NULL, next_retry REAL NOT NULL, claimed_until REAL NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("INSERT INTO failed (url, folder, first_failed, last_failed, next_retry) "
+                 "VALUES ('http://x/a.jpg', 'user1', 1, 1, 1)")
+    conn.commit()
+    conn.close()
+
+    with FailedLedger(db_path) as ledger:
+        assert ledger.count("user1") == 1
+        ledger.record("user2", [{"url": "http://x/a.jpg", "time_stamp": 1}])
+        assert ledger.count() == 2
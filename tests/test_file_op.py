@@ -0,0 +1,21 @@
+import json
+
+import pytest
+
+from file_op import iter_json_array
+
+VALUES = [15000000000.0, 150000, -1.5e-7, 12, True, None, "a,]b", {"dynamic_id": 1, "item": [1.25, 2]}, [], 0]
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 4, 5, 8, 64 * 1024])
+@pytest.mark.parametrize("indent", [None, 4])
+def test_iter_json_array_chunk_boundaries(tmp_path, chunk_size, indent):
+    path = tmp_path / "array.json"
+    path.write_text(json.dumps(VALUES, indent=indent), encoding="utf-8")
+    assert list(iter_json_array(str(path), chunk_size)) == VALUES
+
+@pytest.mark.parametrize("text", ["[1, 2", "[1 2]", "{}", "[12x]"])
+def test_iter_json_array_rejects_malformed(tmp_path, text):
+    path = tmp_path / "bad.json"
+    path.write_text(text, encoding="utf-8")
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_array(str(path), 2))
@@ -0,0 +1,22 @@
+import os
+import threading
+
+from folder_index import load_folder_index, update_folders
+from info_store import open_info_store
+
+def test_concurrent_updates_are_not_lost(tmp_path):
+    save_dir = str(tmp_path)
+    names = [f"user{i}" for i in range(20)]
+    for name in names:
+        os.makedirs(os.path.join(save_dir, name))
+        with open_info_store(os.path.join(save_dir, name)) as store:
+            store.add([{"dynamic_id": 1, "pub_ts": 1700000000, "item": {"pictures": []}}])
+
+    threads = [threading.Thread(target=update_folders, args=(save_dir, [name])) for name in names]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(load_folder_index(save_dir)) == sorted(names)
+    assert not [name for name in os.listdir(save_dir) if name.endswith('.tmp')]
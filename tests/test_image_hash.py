@@ -0,0 +1,53 @@
+import random
+
+import numpy as np
+import pytest
+
+from image_hash import MultiIndexHash, find_clusters
+
+def flip(h: int, bits: list) -> int:
+    for bit in bits:
+        h ^= 1 << bit
+    return h
+
+@pytest.mark.parametrize("threshold", [0, 3, 6, 10])
+def test_multi_index_matches_brute_force(threshold):
+    rng = random.Random(threshold)
+    hashes = []
+    # 随机哈希加上若干近邻，保证各个距离都有命中
+    for _ in range(200):
+        h = rng.getrandbits(64)
+        hashes.append(h)
+        for _ in range(3):
+            hashes.append(flip(h, rng.sample(range(64), rng.randint(0, threshold + 2))))
+    index = MultiIndexHash(np.array(hashes, dtype=np.uint64), threshold)
+
+    expected = {
+        (i, j, bin(a ^ b).count("1"))
+        for i, a in enumerate(hashes) for j, b in enumerate(hashes)
+        if i < j and bin(a ^ b).count("1") <= threshold
+    }
+    assert set(index.pairs()) == expected
+
+    indices, distances = index.query(hashes[0])
+    assert sorted(zip(indices.tolist(), distances.tolist())) == sorted(
+        (j, bin(hashes[0] ^ b).count("1")) for j, b in enumerate(hashes) if bin(hashes[0] ^ b).count("1") <= threshold
+    )
+
+def test_find_clusters():
+    base = 0x0123456789abcdef
+    records = [
+        {"name": "small.jpg", "phash": base, "width": 100, "height": 100, "size": 10},
+        {"name": "large.jpg", "phash": flip(base, [0, 1]), "width": 200, "height": 200, "size": 20},
+        # 与 small 距离 3，与 large 距离 5，经由 small 连到同一簇
+        {"name": "chain.jpg", "phash": flip(base, [10, 11, 12]), "width": 100, "height": 100, "size": 5},
+        {"name": "other.jpg", "phash": ~base & (2 ** 64 - 1), "width": 100, "height": 100, "size": 10},
+        {"name": "other2.jpg", "phash": flip(~base & (2 ** 64 - 1), [63]), "width": 100, "height": 100, "size": 30},
+        {"name": "alone.jpg", "phash": 0x5555555555555555, "width": 100, "height": 100, "size": 10},
+    ]
+    assert find_clusters(records, threshold=4) == [
+        {"keep": "large.jpg", "duplicates": [{"name": "small.jpg", "distance": 2},
+                                             {"name": "chain.jpg", "distance": 5}]},
+        {"keep": "other2.jpg", "duplicates": [{"name": "other.jpg", "distance": 1}]},
+    ]
+    assert find_clusters(records[:1]) == []
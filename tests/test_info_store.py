@@ -0,0 +1,69 @@
+import json
+import os
+
+import pytest
+
+import info_store
+from info_store import INFO_DB_NAME, INFO_JSON_NAME, MIGRATING_SUFFIX, InfoStore, open_info_store
+
+def write_legacy_json(save_path, count):
+    posts = [
+        {"dynamic_id": 1000 + k, "time": "2024-01-01 00:00:00", "type": "DYNAMIC_TYPE_DRAW",
+         "item": {"title": f"t{k}", "description": "", "pictures": []}}
+        for k in range(count)
+    ]
+    with open(os.path.join(save_path, INFO_JSON_NAME), 'w', encoding='utf-8') as f:
+        json.dump(posts, f, indent=4, ensure_ascii=False)
+
+def test_migrate_from_json(tmp_path):
+    write_legacy_json(tmp_path, 2500)
+    with open_info_store(str(tmp_path)) as store:
+        assert len(store) == 2500
+        assert store.latest_id() == 3499
+    assert not os.path.exists(os.path.join(tmp_path, INFO_DB_NAME + MIGRATING_SUFFIX))
+
+def test_interrupted_migration_is_retried(tmp_path, monkeypatch):
+    write_legacy_json(tmp_path, 2500)
+    add = InfoStore.add
+    calls = []
+
+    def interrupted_add(self, posts):
+        calls.append(len(posts))
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        return add(self, posts)
+
+    monkeypatch.setattr(InfoStore, 'add', interrupted_add)
+    with pytest.raises(KeyboardInterrupt):
+        open_info_store(str(tmp_path))
+    # 中断后不应留下会被当作已迁移的 __info.db
+    assert not os.path.exists(os.path.join(tmp_path, INFO_DB_NAME))
+
+    monkeypatch.setattr(InfoStore, 'add', add)
+    with open_info_store(str(tmp_path)) as store:
+        assert len(store) == 2500
+        json_path = os.path.join(tmp_path, INFO_JSON_NAME)
+        store.export_json(json_path)
+    with open(json_path, encoding='utf-8') as f:
+        assert len(json.load(f)) == 2500
+
+def test_corrupt_json_is_kept(tmp_path):
+    write_legacy_json(tmp_path, 10)
+    json_path = os.path.join(tmp_path, INFO_JSON_NAME)
+    with open(json_path, 'r+', encoding='utf-8') as f:
+        text = f.read()
+        f.seek(0)
+        f.truncate()
+        f.write(text[:len(text) // 2])
+
+    with open_info_store(str(tmp_path)) as store:
+        count = len(store)
+        store.export_json(json_path)
+    assert count < 10
+    # 原文件改名保留，导出不会覆盖未迁移的数据
+    with open(json_path + '.bak', encoding='utf-8') as f:
+        assert f.read() == text[:len(text) // 2]
+
+def test_post_pub_ts():
+    assert info_store.post_pub_ts({"pub_ts": "1700000000"}) == 1700000000
+    assert info_store.post_pub_ts({"time": "bad"}) is None
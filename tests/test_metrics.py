@@ -0,0 +1,80 @@
+import urllib.request
+
+import pytest
+
+import metrics as metrics_module
+from metrics import Histogram, Metrics, serve_metrics
+
+@pytest.mark.parametrize("values, q, expected", [
+    ([], 0.5, 0.0),
+    ([0.5, 1.5, 1.8, 4], 0.5, 2),
+    ([0.5, 1.5, 1.8, 4], 0.25, 1),    # 取第一个累计数量达到 q 的桶的上限
+    ([0.5, 1.5, 1.8, 4], 0.75, 2),
+    ([0.5, 1.5, 1.8, 4], 1.0, 4),     # 桶上限 5 超过最大值时返回最大值
+    ([0.5, 7, 9], 0.99, 9),           # 落在溢出桶时返回最大值
+    ([0.2, 0.3], 0.5, 0.3),           # 桶上限超过最大值时按最大值截断
+])
+def test_histogram_quantile(values, q, expected):
+    h = Histogram(buckets=(1, 2, 5))
+    for value in values:
+        h.observe(value)
+    assert h.quantile(q) == pytest.approx(expected)
+
+def test_histogram_bucket_edges():
+    h = Histogram(buckets=(1, 2, 5))
+    for value in (1, 2, 5, 6):
+        h.observe(value)
+    # 等于上限的值落在该桶
+    assert h.counts == [1, 1, 1, 1]
+    assert h.summary() == {"count": 4, "sum": 14, "avg": 3.5, "p50": 2, "p90": 6, "p99": 6, "max": 6}
+
+def test_prometheus_output():
+    m = Metrics()
+    m.inc("downloads_ok")
+    m.inc("download_bytes", 2048)
+    for value in (0.004, 0.02, 0.02, 100, 400):
+        m.observe("api_request_seconds", value)
+    lines = m.prometheus().splitlines()
+    assert lines[:4] == [
+        "# TYPE bili_download_bytes counter",
+        "bili_download_bytes 2048",
+        "# TYPE bili_downloads_ok counter",
+        "bili_downloads_ok 1",
+    ]
+    assert lines[4] == "# TYPE bili_api_request_seconds histogram"
+    assert 'bili_api_request_seconds_bucket{le="0.005"} 1' in lines
+    assert 'bili_api_request_seconds_bucket{le="0.025"} 3' in lines
+    assert 'bili_api_request_seconds_bucket{le="300"} 4' in lines
+    assert lines[-3:] == [
+        'bili_api_request_seconds_bucket{le="+Inf"} 5',
+        "bili_api_request_seconds_sum 500.044",
+        "bili_api_request_seconds_count 5",
+    ]
+    # 桶计数单调不减
+    counts = [int(line.rsplit(" ", 1)[1]) for line in lines if "_bucket" in line]
+    assert counts == sorted(counts)
+
+def test_snapshot_and_reset():
+    m = Metrics()
+    m.inc("download_bytes", 1000)
+    m.observe("download_seconds", 2)
+    snapshot = m.snapshot()
+    assert snapshot["counters"] == {"download_bytes": 1000}
+    assert snapshot["throughput"]["per_download_bytes_per_sec"] == 500
+    m.reset()
+    assert m.snapshot()["counters"] == {} and m.prometheus() == "\n"
+
+def test_serve_metrics(monkeypatch):
+    m = Metrics()
+    m.inc("api_requests", 3)
+    monkeypatch.setattr(metrics_module, "metrics", m)
+    server = serve_metrics(0)
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(base + "/metrics") as resp:
+            assert resp.headers["Content-Type"].startswith("text/plain")
+            assert "bili_api_requests 3" in resp.read().decode("utf-8")
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(base + "/other")
+    finally:
+        server.shutdown()
@@ -0,0 +1,19 @@
+import page_cache
+from page_cache import PageCache
+
+def page(ids: list, text: str = "") -> dict:
+    return {"has_more": 1, "offset": str(ids[-1]), "items": [{"id_str": str(i), "text": text} for i in ids]}
+
+def test_pinned_first_page_is_merged(tmp_path, monkeypatch):
+    monkeypatch.setattr(page_cache, "zstandard", None)
+    cache = PageCache(str(tmp_path))
+    # 第一次爬取：置顶动态 1 + 17、16，第二页 15..11
+    cache.put(7, "", page([1, 17, 16]))
+    cache.put(7, "16", page([15, 14, 13, 12, 11]))
+    # 之后的增量爬取：第一页同样以置顶动态开头
+    cache.put(7, "", page([1, 22, 21, 20, 19, 18], text="new"))
+    items = cache.iter_items(7)
+    assert [int(item["id_str"]) for item in items] == [22, 21, 20, 19, 18, 17, 16, 15, 14, 13, 12, 11, 1]
+    # 同一条动态以最后获取的为准
+    assert next(item for item in items if item["id_str"] == "1")["text"] == "new"
+    assert cache.stats()["files"] == 2
@@ -0,0 +1,57 @@
+import pytest
+
+from parsers import parse_item
+
+def dynamic(dynamic_id: str, dynamic_type: str, pub_ts: int, major: dict|None = None,
+            text: str|None = None, orig: dict|None = None) -> dict:
+    item = {
+        "id_str": dynamic_id,
+        "type": dynamic_type,
+        "modules": {
+            "module_author": {"pub_ts": pub_ts},
+            "module_dynamic": {"major": major, "desc": {"text": text} if text else None},
+        },
+    }
+    if orig is not None:
+        item["orig"] = orig
+    return item
+
+OPUS = dynamic("100", "DYNAMIC_TYPE_DRAW", 1700000000, major={"opus": {
+    "title": "标题",
+    "summary": {"text": "正文"},
+    "pics": [{"url": "//i0.hdslb.com/a.jpg"}, {"url": "https://i0.hdslb.com/b.jpg"}],
+}})
+
+LEGACY_DRAW = dynamic("101", "DYNAMIC_TYPE_DRAW", 1600000000, text="旧版正文", major={"draw": {
+    "items": [{"src": "https://i0.hdslb.com/c.jpg"}, {"src": "https://i0.hdslb.com/c.jpg"}],
+}})
+
+FORWARD = dynamic("102", "DYNAMIC_TYPE_FORWARD", 1710000000, text="转发语", orig=OPUS)
+
+FORWARD_DELETED = dynamic("103", "DYNAMIC_TYPE_FORWARD", 1720000000, text="转发语",
+                          orig={"id_str": "0", "type": "DYNAMIC_TYPE_NONE"})
+
+CASES = [
+    # (动态, 标题, 正文, 图片, 原动态ID, 下载任务的时间戳)
+    (OPUS, "标题", "正文", ["https://i0.hdslb.com/a.jpg", "https://i0.hdslb.com/b.jpg"], None, 1700000000),
+    (LEGACY_DRAW, None, "旧版正文", ["https://i0.hdslb.com/c.jpg"] * 2, None, 1600000000),
+    (FORWARD, None, "转发语", ["https://i0.hdslb.com/a.jpg", "https://i0.hdslb.com/b.jpg"], 100, 1700000000),
+    (FORWARD_DELETED, None, "转发语", [], None, 1720000000),
+]
+
+@pytest.mark.parametrize("item, title, description, pictures, orig_id, time_stamp", CASES,
+                         ids=["opus", "legacy_draw", "forward", "forward_deleted_orig"])
+def test_parse_item(item, title, description, pictures, orig_id, time_stamp):
+    record, downloads = parse_item(item)
+    assert record["dynamic_id"] == int(item["id_str"])
+    assert record["pub_ts"] == item["modules"]["module_author"]["pub_ts"]
+    assert record["item"]["title"] == title
+    assert record["item"]["description"] == description
+    assert record["item"]["pictures"] == pictures
+    orig = record["item"].get("orig")
+    assert (orig["dynamic_id"] if orig else None) == orig_id
+    # 重复的图片只下载一次，转发动态使用原动态的发布时间
+    assert downloads == [{"url": url, "time_stamp": time_stamp} for url in dict.fromkeys(pictures)]
+
+def test_parse_deleted_item():
+    assert parse_item({"id_str": "0", "type": "DYNAMIC_TYPE_NONE"}) == (None, [])
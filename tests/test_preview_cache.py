@@ -0,0 +1,89 @@
+import importlib.util
+import json
+import os
+
+import pytest
+
+pytest.importorskip("flask")
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "opus", "__a_preview_app.py")
+
+def load_app():
+    spec = importlib.util.spec_from_file_location("preview_app", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def test_cyclic_scan_hits_cache_with_many_folders(tmp_path, monkeypatch):
+    app = load_app()
+    monkeypatch.chdir(tmp_path)
+    folders = [f"user{i}" for i in range(300)]
+    for i, folder in enumerate(folders):
+        os.mkdir(folder)
+        with open(os.path.join(folder, "__info.json"), "w", encoding="utf-8") as f:
+            json.dump([{"dynamic_id": i + 1, "time": "2024-01-01 00:00:00",
+                        "item": {"title": "", "description": "text", "pictures": []}}], f)
+
+    loads = []
+    load_posts = app.load_posts
+    monkeypatch.setattr(app, "load_posts", lambda folder: loads.append(folder) or load_posts(folder))
+    cache = app.MetaCache()
+    for _ in range(2):
+        for folder in folders:
+            assert len(cache.get(folder)) == 1
+    # 第二轮全部命中缓存
+    assert len(loads) == len(folders)
+
+    # 超过条数上限时淘汰最久未使用的文件夹
+    small = app.MetaCache(max_posts=10)
+    for folder in folders[:20]:
+        small.get(folder)
+    assert small.posts == 10
+    assert not small.contains(folders[0]) and small.contains(folders[19])
+
+def test_search_falls_back_for_unindexed_folders(tmp_path, monkeypatch):
+    from search_index import SEARCH_DB_NAME, SearchIndex
+
+    app = load_app()
+    monkeypatch.chdir(tmp_path)
+    for folder, title in (("old", "旧的风景"), ("new", "新的风景")):
+        os.mkdir(folder)
+        with open(os.path.join(folder, "__info.json"), "w", encoding="utf-8") as f:
+            json.dump([{"dynamic_id": 1, "time": "2024-01-01 00:00:00",
+                        "item": {"title": title, "description": "", "pictures": []}}], f, ensure_ascii=False)
+    client = app.app.test_client()
+    assert "共 2 条" in client.get("/search?q=风景").get_data(as_text=True)
+
+    # 只有 new 建立了完整索引，old 的历史动态仍能搜到且不重复
+    with SearchIndex(SEARCH_DB_NAME) as index:
+        index.add("new", [{"dynamic_id": 1, "pub_ts": 1704038400,
+                           "item": {"title": "新的风景", "description": "", "pictures": []}}])
+        index.mark_indexed("new")
+        index.add("old", [{"dynamic_id": 2, "pub_ts": 1704038400,
+                           "item": {"title": "旧的风景 新页", "description": "", "pictures": []}}])
+    html = client.get("/search?q=风景").get_data(as_text=True)
+    assert "共 2 条" in html
+    assert "旧的风景" in html and "新的风景" in html
+
+def test_feed_page_skips_pages_hidden_by_dedup(tmp_path, monkeypatch):
+    from image_hash import DUP_REPORT_NAME
+    from info_store import InfoStore
+
+    app = load_app()
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("user")
+    with InfoStore(os.path.join("user", "__info.db")) as store:
+        store.add([{"dynamic_id": i, "time": "2024-01-01 00:00:00",
+                    "item": {"title": "", "description": "", "pictures": [f"https://i0.hdslb.com/{i}.jpg"]}}
+                   for i in range(1, 8)])
+    # 7..3 的图片都是重复图片
+    with open(os.path.join("user", DUP_REPORT_NAME), "w", encoding="utf-8") as f:
+        json.dump({"clusters": [{"keep": "1.jpg", "duplicates": [{"name": f"{i}.jpg"} for i in range(3, 8)]}]}, f)
+
+    posts, cursor = app.feed_page("user", limit=2, dedup=True)
+    assert [post["dynamic_id"] for post in posts] == [2]
+    assert cursor == 2
+    posts, cursor = app.feed_page("user", cursor, limit=2, dedup=True)
+    assert [post["dynamic_id"] for post in posts] == [1] and cursor is None
+    # 不去重时照常分页
+    assert [post["dynamic_id"] for post in app.feed_page("user", limit=2)[0]] == [7, 6]
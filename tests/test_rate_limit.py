@@ -0,0 +1,13 @@
+from rate_limit import MAX_RATE, AdaptiveRateLimiter, interval_to_rate
+
+def test_zero_interval_uses_max_rate():
+    assert interval_to_rate(0) == MAX_RATE
+    assert interval_to_rate(0.5) == 2
+    assert AdaptiveRateLimiter(rate=interval_to_rate(0)).rate == MAX_RATE
+
+def test_max_rate_defaults_to_initial_rate():
+    limiter = AdaptiveRateLimiter(rate=0.5, increase=0.1)
+    for _ in range(10):
+        limiter.on_success()
+    assert limiter.rate == 0.5
+    assert AdaptiveRateLimiter(rate=0.5, max_rate=2).max_rate == 2
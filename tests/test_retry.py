@@ -0,0 +1,40 @@
+import asyncio
+import time
+
+import pytest
+
+from retry import MAX_RETRY_AFTER, CircuitBreaker, CircuitOpenError, retry_after
+
+class FakeError(Exception):
+    def __init__(self, headers):
+        self.headers = headers
+
+def test_retry_after_is_clamped():
+    assert retry_after(FakeError({"Retry-After": "5"})) == 5
+    assert retry_after(FakeError({"Retry-After": "86400"})) == MAX_RETRY_AFTER
+    assert retry_after(FakeError({"Retry-After": "-1"})) == 0
+    assert retry_after(FakeError({})) is None
+
+def test_dead_breaker_recovers_after_cooldown():
+    breaker = CircuitBreaker(threshold=1, cooldown=0, max_cooldown=0, max_trips=2, dead_cooldown=60)
+
+    async def run():
+        breaker.on_failure()
+        probe = await breaker.before_request()
+        assert probe
+        breaker.on_failure(probe)
+        assert breaker.state == 'dead'
+        with pytest.raises(CircuitOpenError):
+            await breaker.before_request()
+
+        # dead_cooldown 过后放行一个试探请求，成功即恢复
+        breaker.open_until = time.monotonic() - 1
+        probe = await breaker.before_request()
+        assert probe
+        with pytest.raises(CircuitOpenError):
+            await breaker.before_request()
+        breaker.on_success(probe)
+        assert breaker.state == 'closed'
+        assert not await breaker.before_request()
+
+    asyncio.run(run())
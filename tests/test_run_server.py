@@ -0,0 +1,69 @@
+import gzip
+import os
+import sys
+
+import pytest
+
+flask = pytest.importorskip("flask")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "opus"))
+from run_server import GZIP_MIN_SIZE, configure
+
+BIG = "<p>风景</p>" * GZIP_MIN_SIZE
+
+@pytest.fixture
+def client():
+    app = flask.Flask(__name__)
+
+    @app.route('/big', methods=['GET', 'POST'])
+    def big():
+        return BIG
+
+    @app.route('/small')
+    def small():
+        return "ok"
+
+    @app.route('/json')
+    def json_page():
+        return flask.jsonify({"text": BIG})
+
+    @app.route('/image')
+    def image():
+        return flask.Response(b"\xff" * 4096, mimetype='image/jpeg')
+
+    configure(app)
+    # 重复配置不会重复注册
+    configure(app)
+    return app.test_client()
+
+def test_gzip_negotiation(client):
+    resp = client.get('/big', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in resp.headers['Vary']
+    assert gzip.decompress(resp.data).decode('utf-8') == BIG
+
+    resp = client.get('/big')
+    assert 'Content-Encoding' not in resp.headers
+    assert resp.get_data(as_text=True) == BIG
+
+    assert 'Content-Encoding' not in client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers
+    assert client.get('/json', headers={'Accept-Encoding': 'gzip'}).headers['Content-Encoding'] == 'gzip'
+    # 图片与非 GET 请求不处理
+    resp = client.get('/image', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in resp.headers and 'ETag' not in resp.headers
+    assert 'Content-Encoding' not in client.post('/big', headers={'Accept-Encoding': 'gzip'}).headers
+
+def test_etag_and_304(client):
+    resp = client.get('/big', headers={'Accept-Encoding': 'gzip'})
+    etag = resp.headers['ETag']
+    assert resp.headers['Cache-Control'] == 'no-cache'
+
+    resp = client.get('/big', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert resp.data == b''
+
+    # 压缩与未压缩的表示 ETag 不同
+    plain = client.get('/big')
+    assert plain.headers['ETag'] != etag
+    assert client.get('/big', headers={'If-None-Match': etag}).status_code == 200
+    assert client.get('/big', headers={'If-None-Match': plain.headers['ETag']}).status_code == 304
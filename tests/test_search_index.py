@@ -0,0 +1,57 @@
+import json
+import os
+
+import pytest
+
+from info_store import INFO_JSON_NAME, open_info_store
+from search_index import SearchIndex, build_match_query, open_search_index, tokenize
+
+def post(dynamic_id: int, title: str, description: str = "", pub_ts: int = 1700000000) -> dict:
+    return {"dynamic_id": dynamic_id, "time": "2023-11-14 22:13:20", "pub_ts": pub_ts,
+            "type": "DYNAMIC_TYPE_DRAW", "item": {"title": title, "description": description, "pictures": []}}
+
+@pytest.mark.parametrize("text, tokens", [
+    ("风景照", ["风景", "景照", "照"]),
+    ("Hello 风景 2024", ["hello", "风景", "景", "2024"]),
+    ("猫", ["猫"]),
+    ("", []),
+    (None, []),
+])
+def test_tokenize(text, tokens):
+    assert tokenize(text) == tokens
+
+@pytest.mark.parametrize("query, match", [
+    ("风景照", '"风景 景照"'),
+    ("猫", '"猫"*'),
+    ("Cos 风景", '"cos"* AND "风景"'),
+    ("!!!", None),
+])
+def test_build_match_query(query, match):
+    assert build_match_query(query) == match
+
+def test_search(tmp_path):
+    with SearchIndex(str(tmp_path / "search.db")) as index:
+        index.add("a", [post(1, "山间风景", pub_ts=100), post(2, "城市夜景", pub_ts=200)])
+        index.add("b", [post(3, "海边风景", pub_ts=300)])
+        # 同一条动态再次写入时覆盖
+        index.add("b", [post(3, "海边日落", pub_ts=300)])
+
+        total, hits = index.search("风景")
+        assert total == 1 and hits[0]["post"]["dynamic_id"] == 1
+        assert index.search("景", folder="a")[0] == 2
+        assert [hit["post"]["dynamic_id"] for hit in index.search("景", since=150)[1]] == [2]
+        assert [hit["post"]["dynamic_id"] for hit in index.search("景", until=150)[1]] == [1]
+        assert index.search("") == (0, [])
+
+def test_ensure_folder_backfills_once(tmp_path):
+    save_path = tmp_path / "user"
+    save_path.mkdir()
+    with open(save_path / INFO_JSON_NAME, "w", encoding="utf-8") as f:
+        json.dump([post(1, "旧的风景"), post(2, "旧的日常")], f, ensure_ascii=False)
+    with open_search_index(str(tmp_path)) as index, open_info_store(str(save_path)) as store:
+        index.add("user", [post(3, "新的风景")])
+        assert index.search("风景", indexed_only=True)[0] == 0
+        assert index.ensure_folder("user", store) == 2
+        assert index.ensure_folder("user", store) == 0
+        assert index.indexed_folders() == {"user"}
+        assert index.search("风景", indexed_only=True)[0] == 2
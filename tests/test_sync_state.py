@@ -0,0 +1,19 @@
+from sync_state import poll_interval, record_check
+
+def test_seed_last_post_ts_from_store():
+    state = {}
+    # 迁移来的用户：没有新动态，以已保存动态的最新发布时间为起点
+    entry = record_check(state, 1, "user", 100, [], now=1_000_000, known_pub_ts=900_000)
+    assert entry["last_post_ts"] == 900_000
+    assert "last_new" not in entry
+    assert poll_interval(entry, now=1_000_000, min_interval=0) == 100_000 * 0.25
+
+    # 下一次检查有新动态时即可得到发帖间隔
+    entry = record_check(state, 1, "user", 101, [960_000], now=1_100_000, known_pub_ts=900_000)
+    assert entry["last_post_ts"] == 960_000
+    assert entry["avg_post_interval"] == 60_000
+
+def test_known_pub_ts_does_not_override_state():
+    state = {"1": {"uname": "user", "checks": 3, "last_post_ts": 950_000}}
+    entry = record_check(state, 1, "user", 100, [], now=1_000_000, known_pub_ts=900_000)
+    assert entry["last_post_ts"] == 950_000
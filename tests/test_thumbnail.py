@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+pytest.importorskip("PIL")
+from PIL import Image
+
+from thumbnail import ensure_thumbnail, thumb_path
+
+def test_same_name_in_different_folders(tmp_path):
+    thumb_root = str(tmp_path / "__thumbs")
+    paths = []
+    for folder, color in (("a", "red"), ("b", "blue")):
+        os.mkdir(tmp_path / folder)
+        path = str(tmp_path / folder / "1725138184987.jpg")
+        Image.new("RGB", (64, 48 if color == "red" else 32), color).save(path)
+        paths.append(path)
+    thumbs = [ensure_thumbnail(path, thumb_root, "s") for path in paths]
+    assert thumbs[0] != thumbs[1]
+    with Image.open(thumbs[0]) as a, Image.open(thumbs[1]) as b:
+        assert a.getpixel((0, 0))[0] > 200 and b.getpixel((0, 0))[2] > 200
+
+def test_hardlinked_images_share_thumbnail(tmp_path):
+    # 共享图片仓库中的同一张图片硬链接到多个用户文件夹
+    for folder in ("a", "b"):
+        os.mkdir(tmp_path / folder)
+    Image.new("RGB", (8, 8)).save(tmp_path / "a" / "x.jpg")
+    os.link(tmp_path / "a" / "x.jpg", tmp_path / "b" / "x.jpg")
+    assert thumb_path("t", str(tmp_path / "a" / "x.jpg"), "s") == thumb_path("t", str(tmp_path / "b" / "x.jpg"), "s")
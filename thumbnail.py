@@ -0,0 +1,123 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+
+THUMB_DIR_NAME = '__thumbs'
+
+# 缩略图尺寸：s 用于首页预览，m 用于动态流
+THUMB_SIZES = {
+    's': 240,
+    'm': 720,
+}
+
+THUMB_QUALITY = 80
+
+# 缩略图缓存的容量上限（字节），超出后按最近访问时间淘汰
+THUMB_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')
+
+def thumb_path(thumb_root: str, src_path: str, size: str) -> str:
+    """
+    缩略图路径，由原图的文件名、大小与修改时间组成。
+    并非所有文件名都是内容哈希（如 1725138184987.jpg），不同文件夹中的同名图片各自生成缩略图；
+    共享图片仓库中硬链接到同一文件的图片大小与修改时间相同，仍共用一张缩略图。
+    原图不存在时抛出 OSError。
+    """
+    st = os.stat(src_path)
+    stem = os.path.splitext(os.path.basename(src_path))[0]
+    return os.path.join(thumb_root, size, f"{stem}_{st.st_size:x}_{st.st_mtime_ns:x}.webp")
+
+def make_thumbnail(src_path: str, dest_path: str, size: str) -> str:
+    """生成 WebP 缩略图，先写临时文件再替换，返回 dest_path"""
+    max_side = THUMB_SIZES[size]
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    with Image.open(src_path) as img:
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_side, max_side))
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+        tmp_path = dest_path + '.tmp'
+        img.save(tmp_path, 'WEBP', quality=THUMB_QUALITY, method=4)
+    os.replace(tmp_path, dest_path)
+    return dest_path
+
+def ensure_thumbnail(src_path: str, thumb_root: str, size: str) -> str:
+    """缩略图不存在时生成，返回缩略图路径"""
+    dest_path = thumb_path(thumb_root, src_path, size)
+    if not os.path.isfile(dest_path):
+        make_thumbnail(src_path, dest_path, size)
+    return dest_path
+
+def _ensure_all_sizes(args: tuple) -> int:
+    src_path, thumb_root = args
+    count = 0
+    for size in THUMB_SIZES:
+        try:
+            ensure_thumbnail(src_path, thumb_root, size)
+            count += 1
+        except Exception as e:
+            print(f"生成缩略图失败 {src_path}：{e}")
+    return count
+
+def generate_thumbnails(src_paths: list, thumb_root: str, workers: int|None = None) -> int:
+    """
+    用进程池为一批图片生成所有尺寸的缩略图
+
+    :param workers: 进程数，默认为 CPU 核数
+    :return: 生成（或已存在）的缩略图数量
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(_ensure_all_sizes, ((p, thumb_root) for p in src_paths), chunksize=16))
+
+def evict(thumb_root: str, max_bytes: int = THUMB_CACHE_MAX_BYTES) -> int:
+    """
+    缓存超过 max_bytes 时，按最近访问时间从旧到新删除缩略图
+
+    :return: 删除的文件数
+    """
+    entries = []
+    total = 0
+    for dir_path, _, file_names in os.walk(thumb_root):
+        for name in file_names:
+            path = os.path.join(dir_path, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((max(st.st_atime, st.st_mtime), st.st_size, path))
+            total += st.st_size
+
+    removed = 0
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+def generate_all(save_dir: str = "./opus", workers: int|None = None):
+    """为 save_dir 下所有用户文件夹的图片预先生成缩略图"""
+    thumb_root = os.path.join(save_dir, THUMB_DIR_NAME)
+    src_paths = [
+        os.path.join(save_dir, name, file_name)
+        for name in os.listdir(save_dir)
+        if not name.startswith('__') and os.path.isdir(os.path.join(save_dir, name))
+        for file_name in os.listdir(os.path.join(save_dir, name))
+        if file_name.lower().endswith(IMAGE_EXTS)
+    ]
+    count = generate_thumbnails(src_paths, thumb_root, workers)
+    print(f"共 {len(src_paths)} 张图片，{count} 张缩略图")
+    removed = evict(thumb_root)
+    if removed:
+        print(f"缓存超出上限，淘汰 {removed} 张缩略图")
+
+if __name__ == '__main__':
+    generate_all(sys.argv[1] if len(sys.argv) > 1 else "./opus")